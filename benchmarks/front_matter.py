@@ -0,0 +1,95 @@
+"""
+Usage: python benchmarks/front_matter.py [TASK-COUNT [DEPENDENCY-RATE]]
+
+Measures how many task blocks are parsed per second, both for the front matter
+of each block on its own (parser.parse_task, given the lines of the block) and
+for a whole task file on disk (parser.parse_file_contents, which also scans the
+file for blocks). Defaults to 100000 tasks, half of which have dependencies.
+Run it on two commits to compare them.
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+from task_burrito import parser, utils
+
+import generate
+
+# How many times each measurement is taken, keeping the fastest
+ROUNDS = 5
+
+
+def front_matter_lines(text: str) -> list:
+    """
+    Gets the lines of a generated block after its opening delimiter, up to and
+    including its closing delimiter, the same as the parser passes them to
+    parse_task.
+    """
+    lines = text.split("\n")
+    return lines[1 : lines.index("***", 1) + 1]
+
+
+def best_time(run) -> float:
+    """
+    Returns the fastest time taken by the function over several rounds.
+    """
+    times = []
+    for _ in range(ROUNDS):
+        # Each round starts without any task IDs parsed, like a new run would
+        # (older commits don't cache them at all)
+        clear = getattr(utils.parse_task_id, "cache_clear", None)
+        if clear is not None:
+            clear()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    """
+    Parses the same generated blocks both ways and reports the rates.
+    """
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+
+    try:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+        if count < 1:
+            raise ValueError("TASK-COUNT must be at least 1")
+        dependency_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    blocks = generate.generate_task_blocks(count, dependency_rate=dependency_rate)
+    block_lines = [front_matter_lines(text) for (_, text) in blocks]
+    logger = utils.Logger(io.StringIO(), io.StringIO())
+
+    def parse_blocks():
+        for lines in block_lines:
+            parser.parse_task(iter(lines), logger, utils.FilePosition("<generated>"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tasks.md")
+        with open(path, "w") as fobj:
+            fobj.write("\n".join(text for (_, text) in blocks))
+
+        def parse_whole_file():
+            with open(path) as fobj:
+                parser.parse_file_contents(fobj, logger)
+
+        front_matter = best_time(parse_blocks)
+        whole_file = best_time(parse_whole_file)
+
+    print("Blocks:      {}".format(count))
+    print("Front matter: {:10.0f} blocks/s".format(count / front_matter))
+    print("Whole file:   {:10.0f} blocks/s".format(count / whole_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Generates deterministic synthetic task files for the benchmarks.
+"""
+from collections import deque
+import datetime
+import os
+import random
+from typing import List, Optional, Tuple
+
+WORDS = ["alpha", "beta", "gamma", "delta", "timeout", "settings", "deploy", "docs"]
+STATUSES = ["DONE", "IN-PROGRESS", "BLOCKED", "TODO"]
+
+
+def generate_task_ids(
+    task_count: int, fanout: int = 5, depth: Optional[int] = None
+) -> List[Tuple[int]]:
+    """
+    Builds the IDs of a task tree breadth-first, where each task has up to
+    fanout children. Once every task has reached the maximum depth, another
+    group of top-level tasks is started.
+    """
+    task_ids = []
+    pending = deque()
+    next_top = 1
+    while len(task_ids) < task_count:
+        if pending:
+            parent = pending.popleft()
+            children = [parent + (index + 1,) for index in range(fanout)]
+        else:
+            children = [(next_top + index,) for index in range(fanout)]
+            next_top += fanout
+
+        for task_id in children[: task_count - len(task_ids)]:
+            task_ids.append(task_id)
+            if depth is None or len(task_id) < depth:
+                pending.append(task_id)
+
+    return task_ids
+
+
+def generate_task_blocks(
+    task_count: int,
+    fanout: int = 5,
+    seed: int = 0,
+    depth: Optional[int] = None,
+    dependency_rate: float = 0.0,
+    note_words: int = 40,
+    deadline_days: int = 365,
+) -> List[Tuple[Tuple[int], str]]:
+    """
+    Builds the ID and text of each task block in a generated task file. See
+    generate_task_file for the meaning of the options.
+    """
+    rng = random.Random(seed)
+    start = datetime.date(2020, 1, 1)
+    blocks = []
+    for (index, task_id) in enumerate(generate_task_ids(task_count, fanout, depth)):
+        lines = [
+            "***",
+            "task {}".format(".".join(map(str, task_id))),
+            "label Task {}".format(index),
+            "status {}".format(rng.choice(STATUSES)),
+        ]
+        if rng.random() < 0.3:
+            lines.append("priority {}".format(rng.randint(1, 5)))
+        if rng.random() < 0.3:
+            deadline = start + datetime.timedelta(days=rng.randint(0, deadline_days))
+            lines.append("deadline {}".format(deadline.isoformat()))
+        if dependency_rate > 0 and index > 0 and rng.random() < dependency_rate:
+            # Only depending on earlier tasks keeps the dependencies acyclic
+            depends = rng.sample(blocks, min(len(blocks), rng.randint(1, 3)))
+            lines.append(
+                "depends {}".format(
+                    " ".join(".".join(map(str, dep)) for (dep, _) in depends)
+                )
+            )
+        lines.append("***")
+
+        words = " ".join(
+            rng.choice(WORDS)
+            for _ in range(rng.randint(min(5, note_words), note_words))
+        )
+        lines.append("Notes for *task {}*.\n\n- {}\n".format(index, words))
+        blocks.append((task_id, "\n".join(lines)))
+
+    return blocks
+
+
+def generate_task_file(
+    task_count: int, fanout: int = 5, seed: int = 0, **options
+) -> str:
+    """
+    Builds the text of a task file with the given number of tasks, arranged in
+    a tree where each task has up to fanout children. The other options are:
+
+    - depth: The maximum depth of the tree, which is unlimited by default.
+    - dependency_rate: The fraction of tasks which depend on other tasks.
+    - note_words: The maximum number of words in each task's notes.
+    - deadline_days: How many days the deadlines are spread over.
+    """
+    blocks = generate_task_blocks(task_count, fanout, seed, **options)
+    return "\n".join(text for (_, text) in blocks)
+
+
+def write_task_files(
+    directory: str,
+    task_count: int,
+    include_fanout: int = 0,
+    fanout: int = 5,
+    seed: int = 0,
+    **options
+) -> str:
+    """
+    Writes a generated task file into the directory and returns its path. If
+    include_fanout is given, the top-level tasks are split across that many
+    files, which are all included by the returned file.
+    """
+    blocks = generate_task_blocks(task_count, fanout, seed, **options)
+    main_path = os.path.join(directory, "tasks.md")
+    if include_fanout <= 0:
+        with open(main_path, "w") as fobj:
+            fobj.write("\n".join(text for (_, text) in blocks))
+
+        return main_path
+
+    parts = [[] for _ in range(include_fanout)]
+    for (task_id, text) in blocks:
+        parts[(task_id[0] - 1) % include_fanout].append(text)
+
+    names = []
+    for (index, part) in enumerate(parts):
+        name = "part-{}.md".format(index + 1)
+        names.append(name)
+        with open(os.path.join(directory, name), "w") as fobj:
+            fobj.write("\n".join(part))
+
+    with open(main_path, "w") as fobj:
+        fobj.write("***\n")
+        for name in names:
+            fobj.write("include {}\n".format(name))
+        fobj.write("***\n")
+
+    return main_path
@@ -0,0 +1,98 @@
+"""
+Usage: python benchmarks/html_throughput.py [TASK-COUNT]
+
+Measures how quickly the full HTML report is generated, in MB/s of output,
+when fragments are batched into large chunks compared to writing each fragment
+to the output as soon as it is produced. Notes are rendered once up front so
+that Markdown conversion doesn't dominate the timings. Defaults to 10000 tasks.
+"""
+import io
+import os
+import sys
+import time
+
+from task_burrito import cache, exporter, parser, utils, writer
+
+import generate
+
+
+def export_report(task_map, output, renderer) -> int:
+    """
+    Writes the full report to the output and returns the number of characters
+    it contained.
+    """
+    config = exporter.ExportConfig()
+    config.include_toc = True
+    config.include_calendar = True
+    counter = CountingStream(output)
+    exporter.export_html_report(task_map, counter, config, renderer)
+    return counter.count
+
+
+class CountingStream:
+    """
+    Passes writes through to another stream, counting how much was written.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.count = 0
+
+    def write(self, text: str):
+        self.count += len(text)
+        self.output.write(text)
+
+
+def main():
+    """
+    Exports the same report with different chunk sizes and reports the
+    throughput of each.
+    """
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+
+    try:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+        if count < 1:
+            raise ValueError("TASK-COUNT must be at least 1")
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    fobj = io.StringIO(generate.generate_task_file(count))
+    fobj.name = "<generated>"
+
+    logger = utils.Logger(io.StringIO(), io.StringIO())
+    tasks = parser.parse_file(fobj, os.getcwd(), logger)
+    task_map = utils.verify_task_tree(tasks)
+    utils.resolve_task_defaults(task_map)
+
+    renderer = exporter.NoteRenderer(fragments=cache.FragmentCache())
+    expected = io.StringIO()
+    export_report(task_map, expected, renderer)
+
+    print("tasks: {}".format(count))
+    with open(os.devnull, "w") as devnull:
+        for (name, chunk_size) in [
+            ("per fragment", 1),
+            ("4 KiB chunks", 4 * 1024),
+            ("64 KiB chunks", writer.DEFAULT_CHUNK_SIZE),
+        ]:
+            writer.DEFAULT_CHUNK_SIZE = chunk_size
+            check = io.StringIO()
+            export_report(task_map, check, renderer)
+            assert check.getvalue() == expected.getvalue()
+
+            start = time.perf_counter()
+            size = export_report(task_map, devnull, renderer)
+            elapsed = time.perf_counter() - start
+            print(
+                "{:>14}: {:.1f} MB/s ({:.1f} MB in {:.3f}s)".format(
+                    name, size / elapsed / 1e6, size / 1e6, elapsed
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
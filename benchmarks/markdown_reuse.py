@@ -0,0 +1,82 @@
+"""
+Usage: python benchmarks/markdown_reuse.py [TASK-COUNT [EXTENSION,...]]
+
+Compares the per-task cost of converting notes with a new converter for every
+task (markdown.markdown) against reusing one converter that is reset between
+tasks (exporter.NoteRenderer). Defaults to 10000 tasks and no extensions.
+"""
+import random
+import sys
+import time
+
+import markdown
+from task_burrito import exporter
+
+WORDS = ["alpha", "beta", "gamma", "delta", "timeout", "settings", "deploy", "docs"]
+
+
+def generate_notes(count: int) -> list:
+    """
+    Builds a deterministic list of Markdown notes, one for each task.
+    """
+    rng = random.Random(count)
+    notes = []
+    for index in range(count):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        notes.append(
+            "Task {} *notes* with a [link](#{}).\n\n- {}\n- {}\n".format(
+                index, index, words, words[::-1]
+            )
+        )
+
+    return notes
+
+
+def time_per_task(convert, notes: list) -> float:
+    """
+    Returns the average number of microseconds taken to convert each note.
+    """
+    start = time.perf_counter()
+    for note in notes:
+        convert(note)
+
+    return (time.perf_counter() - start) / len(notes) * 1e6
+
+
+def main():
+    """
+    Runs both conversions over the same notes and reports their costs.
+    """
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+
+    try:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+        if count < 1:
+            raise ValueError("TASK-COUNT must be at least 1")
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    extensions = sys.argv[2].split(",") if len(sys.argv) > 2 else []
+    notes = generate_notes(count)
+    renderer = exporter.NoteRenderer(extensions)
+
+    def convert_fresh(note: str) -> str:
+        return markdown.markdown(note, extensions=extensions)
+
+    for note in notes:
+        assert convert_fresh(note) == renderer.convert(note)
+
+    before = time_per_task(convert_fresh, notes)
+    after = time_per_task(renderer.convert, notes)
+    print("tasks: {}".format(count))
+    print("extensions: {}".format(", ".join(extensions) or "none"))
+    print("markdown.markdown per task: {:.1f} us".format(before))
+    print("reused converter per task:  {:.1f} us".format(after))
+    print("speedup: {:.2f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Usage: python benchmarks/suite.py [OPTION]...
+
+Generates a synthetic task tree and times each stage of turning it into
+output: parse, verify, resolve, store, toc, calendar, summary and plain. Each
+stage is run several times and reports its fastest time, along with its peak
+memory use (measured in a separate run, since tracing allocations slows
+everything down). The results are written as JSON, so that runs on different
+commits can be compared.
+
+Options:
+
+- --tasks=COUNT: The number of tasks to generate. 10000 by default.
+
+- --fanout=COUNT: The most children any task has. 5 by default.
+
+- --depth=DEPTH: The maximum depth of the tree. Unlimited by default.
+
+- --dependencies=RATE: The fraction of tasks which depend on earlier tasks.
+  0.1 by default.
+
+- --note-words=COUNT: The maximum number of words in each task's notes. 40 by
+  default.
+
+- --includes=COUNT: How many files the tasks are split across, which are all
+  included by the main task file. By default all tasks are in one file.
+
+- --deadline-days=DAYS: How many days the deadlines are spread over. 365 by
+  default.
+
+- --seed=SEED: The seed for the generator. 0 by default.
+
+- --repeat=COUNT: How many times each stage is timed. 3 by default.
+
+- --stages=STAGE,...: Only runs the given stages.
+
+- --output=FILE: Writes the results to FILE instead of stdout.
+"""
+import io
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from task_burrito import exporter, parser, store, utils
+
+import generate
+
+OPTIONS = {
+    "--tasks=": ("task_count", int, 10000),
+    "--fanout=": ("fanout", int, 5),
+    "--depth=": ("depth", int, None),
+    "--dependencies=": ("dependency_rate", float, 0.1),
+    "--note-words=": ("note_words", int, 40),
+    "--includes=": ("include_fanout", int, 0),
+    "--deadline-days=": ("deadline_days", int, 365),
+    "--seed=": ("seed", int, 0),
+}
+
+
+class Inputs:
+    """
+    The generated task files, along with the parsed and resolved forms of
+    their tasks that the later stages start from.
+    """
+
+    def __init__(self, main_path: str):
+        self.main_path = main_path
+        self.parsed = pickle.dumps(parse(main_path), pickle.HIGHEST_PROTOCOL)
+
+        self.task_map = utils.verify_task_tree(self.tasks())
+        utils.resolve_task_defaults(self.task_map)
+        self.sorted_tasks = utils.sort_tasks(self.task_map.values())
+
+    def tasks(self) -> list:
+        """
+        Gets a fresh copy of the parsed tasks, for stages which modify them.
+        """
+        return pickle.loads(self.parsed)
+
+
+def parse(path: str) -> list:
+    """
+    Parses a task file and everything it includes, without any caching.
+    """
+    logger = utils.Logger(io.StringIO(), io.StringIO())
+    with open(path) as fobj:
+        return parser.parse_file(fobj, os.path.dirname(path), logger)
+
+
+def build_stages(inputs: Inputs, devnull) -> list:
+    """
+    Builds the list of stages. Each stage has a name, a setup function that
+    prepares its input without being timed, and a function that runs it.
+    """
+
+    def no_setup():
+        return ()
+
+    def parsed_tasks():
+        return (inputs.tasks(),)
+
+    def verified_tasks():
+        return (utils.verify_task_tree(inputs.tasks()),)
+
+    def resolved_tasks():
+        return (inputs.task_map,)
+
+    return [
+        ("parse", no_setup, lambda: parse(inputs.main_path)),
+        ("verify", parsed_tasks, utils.verify_task_tree),
+        ("resolve", verified_tasks, utils.resolve_task_defaults),
+        ("store", parsed_tasks, store.TaskStore),
+        (
+            "toc",
+            resolved_tasks,
+            lambda task_map: exporter.export_table_of_contents(task_map, devnull, True),
+        ),
+        (
+            "calendar",
+            resolved_tasks,
+            lambda task_map: exporter.export_calendar(task_map, devnull),
+        ),
+        (
+            "summary",
+            no_setup,
+            lambda: exporter.export_task_list(
+                inputs.sorted_tasks, devnull, exporter.NoteRenderer()
+            ),
+        ),
+        (
+            "plain",
+            no_setup,
+            lambda: exporter.plain_exporter(inputs.sorted_tasks, devnull),
+        ),
+    ]
+
+
+def run_stage(setup, run, repeat: int) -> dict:
+    """
+    Times a stage and measures its peak memory use.
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+        del args
+
+    args = setup()
+    tracemalloc.start()
+    run(*args)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": min(times),
+        "mean_seconds": sum(times) / len(times),
+        "peak_bytes": peak,
+    }
+
+
+def git_commit() -> str:
+    """
+    Gets the commit being benchmarked, if this is a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            universal_newlines=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """
+    Parses the options, runs the stages and writes out the results.
+    """
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+
+    params = {name: default for (name, _, default) in OPTIONS.values()}
+    repeat = 3
+    only = None
+    output_path = None
+    try:
+        for arg in sys.argv[1:]:
+            option = next(
+                (prefix for prefix in OPTIONS if arg.startswith(prefix)), None
+            )
+            if option is not None:
+                (name, convert, _) = OPTIONS[option]
+                params[name] = convert(arg[len(option) :])
+            elif arg.startswith("--repeat="):
+                repeat = max(1, int(arg[len("--repeat=") :]))
+            elif arg.startswith("--stages="):
+                only = arg[len("--stages=") :].split(",")
+            elif arg.startswith("--output="):
+                output_path = arg[len("--output=") :]
+            else:
+                raise ValueError("Unknown option: {}".format(arg))
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "parameters": dict(params, repeat=repeat),
+        "stages": {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        main_path = generate.write_task_files(directory, **params)
+        inputs = Inputs(main_path)
+        with open(os.devnull, "w") as devnull:
+            for (name, setup, run) in build_stages(inputs, devnull):
+                if only is not None and name not in only:
+                    continue
+
+                result = run_stage(setup, run, repeat)
+                results["stages"][name] = result
+                print(
+                    "{:>9}: {:8.3f}s {:8.1f} MiB".format(
+                        name, result["seconds"], result["peak_bytes"] / 2**20
+                    ),
+                    file=sys.stderr,
+                )
+
+    if output_path is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(output_path, "w") as fobj:
+            json.dump(results, fobj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
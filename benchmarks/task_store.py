@@ -0,0 +1,112 @@
+"""
+Usage: python benchmarks/task_store.py [TASK-COUNT]
+
+Compares the memory held by a resolved task tree kept as a dictionary of tasks
+(verify_task_tree and resolve_task_defaults) against the same tree kept in a
+store.TaskStore, along with the time taken to build each one and to export it
+with the plain exporter. Defaults to 100000 tasks.
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+from task_burrito import exporter, parser, store, utils
+
+import generate
+
+
+def parse_tasks(text: str) -> list:
+    """
+    Parses the text of a task file into its tasks.
+    """
+    fobj = io.StringIO(text)
+    fobj.name = "<generated>"
+    logger = utils.Logger(io.StringIO(), io.StringIO())
+    return parser.parse_file(fobj, os.getcwd(), logger)
+
+
+def build_dict(tasks: list):
+    """
+    Builds the resolved task tree the way the exporters used to get it.
+    """
+    task_map = utils.verify_task_tree(tasks)
+    utils.resolve_task_defaults(task_map)
+    return task_map
+
+
+def measure(text: str, build) -> tuple:
+    """
+    Parses the tasks and builds a tree from them, returning the tree along
+    with the bytes it holds (including the tasks it keeps) and the seconds
+    taken to build it. Tracing allocations slows everything down, so the
+    tree is built once for its time and again for its size.
+    """
+    tasks = parse_tasks(text)
+    start = time.perf_counter()
+    build(tasks)
+    elapsed = time.perf_counter() - start
+    del tasks
+
+    tracemalloc.start()
+    tasks = parse_tasks(text)
+    result = build(tasks)
+    del tasks
+
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (result, held, elapsed)
+
+
+def export_time(task_map) -> float:
+    """
+    Returns the seconds taken to export all of the tasks in plain form.
+    """
+    start = time.perf_counter()
+    exporter.plain_exporter(task_map.values(), io.StringIO())
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Builds both forms of the same tree and reports their costs.
+    """
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+
+    try:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+        if count < 1:
+            raise ValueError("TASK-COUNT must be at least 1")
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    text = generate.generate_task_file(count)
+
+    (task_dict, dict_bytes, dict_time) = measure(text, build_dict)
+    (task_store, store_bytes, store_time) = measure(text, store.TaskStore)
+
+    plain_dict = io.StringIO()
+    plain_store = io.StringIO()
+    exporter.plain_exporter(task_dict.values(), plain_dict)
+    exporter.plain_exporter(task_store.values(), plain_store)
+    assert plain_dict.getvalue() == plain_store.getvalue()
+
+    print("tasks: {}".format(count))
+    print(
+        "dict:  {:.1f} MiB, built in {:.3f}s, exported in {:.3f}s".format(
+            dict_bytes / 2**20, dict_time, export_time(task_dict)
+        )
+    )
+    print(
+        "store: {:.1f} MiB, built in {:.3f}s, exported in {:.3f}s".format(
+            store_bytes / 2**20, store_time, export_time(task_store)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
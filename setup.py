@@ -3,6 +3,7 @@ from setuptools import setup
 setup(
     name='task_burrito',
     packages=['task_burrito'],
+    python_requires='>=3.10',
     entry_points = {
         'console_scripts': 
         ['burrito = task_burrito.app:main',
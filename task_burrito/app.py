@@ -1,19 +1,91 @@
 """
-Usage: burrito INPUT-FILE EXPORTER [PROPERTY=VALUE]...
+Usage: burrito INPUT-FILE EXPORTER [--profile] [PROPERTY=VALUE]...
+       burrito INPUT-FILE --out EXPORTER=FILE... [--profile] [PROPERTY=VALUE]...
+       burrito serve INPUT-FILE EXPORTER [OPTION]... [PROPERTY=VALUE]...
+       burrito compile INPUT-FILE OUTPUT-FILE [OPTION]...
+       burrito shard INPUT-FILE EXPORTER OUTPUT-DIR [OPTION]... [PROPERTY=VALUE]...
+       burrito export-site INPUT-FILE OUTPUT-DIR [OPTION]... [PROPERTY=VALUE]...
 
 Arguments:
 
-- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations. May
-  also be - for stdin.
+- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations, or
+  a snapshot compiled from one with "burrito compile". May also be - for
+  stdin.
 
-- EXPORTER: The name of an exporter (one of: "plain", "simple", "calendar", "full")
+- EXPORTER: The name of an exporter (one of: "plain", "simple", "calendar",
+  "full", "critical")
 
 - PROPERTY=VALUE: Exporter-specific configuration options. Properties with the
   BOOLEAN tag should be assigned to either 1 or 0.
 
+Options:
+
+- --out EXPORTER=FILE: Writes the output of an exporter to FILE instead of
+  stdout. This can be given more than once to export several views of the
+  same tasks, which are only parsed once. The parts that the views have in
+  common (such as the table of contents and the full task list) are only
+  rendered once too. The properties apply to every view.
+
+Common Properties:
+
+- cache=BOOLEAN: Whether to reuse parsed files and rendered notes which haven't
+  changed from the cache in $XDG_CACHE_HOME/task_burrito. True by default.
+
+- extensions=NAME,...: A comma-separated list of Python-Markdown extensions
+  (such as "tables" or "fenced_code") used when rendering task notes.
+
+- jobs=NUMBER: How many included files to read and parse at the same time.
+  4 by default.
+
+- filter=EXPRESSION: Only shows the tasks which match a filter in the HTML
+  exporters, such as "status!=DONE and priority<=2 and deadline<=+14d under
+  3.2". Conditions compare status (with = or !=), priority or deadline (with
+  =, !=, <, <=, > or >=) against a value, and "under ID" only matches a task
+  and its descendants. Deadlines can be dates or a number of days from today,
+  such as +14d. Tasks without a priority or deadline never match a condition
+  on it. All of the conditions have to match.
+
+- compress=BOOLEAN: Whether to also write a gzip-compressed copy of each file
+  given with --out (and of each page written by "burrito shard" or "burrito
+  export-site"), with .gz added to its name, for web servers which can serve
+  precompressed files. False by default.
+
+- profile=BOOLEAN: Whether to report the time, number of calls and memory
+  blocks allocated for each stage of the export (such as loading files,
+  parsing tasks and converting notes) on stderr. The --profile flag is the same
+  as profile=1. False by default.
+
+- profile_functions=NUMBER: When profiling, also run cProfile and report this
+  many of the functions with the most cumulative time. 0 by default.
+
+- profile_output=FILE: When profiling, write the report to FILE as JSON
+  instead of to stderr.
+
+Use "burrito serve --help" for the options of the serve command, which runs a
+local HTTP server that keeps the rendered reports up to date.
+
+Use "burrito compile --help" for the options of the compile command, which
+writes a snapshot of the parsed tasks that loads much faster than the task
+files themselves.
+
+Use "burrito shard --help" for the options of the shard command, which writes
+a separate report for each top-level task in parallel.
+
+Use "burrito export-site --help" for the options of the export-site command,
+which writes a static site with a page for each top-level task, rewriting only
+the pages which changed since the last run.
+
 Plain Exporter Properties:
 
-None.
+- stream=BOOLEAN: Whether to parse, sort and write out the tasks one at a time
+  instead of loading them all into memory, for very large task files. The
+  cache is not used when streaming. Problems with the task tree (such as a
+  missing parent task) are only found as the tasks are written, so part of
+  the output may come before the error. False by default.
+
+- stream_memory=MIB: How many MiB of tasks are sorted in memory when
+  streaming, before sorted runs of tasks are written to temporary files.
+  64 by default.
 
 Simple Exporter Properties:
 
@@ -26,26 +98,86 @@ Calendar Exporter Properties:
 
 - summary=BOOLEAN: Whether to include the full task list with notes. True by default.
 
+- collapse=BOOLEAN: Whether to replace runs of months without any deadlines
+  with a single heading. False by default.
+
 Full Exporter Properties:
 
 - summary=BOOLEAN: Whether to include the full task list with notes. True by default.
 
 - fold=BOOLEAN: Whether to omit subtasks from the TOC when all of them are
   completed. True by default.
+
+- collapse=BOOLEAN: Whether to replace runs of months without any deadlines
+  with a single heading. False by default.
+
+Critical Exporter Properties:
+
+- summary=BOOLEAN: Whether to include the full task list with notes. True by default.
+
+- task_days=DAYS: How many days each open task is assumed to take. 1 by
+  default.
+
+- today=YYYY-MM-DD: The day that work on the open tasks starts. The current
+  date by default.
 """
+from contextlib import contextmanager
+import datetime
+import itertools
 import os
 import sys
-from typing import List
+from typing import IO, Iterator, List, Optional, Tuple
 
-from task_burrito import exporter, parser, utils
+from task_burrito import (
+    cache,
+    depgraph,
+    exporter,
+    parser,
+    profiling,
+    query,
+    snapshot,
+    store,
+    streaming,
+    utils,
+    writer,
+)
 
+HTML_EXPORTERS = {"simple", "calendar", "full", "critical"}
 
-def build_config_map(configs: List[str], is_cgi: bool = False) -> exporter.ExportConfig:
+# The options understood by build_config_map. Any others are ignored.
+CONFIG_KEYS = frozenset(
+    {
+        "summary",
+        "fold",
+        "collapse",
+        "cache",
+        "jobs",
+        "stream",
+        "stream_memory",
+        "profile",
+        "profile_functions",
+        "profile_output",
+        "task_days",
+        "today",
+        "filter",
+        "compress",
+        "extensions",
+        "refresh",
+        "refresh_mode",
+    }
+)
+
+
+def build_config_map(
+    configs: List[str], is_cgi: bool = False, refresh_mode: str = "poll"
+) -> exporter.ExportConfig:
     """
     Parses a configuration list into a mapping of configuration values.
     """
     export_config = exporter.ExportConfig()
     export_config.include_refresh = is_cgi
+    export_config.refresh_mode = refresh_mode
+    export_config.compress = is_cgi
     for config in configs:
         if "=" not in config:
             raise ValueError(
@@ -67,6 +199,110 @@ def build_config_map(configs: List[str], is_cgi: bool = False) -> exporter.Expor
             except ValueError:
                 raise ValueError("Invalid value {} for fold config value".format(value))
 
+        elif key == "collapse":
+            try:
+                export_config.collapse_calendar = int(value) == 1
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for collapse config value".format(value)
+                )
+
+        elif key == "cache":
+            try:
+                export_config.use_cache = int(value) == 1
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for cache config value".format(value)
+                )
+
+        elif key == "jobs":
+            try:
+                export_config.parse_jobs = int(value)
+                if export_config.parse_jobs < 1:
+                    raise ValueError
+            except ValueError:
+                raise ValueError("Invalid value {} for jobs config value".format(value))
+
+        elif key == "stream":
+            try:
+                export_config.stream = int(value) == 1
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for stream config value".format(value)
+                )
+
+        elif key == "stream_memory":
+            try:
+                export_config.stream_memory = int(value)
+                if export_config.stream_memory < 1:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for stream_memory config value".format(value)
+                )
+
+        elif key == "profile":
+            try:
+                export_config.profile = int(value) == 1
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for profile config value".format(value)
+                )
+
+        elif key == "profile_functions":
+            try:
+                export_config.profile_functions = int(value)
+                if export_config.profile_functions < 0:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for profile_functions config value".format(value)
+                )
+
+        elif key == "profile_output":
+            export_config.profile_output = value or None
+
+        elif key == "task_days":
+            try:
+                export_config.task_days = int(value)
+                if export_config.task_days < 0:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for task_days config value".format(value)
+                )
+
+        elif key == "today":
+            try:
+                export_config.today = datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for today config value".format(value)
+                )
+
+        elif key == "filter":
+            try:
+                export_config.task_filter = query.Filter.parse(value) if value else None
+            except ValueError as err:
+                raise ValueError(
+                    "Invalid value {} for filter config value: {}".format(
+                        value, err.args[0]
+                    )
+                )
+
+        elif key == "compress":
+            try:
+                export_config.compress = int(value) == 1
+            except ValueError:
+                raise ValueError(
+                    "Invalid value {} for compress config value".format(value)
+                )
+
+        elif key == "extensions":
+            export_config.markdown_extensions = [
+                extension for extension in value.split(",") if extension
+            ]
+
         elif key == "refresh":
             if is_cgi:
                 try:
@@ -76,55 +312,363 @@ def build_config_map(configs: List[str], is_cgi: bool = False) -> exporter.Expor
                         "Invalid value {} for fold config value".format(value)
                     )
 
+        elif key == "refresh_mode":
+            if is_cgi:
+                if value not in exporter.REFRESH_SNIPPETS:
+                    raise ValueError(
+                        "Invalid value {} for refresh_mode config value".format(value)
+                    )
+
+                export_config.refresh_mode = value
+
     return export_config
 
 
+def parse_profile_flag(args: List[str]) -> List[str]:
+    """
+    Replaces the --profile flag (which can appear anywhere in the arguments)
+    with the equivalent profile=1 property at the end.
+    """
+    remaining = [arg for arg in args if arg != "--profile"]
+    if len(remaining) < len(args):
+        remaining.append("profile=1")
+
+    return remaining
+
+
+def parse_out_flags(
+    args: List[str],
+) -> Tuple[List[Tuple[str, Optional[str]]], List[str]]:
+    """
+    Removes the --out EXPORTER=FILE flags (which can appear anywhere in the
+    arguments) from the arguments. Returns the exporter and file given by each
+    flag, along with the remaining arguments.
+    """
+    outputs = []
+    remaining = []
+    args = iter(args)
+    for arg in args:
+        if arg != "--out":
+            remaining.append(arg)
+            continue
+
+        value = next(args, "")
+        if "=" not in value:
+            raise ValueError(
+                "Invalid value '{}' for --out, not in EXPORTER=FILE format".format(
+                    value
+                )
+            )
+
+        outputs.append(tuple(value.split("=", 1)))
+
+    return (outputs, remaining)
+
+
+@contextmanager
+def open_output(path: Optional[str], compress: bool = False) -> Iterator[IO]:
+    """
+    Opens the file that an exporter writes to, which is stdout if no path is
+    given. If compress is set, a gzip-compressed copy of the file (with .gz
+    added to its name) is written at the same time.
+    """
+    if path is None:
+        yield sys.stdout
+        return
+
+    with open(path, "w") as fobj:
+        if not compress:
+            yield fobj
+            return
+
+        with open(path + ".gz", "wb") as gz_fobj:
+            compressed = writer.CompressedStream(gz_fobj, "gzip", fobj.encoding)
+            yield writer.TeeStream([fobj, compressed])
+            compressed.close()
+
+
+@contextmanager
+def replace_output(path: str, compress: bool = False) -> Iterator[IO]:
+    """
+    Opens a file for an exporter to write to, the same as open_output, except
+    that the output goes to a temporary file next to it. The temporary file
+    (and its compressed copy) replace the originals once the export is done,
+    so that the file is never seen half-written and is left alone if the
+    export fails.
+    """
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open_output(temp_path, compress) as fobj:
+            yield fobj
+
+        if compress:
+            os.replace(temp_path + ".gz", path + ".gz")
+        os.replace(temp_path, path)
+    except BaseException:
+        for leftover in (temp_path, temp_path + ".gz"):
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+        raise
+
+
+def report_profile(
+    profiler: Optional[profiling.Profiler], configs: exporter.ExportConfig
+):
+    """
+    Stops the profiler (if profiling is enabled) and writes its report to the
+    JSON file given in the configuration, or to stderr.
+    """
+    if profiler is None:
+        return
+
+    profiler.stop()
+    if configs.profile_output is not None:
+        profiler.write_json(configs.profile_output)
+    else:
+        print(profiler.format_report(), end="", file=sys.stderr)
+
+
+def stream_plain(
+    in_fobj: IO,
+    base_path: str,
+    logger: utils.Logger,
+    configs: exporter.ExportConfig,
+    output: IO,
+):
+    """
+    Runs the plain exporter as a stream, where tasks are parsed one at a time
+    and sorted within a fixed memory budget, spilling onto disk as needed.
+    """
+    tasks = streaming.sort_tasks(
+        parser.iter_tasks(in_fobj, base_path, logger),
+        configs.stream_memory * 1024 * 1024,
+    )
+
+    with profiling.stage("stream"):
+        first = next(tasks, None)
+        if first is None:
+            print("Tasks file cannot be empty", file=sys.stderr)
+            sys.exit(1)
+
+        exporter.plain_exporter(itertools.chain([first], tasks), output, is_sorted=True)
+
+
+def open_task_input(
+    input_file: str,
+) -> Tuple[Optional[IO], str, Optional[snapshot.Snapshot]]:
+    """
+    Opens the input file, which may be - for stdin. Returns the task file to
+    parse (which is None if a snapshot can be used instead), the directory
+    that includes are relative to and the snapshot.
+    """
+    (input_file, compiled) = snapshot.open_input(input_file)
+    if input_file == "-":
+        return (sys.stdin, os.getcwd(), None)
+
+    base_path = os.path.dirname(os.path.abspath(input_file))
+    if compiled is not None:
+        return (None, base_path, compiled)
+
+    return (open(input_file), base_path, None)
+
+
+def load_task_map(
+    in_fobj: Optional[IO],
+    base_path: str,
+    compiled: Optional[snapshot.Snapshot],
+    configs: exporter.ExportConfig,
+    logger: utils.Logger,
+) -> store.TaskStore:
+    """
+    Loads the resolved tasks from a snapshot, or by parsing the task file if
+    there isn't one. Raises a ValueError if there are no tasks.
+    """
+    if compiled is not None:
+        # Snapshots hold tasks which are already resolved, along with the
+        # warnings from parsing them
+        with profiling.stage("load_snapshot"):
+            print(compiled.warnings, end="", file=logger.warn_output)
+            return compiled.task_store()
+
+    parse_cache = cache.ParseCache() if configs.use_cache else None
+    with profiling.stage("parse"):
+        tasks = parser.parse_file(
+            in_fobj, base_path, logger, parse_cache, configs.parse_jobs
+        )
+    if not tasks:
+        raise ValueError("Tasks file cannot be empty")
+
+    # The store keeps everything it needs from the parsed tasks, so they can
+    # be freed as soon as it's built
+    with profiling.stage("resolve"):
+        return store.TaskStore(tasks)
+
+
+def build_dependency_graph(
+    task_map: store.TaskStore, logger: utils.Logger
+) -> depgraph.DependencyGraph:
+    """
+    Builds the dependency graph of the tasks, writing out any missing
+    dependencies or cycles as warnings.
+    """
+    with profiling.stage("dependencies"):
+        graph = depgraph.DependencyGraph(task_map)
+
+    for warning in graph.warnings():
+        print(warning, file=logger.warn_output)
+
+    return graph
+
+
+def build_note_renderer(configs: exporter.ExportConfig) -> exporter.NoteRenderer:
+    """
+    Builds the renderer for task notes, loading the persistent cache of
+    rendered notes if caching is enabled.
+    """
+    fragments = None
+    if configs.use_cache:
+        fragments = cache.FragmentCache(
+            path=os.path.join(cache.default_cache_dir(), "fragments.pickle")
+        )
+        fragments.load()
+
+    return exporter.NoteRenderer(configs.markdown_extensions, fragments)
+
+
 def main():
     """
     Parses the input file and dispatches to the chosen exporter.
     """
     args = sys.argv[1:]
+    if args and args[0] == "serve":
+        # Imported here since the serve module builds on this one
+        from task_burrito import serve
+
+        serve.main(args[1:])
+        return
+
+    if args and args[0] == "compile":
+        snapshot.main(args[1:])
+        return
+
+    if args and args[0] == "shard":
+        # Imported here since the shard module builds on this one
+        from task_burrito import shard
+
+        shard.main(args[1:])
+        return
+
+    if args and args[0] == "export-site":
+        # Imported here since the site_export module builds on this one
+        from task_burrito import site_export
+
+        site_export.main(args[1:])
+        return
+
     if "-h" in args or "--help" in args:
         print(__doc__)
         sys.exit(1)
 
+    args = parse_profile_flag(args)
+    try:
+        (outputs, args) = parse_out_flags(args)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
     try:
         logger = utils.Logger(sys.stderr, sys.stderr)
-        input_file = sys.argv[1]
-        out = sys.argv[2]
+        input_file = args[0]
+        if outputs:
+            properties = args[1:]
+        else:
+            outputs = [(args[1], None)]
+            properties = args[2:]
+
         try:
-            configs = build_config_map(sys.argv[3:], is_cgi=False)
+            configs = build_config_map(properties, is_cgi=False)
         except ValueError as err:
             print(str(err), file=sys.stderr)
             sys.exit(1)
 
-        if input_file == "-":
-            base_path = os.getcwd()
-            in_fobj = sys.stdin
-        else:
-            base_path = os.path.dirname(os.path.abspath(input_file))
-            in_fobj = open(input_file)
+        for (out, _) in outputs:
+            if out != "plain" and out not in HTML_EXPORTERS:
+                print("Unknown exporter:", out, file=sys.stderr)
+                sys.exit(1)
 
-        tasks = parser.parse_file(in_fobj, base_path, logger)
-        if not tasks:
-            print("Tasks file cannot be empty", file=sys.stderr)
+        profiler = profiling.start_profiler(configs)
+        try:
+            (in_fobj, base_path, compiled) = open_task_input(input_file)
+        except (OSError, ValueError) as err:
+            print(str(err), file=sys.stderr)
             sys.exit(1)
 
-        task_map = utils.verify_task_tree(tasks)
-        utils.resolve_task_defaults(task_map)
-
-        is_html_export = out in {"simple", "calendar", "full"}
-        if is_html_export:
-            configs.include_toc = out in {"simple", "full"}
-            configs.include_calendar = out in {"calendar", "full"}
-            configs.head_prefix = '<meta http-equiv="refresh" content="5">'
-            exporter.export_html_report(task_map, sys.stdout, configs)
-        elif out == "plain":
-            exporter.plain_exporter(tasks, sys.stdout)
-        else:
-            print("Unknown exporter:", out, file=sys.stderr)
+        if configs.stream:
+            if any(out != "plain" for (out, _) in outputs):
+                print("Only the plain exporter supports streaming", file=sys.stderr)
+                sys.exit(1)
+
+            if len(outputs) > 1:
+                print("Only one output is supported when streaming", file=sys.stderr)
+                sys.exit(1)
+
+            if compiled is None:
+                try:
+                    with open_output(outputs[0][1], configs.compress) as out_fobj:
+                        stream_plain(in_fobj, base_path, logger, configs, out_fobj)
+                except (OSError, ValueError) as err:
+                    print(str(err), file=sys.stderr)
+                    sys.exit(1)
+
+                report_profile(profiler, configs)
+                return
+
+        try:
+            task_map = load_task_map(in_fobj, base_path, compiled, configs, logger)
+        except ValueError as err:
+            print(str(err), file=sys.stderr)
             sys.exit(1)
 
+        # The dependency graph, note renderer, filter indexes and the
+        # components of the HTML views are shared by every view which uses them
+        graph = None
+        renderer = None
+        index = query.TaskIndex(task_map)
+        sections = {} if len(outputs) > 1 else None
+        configs.head_prefix = '<meta http-equiv="refresh" content="5">'
+        for (out, path) in outputs:
+            try:
+                with open_output(path, configs.compress) as out_fobj:
+                    if out in HTML_EXPORTERS:
+                        if graph is None:
+                            graph = build_dependency_graph(task_map, logger)
+                            renderer = build_note_renderer(configs)
+
+                        configs.include_toc = out in {"simple", "full"}
+                        configs.include_calendar = out in {"calendar", "full"}
+                        configs.include_critical = out == "critical"
+                        with profiling.stage("render"):
+                            exporter.export_html_report(
+                                task_map,
+                                out_fobj,
+                                configs,
+                                renderer,
+                                graph=graph,
+                                sections=sections,
+                                index=index,
+                            )
+                    else:
+                        with profiling.stage("render"):
+                            exporter.plain_exporter(task_map.values(), out_fobj)
+            except OSError as err:
+                print(str(err), file=sys.stderr)
+                sys.exit(1)
+
+        if renderer is not None and renderer.fragments is not None:
+            renderer.fragments.save()
+
+        report_profile(profiler, configs)
+
     except IndexError:
         print("Usage: burrito INPUT-FILE EXPORTER [property=value]...", file=sys.stderr)
         sys.exit(1)
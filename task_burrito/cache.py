@@ -0,0 +1,276 @@
+"""
+Caches which let unchanged task files skip being parsed and rendered again.
+"""
+from collections import OrderedDict
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, IO, Mapping, Optional, Tuple
+
+# Bumped whenever the layout of cache entries (or the objects stored in them)
+# changes, so that entries written by older versions are ignored
+CACHE_VERSION = 4
+
+
+def write_atomic(path: str, value: Any):
+    """
+    Pickles a value into the given file, replacing it atomically. Caches are
+    only an optimization, so any failure to write them is ignored.
+    """
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        (handle, temp_path) = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, "wb") as temp_fobj:
+                pickle.dump(value, temp_fobj, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError:
+        pass
+
+
+def default_cache_dir() -> str:
+    """
+    Finds the directory where Task Burrito should keep its caches, following
+    the XDG base directory conventions.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "task_burrito")
+
+
+class ParseCache:
+    """
+    Stores the parsed form of each task file, keyed on the file's path, mtime,
+    size and content hash. Files whose key matches a stored entry are loaded
+    from the cache instead of being parsed.
+
+    The content hash of every file parsed through the cache is kept in
+    digests, so that callers can tell whether any of their inputs changed.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.digests = {}
+
+    def entry_path(self, path: str) -> str:
+        """
+        Gets the cache file that stores the entry for the given task file.
+        """
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "parse-{}.pickle".format(digest))
+
+    def parse(self, path: str, parse: Callable[[IO], Any]) -> Any:
+        """
+        Returns the cached result of parsing the given file, calling parse on
+        the file's contents to compute it if there is no usable entry.
+        """
+        with open(path, "rb") as fobj:
+            stat = os.fstat(fobj.fileno())
+            data = fobj.read()
+
+        digest = hashlib.sha256(data).hexdigest()
+        self.digests[os.path.abspath(path)] = digest
+        key = (
+            CACHE_VERSION,
+            os.path.abspath(path),
+            stat.st_mtime_ns,
+            stat.st_size,
+            digest,
+        )
+
+        entry = self.load_entry(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        buffer = io.BytesIO(data)
+        buffer.name = path
+        value = parse(io.TextIOWrapper(buffer))
+        self.store_entry(path, (key, value))
+        return value
+
+    def load_entry(self, path: str) -> Optional[Tuple[Any, Any]]:
+        """
+        Loads the key and value stored for the given task file, or returns None
+        if there is no readable entry.
+        """
+        try:
+            with open(self.entry_path(path), "rb") as entry_fobj:
+                return pickle.load(entry_fobj)
+        except (
+            OSError,
+            EOFError,
+            AttributeError,
+            ImportError,
+            ValueError,
+            pickle.UnpicklingError,
+        ):
+            return None
+
+    def store_entry(self, path: str, entry: Tuple[Any, Any]):
+        """
+        Stores the key and value for the given task file.
+        """
+        write_atomic(self.entry_path(path), entry)
+
+
+class MemoryParseCache(ParseCache):
+    """
+    A parse cache which keeps its entries in memory, for long-running
+    processes. Entries are stored pickled so that each parse returns fresh
+    tasks which can be modified without affecting the cache.
+    """
+
+    def __init__(self):
+        super().__init__(cache_dir="")
+        self.entries = {}
+
+    def load_entry(self, path: str) -> Optional[Tuple[Any, Any]]:
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return None
+
+        return pickle.loads(entry)
+
+    def store_entry(self, path: str, entry: Tuple[Any, Any]):
+        self.entries[os.path.abspath(path)] = pickle.dumps(
+            entry, pickle.HIGHEST_PROTOCOL
+        )
+
+    def forget_unused(self):
+        """
+        Drops the entries of every file that was not parsed since the last
+        call, and starts tracking the digests of parsed files from scratch.
+        """
+        for path in set(self.entries) - set(self.digests):
+            del self.entries[path]
+
+        self.digests = {}
+
+
+def input_digest(digests: Mapping[str, str], *extra: str) -> str:
+    """
+    Combines the content hashes of a set of files (and any other values that
+    affect the output) into a single hash, suitable for an HTTP ETag.
+    """
+    return FragmentCache.key(
+        str(CACHE_VERSION),
+        *(part for item in sorted(digests.items()) for part in item),
+        *extra
+    )
+
+
+class FragmentCache:
+    """
+    A content-addressed LRU cache of rendered HTML fragments. The cache is
+    bounded by the total size of the fragments it holds, and can optionally be
+    saved to and loaded from a file so that it lasts between runs.
+
+    The size of each fragment is taken with measure, so that other values
+    (such as whole pages, along with their headers) can be cached as well.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 32 * 1024 * 1024,
+        path: Optional[str] = None,
+        measure: Callable[[Any], int] = len,
+    ):
+        self.max_size = max_size
+        self.path = path
+        self.measure = measure
+        self.size = 0
+        self.dirty = False
+        self.fragments = OrderedDict()
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """
+        Computes the cache key for a fragment generated from the given inputs.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            encoded = part.encode("utf-8")
+            digest.update(str(len(encoded)).encode("ascii") + b":" + encoded)
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Gets the fragment stored under the given key, marking it as the most
+        recently used.
+        """
+        fragment = self.fragments.get(key)
+        if fragment is not None:
+            self.fragments.move_to_end(key)
+
+        return fragment
+
+    def put(self, key: str, fragment: Any):
+        """
+        Stores a fragment, evicting the least recently used fragments until the
+        cache fits within its size limit.
+        """
+        if key in self.fragments:
+            self.size -= self.measure(self.fragments.pop(key))
+
+        size = self.measure(fragment)
+        if size > self.max_size:
+            return
+
+        self.fragments[key] = fragment
+        self.size += size
+        self.dirty = True
+        while self.size > self.max_size:
+            (_, evicted) = self.fragments.popitem(last=False)
+            self.size -= self.measure(evicted)
+
+    def render(self, key: str, render: Callable[[], str]) -> str:
+        """
+        Returns the fragment stored under the key, calling render to produce it
+        if it is not already cached.
+        """
+        fragment = self.get(key)
+        if fragment is None:
+            fragment = render()
+            self.put(key, fragment)
+
+        return fragment
+
+    def load(self):
+        """
+        Reads the fragments saved in the cache file, if there is one.
+        """
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path, "rb") as fobj:
+                (version, fragments) = pickle.load(fobj)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return
+
+        if version != CACHE_VERSION:
+            return
+
+        for (key, fragment) in fragments:
+            self.put(key, fragment)
+
+        self.dirty = False
+
+    def save(self):
+        """
+        Writes the fragments out to the cache file, if any have been added
+        since it was loaded. Failures to write the cache are ignored.
+        """
+        if self.path is None or not self.dirty:
+            return
+
+        write_atomic(self.path, (CACHE_VERSION, list(self.fragments.items())))
+        self.dirty = False
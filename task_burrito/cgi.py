@@ -1,15 +1,51 @@
 """
-Usage: burrito-cgi INPUT-FILE EXPORTER [PROPERTY=VALUE]...
+Usage: burrito-cgi INPUT-FILE EXPORTER [--profile] [PROPERTY=VALUE]...
 
 Arguments:
 
-- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations.
+- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations, or
+  a snapshot compiled from one with "burrito compile".
 
-- EXPORTER: The name of an exporter (one of: "plain", "simple", "calendar", "full")
+- EXPORTER: The name of an exporter (one of: "plain", "simple", "calendar",
+  "full", "critical")
 
 - PROPERTY=VALUE: Exporter-specific configuration options. Properties with the
   BOOLEAN tag should be assigned to either 1 or 0.
 
+Common Properties:
+
+- cache=BOOLEAN: Whether to reuse parsed files and rendered notes which haven't
+  changed from the cache in $XDG_CACHE_HOME/task_burrito. True by default.
+
+- extensions=NAME,...: A comma-separated list of Python-Markdown extensions
+  (such as "tables" or "fenced_code") used when rendering task notes.
+
+- jobs=NUMBER: How many included files to read and parse at the same time.
+  4 by default.
+
+- filter=EXPRESSION: Only shows the tasks which match a filter in the HTML
+  exporters, such as "status!=DONE and priority<=2 and deadline<=+14d under
+  3.2". Conditions compare status (with = or !=), priority or deadline (with
+  =, !=, <, <=, > or >=) against a value, and "under ID" only matches a task
+  and its descendants. Deadlines can be dates or a number of days from today,
+  such as +14d. Tasks without a priority or deadline never match a condition
+  on it. All of the conditions have to match.
+
+- compress=BOOLEAN: Whether to compress the page with gzip or deflate when the
+  browser accepts either of them in its Accept-Encoding header. The page is
+  compressed as it is written. True by default.
+
+- profile=BOOLEAN: Whether to report the time, number of calls and memory
+  blocks allocated for each stage of the export (such as loading files,
+  parsing tasks and converting notes) in an HTML comment at the end of the
+  page. The --profile flag is the same as profile=1. False by default.
+
+- profile_functions=NUMBER: When profiling, also run cProfile and report this
+  many of the functions with the most cumulative time. 0 by default.
+
+- profile_output=FILE: When profiling, write the report to FILE as JSON
+  instead of into the page.
+
 Plain Exporter Properties:
 
 None.
@@ -24,13 +60,24 @@ Simple Exporter Properties:
 - refresh=BOOLEAN: Whether to emit HTML which automatically refreshes the page.
   True by default.
 
+- refresh_mode=MODE: How the page refreshes itself. "poll" (the default) checks
+  every 5 seconds whether the task files changed and only reloads the page if
+  they did. "meta" reloads the page every 5 seconds unconditionally.
+
 Calendar Exporter Properties:
 
 - summary=BOOLEAN: Whether to include the full task list with notes. True by default.
 
+- collapse=BOOLEAN: Whether to replace runs of months without any deadlines
+  with a single heading. False by default.
+
 - refresh=BOOLEAN: Whether to emit HTML which automatically refreshes the page.
   True by default.
 
+- refresh_mode=MODE: How the page refreshes itself. "poll" (the default) checks
+  every 5 seconds whether the task files changed and only reloads the page if
+  they did. "meta" reloads the page every 5 seconds unconditionally.
+
 Full Exporter Properties:
 
 - summary=BOOLEAN: Whether to include the full task list with notes. True by default.
@@ -38,20 +85,122 @@ Full Exporter Properties:
 - fold=BOOLEAN: Whether to omit subtasks from the TOC when all of them are
   completed. True by default.
 
+- collapse=BOOLEAN: Whether to replace runs of months without any deadlines
+  with a single heading. False by default.
+
+- refresh=BOOLEAN: Whether to emit HTML which automatically refreshes the page.
+  True by default.
+
+- refresh_mode=MODE: How the page refreshes itself. "poll" (the default) checks
+  every 5 seconds whether the task files changed and only reloads the page if
+  they did. "meta" reloads the page every 5 seconds unconditionally.
+
+Critical Exporter Properties:
+
+- summary=BOOLEAN: Whether to include the full task list with notes. True by default.
+
+- task_days=DAYS: How many days each open task is assumed to take. 1 by
+  default.
+
+- today=YYYY-MM-DD: The day that work on the open tasks starts. The current
+  date by default.
+
 - refresh=BOOLEAN: Whether to emit HTML which automatically refreshes the page.
   True by default.
+
+- refresh_mode=MODE: How the page refreshes itself. "poll" (the default) checks
+  every 5 seconds whether the task files changed and only reloads the page if
+  they did. "meta" reloads the page every 5 seconds unconditionally.
 """
+import datetime
 import html
 from io import StringIO
 import os
 import sys
+from typing import List, Optional
+
+from task_burrito import (
+    app,
+    cache,
+    exporter,
+    parser,
+    profiling,
+    snapshot,
+    store,
+    utils,
+    writer,
+)
+
+
+def parse_if_none_match(header: str) -> List[str]:
+    """
+    Gets the ETags that the client already has a copy of, from the value of
+    its If-None-Match header.
+    """
+    etags = []
+    for etag in header.split(","):
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+
+        if etag:
+            etags.append(etag)
+
+    return etags
+
+
+def parse_accept_encoding(header: str) -> Optional[str]:
+    """
+    Picks the content encoding to compress the page with, from the value of
+    the client's Accept-Encoding header. gzip is preferred over deflate, and
+    None is returned if the client accepts neither.
+    """
+    qualities = {}
+    for entry in header.split(","):
+        (coding, _, params) = entry.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            (name, _, value) = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        qualities[coding.strip().lower()] = quality
+
+    for coding in ("gzip", "deflate"):
+        if qualities.get(coding, qualities.get("*", 0.0)) > 0:
+            return coding
+
+    return None
+
+
+def stop_profiler(
+    profiler: Optional[profiling.Profiler], configs: exporter.ExportConfig
+) -> Optional[str]:
+    """
+    Stops the profiler (if profiling is enabled). Returns its report to add to
+    the page, unless it is written to the JSON file given in the configuration
+    instead.
+    """
+    if profiler is None:
+        return None
+
+    profiler.stop()
+    if configs.profile_output is not None:
+        profiler.write_json(configs.profile_output)
+        return None
 
-from task_burrito import app, exporter, parser, utils
+    return profiler.format_report()
 
 
 def main():
     """
-    Parses the input file and dispatches to the chosen exporter.
+    Parses the input file and dispatches to the chosen exporter. Everything up
+    to the ETag is worked out before the response starts, since errors are
+    reported as plain text instead of as a page. The page itself is written
+    out as it is rendered.
     """
     args = sys.argv[1:]
     input_file = sys.argv[1]
@@ -59,11 +208,16 @@ def main():
 
     warning_buffer = StringIO()
     error_buffer = StringIO()
-    output_buffer = StringIO()
 
     error = False
+    etag = None
+    encoding = None
+    not_modified = False
+    profiler = None
     try:
-        configs = app.build_config_map(sys.argv[3:], is_cgi=True)
+        configs = app.build_config_map(
+            app.parse_profile_flag(sys.argv[3:]), is_cgi=True
+        )
     except ValueError as err:
         print(str(err), file=error_buffer)
         error = True
@@ -72,27 +226,63 @@ def main():
         print(__doc__, file=error_buffer)
     elif not error:
         try:
-            logger = utils.Logger(warning_buffer, output_buffer)
+            logger = utils.Logger(warning_buffer, error_buffer)
+            profiler = profiling.start_profiler(configs)
+            (input_file, compiled) = snapshot.open_input(input_file)
             base_path = os.path.dirname(os.path.abspath(input_file))
-            in_fobj = open(input_file)
 
-            tasks = parser.parse_file(in_fobj, base_path, logger)
-            if not tasks:
+            task_map = None
+            if compiled is not None:
+                with profiling.stage("load_snapshot"):
+                    print(compiled.warnings, end="", file=warning_buffer)
+                    task_map = compiled.task_store()
+                    digests = compiled.digests()
+            else:
+                in_fobj = open(input_file)
+
+                # Even without the on-disk cache, the digests of the input
+                # files are needed to compute the ETag
+                parse_cache = (
+                    cache.ParseCache()
+                    if configs.use_cache
+                    else cache.MemoryParseCache()
+                )
+                with profiling.stage("parse"):
+                    tasks = parser.parse_file(
+                        in_fobj, base_path, logger, parse_cache, configs.parse_jobs
+                    )
+                if tasks:
+                    with profiling.stage("resolve"):
+                        task_map = store.TaskStore(tasks)
+                digests = parse_cache.digests
+
+            if task_map is None:
                 print("Task file cannot be empty", file=error_buffer)
             else:
-                task_map = utils.verify_task_tree(tasks)
-                utils.resolve_task_defaults(task_map)
-
-                is_html_export = out in {"simple", "calendar", "full"}
-                if is_html_export:
-                    configs.include_toc = out in {"simple", "full"}
-                    configs.include_calendar = out in {"calendar", "full"}
-                    configs.body_suffix = "%WARNING%"
-                    exporter.export_html_report(task_map, output_buffer, configs)
-                elif out == "plain":
+                if out == "plain":
                     print("plain exporter not supported in CGI mode", file=error_buffer)
-                else:
+                elif out not in {"simple", "calendar", "full", "critical"}:
                     print("Unknown exporter:", out, file=error_buffer)
+                else:
+                    # The critical path and filters with relative deadlines
+                    # depend on the current date as well
+                    extra = sys.argv[2:]
+                    if out == "critical" or configs.task_filter is not None:
+                        extra.append(datetime.date.today().isoformat())
+
+                    # Each encoding of the page is a different response, so
+                    # it needs its own ETag
+                    if configs.compress:
+                        encoding = parse_accept_encoding(
+                            os.environ.get("HTTP_ACCEPT_ENCODING", "")
+                        )
+                    if encoding is not None:
+                        extra.append(encoding)
+
+                    etag = '"{}"'.format(cache.input_digest(digests, *extra))
+                    not_modified = etag in parse_if_none_match(
+                        os.environ.get("HTTP_IF_NONE_MATCH", "")
+                    )
 
         except IndexError:
             print(
@@ -103,25 +293,72 @@ def main():
             print(err.args[0], file=error_buffer)
 
     error_text = error_buffer.getvalue()
-    warning_text = warning_buffer.getvalue()
-    output_text = output_buffer.getvalue()
-
     if error_text:
+        if profiler is not None:
+            stop_profiler(profiler, configs)
+
         print("Content-Type: text/plain")
         print()
         print(error_text)
-    else:
-        print("Content-Type: text/html")
+        return
+
+    if not_modified:
+        stop_profiler(profiler, configs)
+
+        print("Status: 304 Not Modified")
+        print("ETag:", etag)
+        if configs.compress:
+            print("Vary: Accept-Encoding")
         print()
+        return
 
-        if warning_text:
-            output_text = output_text.replace(
-                "%WARNING%",
-                "<hr><h1>Warnings</h1><pre>{}</pre></body>".format(
-                    html.escape(warning_text)
-                ),
-            )
-        else:
-            output_text = output_text.replace("%WARNING%", "")
+    # The headers are sent before the page is rendered, so that the browser
+    # can start loading the page right away
+    print("Content-Type: text/html")
+    print("ETag:", etag)
+    print("Cache-Control: no-cache")
+    if configs.compress:
+        print("Vary: Accept-Encoding")
+    if encoding is not None:
+        print("Content-Encoding:", encoding)
+    print()
+    sys.stdout.flush()
+
+    # The page is compressed as it is rendered, instead of all at once at the
+    # end, and each chunk is flushed out as soon as it's compressed so that the
+    # page still starts arriving right away
+    if encoding is None:
+        page = sys.stdout
+    else:
+        page = writer.CompressedStream(sys.stdout.buffer, encoding, sync=True)
+
+    configs.refresh_token = etag
+    configs.include_toc = out in {"simple", "full"}
+    configs.include_calendar = out in {"calendar", "full"}
+    configs.include_critical = out == "critical"
+    graph = app.build_dependency_graph(task_map, logger)
+    renderer = app.build_note_renderer(configs)
+
+    # Every warning is known once the dependency graph is built, so they can
+    # be put at the end of the page before any of it is rendered
+    warning_text = warning_buffer.getvalue()
+    if warning_text:
+        configs.body_suffix = "<hr><h1>Warnings</h1><pre>{}</pre></body>".format(
+            html.escape(warning_text)
+        )
+
+    with profiling.stage("render"):
+        exporter.export_html_report(task_map, page, configs, renderer, graph=graph)
+    page.write("\n")
+
+    if renderer.fragments is not None:
+        renderer.fragments.save()
+
+    profile_text = stop_profiler(profiler, configs)
+    if profile_text is not None:
+        # Comments can't contain --, which the report doesn't need anyway
+        page.write("<!--\n{}-->\n".format(profile_text.replace("--", "- -")))
 
-        print(output_text)
+    if encoding is not None:
+        page.close()
+        sys.stdout.buffer.flush()
@@ -0,0 +1,134 @@
+"""
+Critical path analysis, which works out when each open task has to start for
+every deadline to be met, given the dependencies between tasks.
+"""
+import datetime
+from typing import Iterator, Mapping, Optional, Tuple
+
+from task_burrito import depgraph, store, utils
+
+
+# How long DONE tasks take
+NO_TIME = datetime.timedelta()
+
+
+def task_schedule_fields(
+    task_map: Mapping[Tuple[int], utils.Task]
+) -> Iterator[Tuple[Tuple[int], Optional[utils.TaskStatus], Optional[datetime.date]]]:
+    """
+    Gets the ID, status and deadline of each task. The fields of a TaskStore
+    are read directly, instead of building each task.
+    """
+    if isinstance(task_map, store.TaskStore):
+        return zip(task_map.ids, task_map.statuses, task_map.deadlines)
+
+    return ((task.task_id, task.status, task.deadline) for task in task_map.values())
+
+
+class Schedule:
+    """
+    The earliest and latest dates that each task can be worked on, assuming
+    that every open task takes the same number of days and that work on a
+    task can start as soon as its dependencies are done. DONE tasks take no
+    time at all.
+
+    - earliest_start and earliest_finish are the soonest each task can be
+      started and done, if work on the open tasks starts today.
+
+    - latest_start is the last day each task can be started without missing
+      its own deadline, or the deadline of anything that depends on it. Tasks
+      without any deadline to meet are left out.
+
+    - slack is how many days each task's start can slip without missing a
+      deadline, which is negative if a deadline can't be met. Tasks without
+      any deadline to meet are left out.
+
+    - chain gives the dependency which finishes last for each task (the end
+      of the longest chain of work which leads up to the task), or None if
+      the task can start right away.
+
+    - chain_length gives the number of open tasks in that chain, including
+      the task itself.
+
+    Tasks which are part of a dependency cycle can't be scheduled, and are
+    left out. Dependencies on them (or on tasks which don't exist) are
+    ignored.
+    """
+
+    def __init__(
+        self,
+        task_map: Mapping[Tuple[int], utils.Task],
+        graph: depgraph.DependencyGraph,
+        today: datetime.date,
+        task_days: int = 1,
+    ):
+        self.today = today
+        self.task_duration = datetime.timedelta(days=task_days)
+        self.open = set()
+        self.deadlines = {}
+        for (task_id, status, deadline) in task_schedule_fields(task_map):
+            if status != utils.TaskStatus.DONE:
+                self.open.add(task_id)
+
+            if utils.is_valued(deadline):
+                self.deadlines[task_id] = deadline
+
+        # Both passes go over the topological order once, dependencies first
+        # for the earliest dates and dependents first for the latest ones
+        self.earliest_finish = {}
+        self.chain = {}
+        self.chain_length = {}
+        for task_id in graph.order:
+            start = today
+            previous = None
+            for dep in graph.forward[task_id]:
+                finish = self.earliest_finish.get(dep)
+                if finish is not None and finish > start:
+                    start = finish
+                    previous = dep
+
+            self.earliest_finish[task_id] = start + self.duration(task_id)
+            self.chain[task_id] = previous
+            self.chain_length[task_id] = int(task_id in self.open) + (
+                0 if previous is None else self.chain_length[previous]
+            )
+
+        self.latest_start = {}
+        for task_id in reversed(graph.order):
+            finish = self.deadlines.get(task_id)
+            for dependent in graph.reverse[task_id]:
+                start = self.latest_start.get(dependent)
+                if start is not None and (finish is None or start < finish):
+                    finish = start
+
+            if finish is not None:
+                self.latest_start[task_id] = finish - self.duration(task_id)
+
+        self.earliest_start = {}
+        self.slack = {}
+        for (task_id, finish) in self.earliest_finish.items():
+            start = finish - self.duration(task_id)
+            self.earliest_start[task_id] = start
+            latest = self.latest_start.get(task_id)
+            if latest is not None:
+                self.slack[task_id] = (latest - start).days
+
+    def duration(self, task_id: Tuple[int]) -> datetime.timedelta:
+        """
+        Gets how long a task takes.
+        """
+        if task_id in self.open:
+            return self.task_duration
+
+        return NO_TIME
+
+    def chain_to(self, task_id: Tuple[int]) -> Iterator[Tuple[int]]:
+        """
+        Gets the open tasks in the longest chain of work which leads up to a
+        task, starting from the task itself.
+        """
+        while task_id is not None:
+            if task_id in self.open:
+                yield task_id
+
+            task_id = self.chain[task_id]
@@ -0,0 +1,235 @@
+"""
+The dependency graph of a task tree, which is built once so that exporters can
+look up which tasks block each other without walking the tree themselves.
+"""
+from collections import deque
+from typing import (
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from task_burrito import store, utils
+
+
+def task_dependencies(
+    task_map: Mapping[Tuple[int], utils.Task]
+) -> Iterator[Tuple[Tuple[int], Optional[utils.TaskStatus], Iterable[Tuple[int]]]]:
+    """
+    Gets the ID, status and dependencies of each task, in order. The fields of
+    a TaskStore are read directly, instead of building each task.
+    """
+    if isinstance(task_map, store.TaskStore):
+        ids = task_map.ids
+        offsets = task_map.dependency_offsets
+        dependencies = task_map.dependencies
+        for (position, status) in enumerate(task_map.statuses):
+            depends = dependencies[offsets[position] : offsets[position + 1]]
+            yield (ids[position], status, [ids[dep] for dep in depends])
+    else:
+        for task in utils.sort_tasks(task_map.values()):
+            yield (task.task_id, task.status, task.depends)
+
+
+class DependencyGraph:
+    """
+    Holds the dependencies between the tasks of a resolved task tree, in both
+    directions. The dependencies of each task include its children, since
+    resolve_task_defaults adds them.
+
+    - forward maps each task to its dependencies, in order. This includes
+      dependencies on tasks which don't exist, which are also listed in
+      missing.
+
+    - reverse maps each task to the tasks which depend on it, in order.
+
+    - blockers maps each task to its dependencies which aren't DONE (including
+      missing ones, which can never be done). Tasks without any blockers are
+      left out.
+
+    - order lists the tasks so that every task comes after its dependencies.
+      Tasks which are part of a cycle are left out, and each cycle is listed
+      in cycles instead.
+    """
+
+    def __init__(self, task_map: Mapping[Tuple[int], utils.Task]):
+        self.forward = {}
+        self.reverse = {}
+        self.missing = {}
+        self.blockers = {}
+        self.transitive = {}
+
+        statuses = {}
+        for (task_id, status, depends) in task_dependencies(task_map):
+            self.forward[task_id] = sorted(depends)
+            self.reverse[task_id] = []
+            statuses[task_id] = status
+
+        for (task_id, depends) in self.forward.items():
+            blockers = []
+            for dep in depends:
+                status = statuses.get(dep)
+                if dep not in statuses:
+                    self.missing.setdefault(task_id, []).append(dep)
+                else:
+                    self.reverse[dep].append(task_id)
+
+                if status != utils.TaskStatus.DONE:
+                    blockers.append(dep)
+
+            if blockers:
+                self.blockers[task_id] = blockers
+
+        (self.order, self.cycles) = self.sort()
+
+    def sort(self) -> Tuple[List[Tuple[int]], List[List[Tuple[int]]]]:
+        """
+        Orders the tasks so that dependencies come first, and finds the
+        cycles. Tasks are ordered by taking the tasks whose dependencies have
+        all been ordered, starting with the tasks without any dependencies.
+        Only the tasks which are left over once that stops are part of a
+        cycle, or depend on one.
+        """
+        pending = {
+            task_id: len(depends) - len(self.missing.get(task_id, ()))
+            for (task_id, depends) in self.forward.items()
+        }
+        ready = deque(task_id for (task_id, count) in pending.items() if count == 0)
+        order = []
+        while ready:
+            task_id = ready.popleft()
+            order.append(task_id)
+            for dependent in self.reverse[task_id]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+
+        cycles = []
+        if len(order) < len(self.forward):
+            ordered = set(order)
+            left_over = [task_id for task_id in self.forward if task_id not in ordered]
+            for component in self.components(left_over, ordered):
+                if len(component) > 1 or component[0] in self.forward[component[0]]:
+                    cycles.append(sorted(component))
+                else:
+                    order.append(component[0])
+
+        cycles.sort()
+        return (order, cycles)
+
+    def components(
+        self, task_ids: List[Tuple[int]], ordered: Set[Tuple[int]]
+    ) -> List[List[Tuple[int]]]:
+        """
+        Finds the strongly connected components among the given tasks, using
+        Tarjan's algorithm. Each component is found only after every component
+        it depends on. Dependencies on tasks which have already been ordered
+        are ignored.
+        """
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        def visit(task_id: Tuple[int]) -> Tuple[Tuple[int], Iterator[Tuple[int]]]:
+            index[task_id] = lowlink[task_id] = len(index)
+            stack.append(task_id)
+            on_stack.add(task_id)
+            return (task_id, iter(self.forward[task_id]))
+
+        # The search uses its own stack, since a long chain of dependencies
+        # would exceed the recursion limit
+        for root in task_ids:
+            if root in index:
+                continue
+
+            work = [visit(root)]
+            while work:
+                (task_id, depends) = work[-1]
+                for dep in depends:
+                    if dep not in self.reverse or dep in ordered:
+                        continue
+                    elif dep not in index:
+                        work.append(visit(dep))
+                        break
+                    elif dep in on_stack:
+                        lowlink[task_id] = min(lowlink[task_id], index[dep])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[task_id])
+
+                    if lowlink[task_id] == index[task_id]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == task_id:
+                                break
+
+                        components.append(component)
+
+        return components
+
+    def transitive_blockers(self, task_id: Tuple[int]) -> FrozenSet[Tuple[int]]:
+        """
+        Gets every task which keeps the given task from being done: its
+        blockers, their blockers and so on. The blockers of each task are
+        only found once, and kept for later lookups.
+        """
+        found = self.transitive.get(task_id)
+        if found is not None:
+            return found
+
+        found = set()
+        pending = list(self.blockers.get(task_id, ()))
+        while pending:
+            dep = pending.pop()
+            if dep in found:
+                continue
+
+            found.add(dep)
+            known = self.transitive.get(dep)
+            if known is not None:
+                found |= known
+            else:
+                pending.extend(self.blockers.get(dep, ()))
+
+        found = frozenset(found)
+        self.transitive[task_id] = found
+        return found
+
+    def warnings(self) -> List[str]:
+        """
+        Describes the missing dependencies and cycles in the graph.
+        """
+        warnings = []
+        for (task_id, missing) in self.missing.items():
+            for dep in missing:
+                warnings.append(
+                    "Task {} depends on task {}, which does not exist".format(
+                        utils.task_id_str(task_id), utils.task_id_str(dep)
+                    )
+                )
+
+        for cycle in self.cycles:
+            if len(cycle) == 1:
+                warnings.append(
+                    "Task {} depends on itself".format(utils.task_id_str(cycle[0]))
+                )
+            else:
+                warnings.append(
+                    "Tasks {} depend on each other in a cycle".format(
+                        ", ".join(utils.task_id_str(task_id) for task_id in cycle)
+                    )
+                )
+
+        return warnings
@@ -2,13 +2,46 @@
 Takes tasks from the parser and processes them into different formats.
 """
 import calendar
+from collections import defaultdict
 from dataclasses import dataclass, field
 import datetime
 import html
-from typing import IO, List, Mapping, Tuple
+import json
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    IO,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import markdown
-from task_burrito import utils
+from task_burrito import (
+    cache,
+    critical,
+    depgraph,
+    profiling,
+    query,
+    utils,
+    writer,
+)
+
+# The calendar's column headings, which are always in English (unlike
+# calendar.day_name, which follows the locale)
+DAY_NAMES = (
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+)
 
 HTML_HEADER = """
 <html lang="en">
@@ -27,6 +60,46 @@ HTML_HEADER = """
     <body>
 """
 
+# Snippets which keep the page up to date, for each of the refresh modes. The
+# meta mode reloads the page unconditionally, while the others reload it only
+# once the server reports that the task files have changed: poll by asking for
+# the page again with the ETag it was rendered with, and push by waiting for an
+# event from burrito serve.
+REFRESH_SNIPPETS = {
+    "meta": '<meta http-equiv="refresh" content="5">',
+    "poll": """<script>
+        (function () {
+            var etag = %TOKEN%;
+            function poll() {
+                fetch(window.location.href, {
+                    cache: "no-store",
+                    headers: { "If-None-Match": etag },
+                }).then(function (response) {
+                    if (response.status === 200) {
+                        window.location.reload();
+                    } else {
+                        setTimeout(poll, 5000);
+                    }
+                }, function () {
+                    setTimeout(poll, 5000);
+                });
+            }
+            setTimeout(poll, 5000);
+        })();
+        </script>""",
+    "push": """<script>
+        (function () {
+            var source = new EventSource(
+                "/events?version=" + encodeURIComponent(%TOKEN%)
+            );
+            source.addEventListener("change", function () {
+                source.close();
+                window.location.reload();
+            });
+        })();
+        </script>""",
+}
+
 HTML_FOOTER = """
       %TAIL%
     </body>
@@ -42,10 +115,26 @@ class ExportConfig:
 
     include_toc: bool = field(default=False, init=False)
     include_calendar: bool = field(default=False, init=False)
+    include_critical: bool = field(default=False, init=False)
     include_summary: bool = field(default=True, init=False)
     fold_toc: bool = field(default=True, init=False)
+    collapse_calendar: bool = field(default=False, init=False)
     body_suffix: str = field(default=None, init=False)
     include_refresh: bool = field(default=False, init=False)
+    refresh_mode: str = field(default="meta", init=False)
+    refresh_token: str = field(default="", init=False)
+    use_cache: bool = field(default=True, init=False)
+    parse_jobs: int = field(default=4, init=False)
+    markdown_extensions: List[str] = field(default_factory=list, init=False)
+    stream: bool = field(default=False, init=False)
+    stream_memory: int = field(default=64, init=False)
+    profile: bool = field(default=False, init=False)
+    profile_functions: int = field(default=0, init=False)
+    profile_output: Optional[str] = field(default=None, init=False)
+    task_days: int = field(default=1, init=False)
+    today: Optional[datetime.date] = field(default=None, init=False)
+    task_filter: Optional[query.Filter] = field(default=None, init=False)
+    compress: bool = field(default=False, init=False)
 
 
 def task_id_link(task_id: Tuple[int]) -> str:
@@ -77,316 +166,556 @@ def task_status_color(status: utils.TaskStatus) -> str:
     return "<span style='font-weight: bold; color: {}'> {} </span>".format(color, name)
 
 
-def plain_exporter(tasks: List[utils.Task], output: IO):
+def plain_exporter(tasks: Iterable[utils.Task], output: IO, is_sorted: bool = False):
     """
     Exports a task list back into the default format, sorting the tasks and
-    dropping anything that was ignored.
+    dropping anything that was ignored. If the tasks are already sorted, they
+    are written out as they arrive instead of being collected and sorted.
     """
-    tasks = utils.sort_tasks(tasks)
-    for task in tasks:
-        print("***", file=output)
-        print("task", utils.task_id_str(task.task_id), file=output)
-        print("label", task.label, file=output)
-        print("status", str(task.status), file=output)
-        if task.priority is not None:
-            print(
-                "priority",
-                task.priority if utils.is_valued(task.priority) else "none",
-                file=output,
-            )
-        if task.deadline is not None:
-            print(
-                "deadline",
-                task.deadline.isoformat() if utils.is_valued(task.deadline) else "none",
-                file=output,
-            )
-        if task.depends:
-            print(
-                "depends",
-                " ".join(utils.task_id_str(dep) for dep in sorted(task.depends)),
-                file=output,
-            )
-        print("***", file=output)
-        print(task.content, end="", file=output)
+    with writer.chunked(output) as out:
+        if not is_sorted:
+            tasks = utils.sort_tasks(tasks)
+
+        for task in tasks:
+            out.line("***")
+            out.line("task", utils.task_id_str(task.task_id))
+            out.line("label", task.label)
+            out.line("status", str(task.status))
+            if task.priority is not None:
+                out.line(
+                    "priority",
+                    task.priority if utils.is_valued(task.priority) else "none",
+                )
+            if task.deadline is not None:
+                out.line(
+                    "deadline",
+                    task.deadline.isoformat()
+                    if utils.is_valued(task.deadline)
+                    else "none",
+                )
+            if task.depends:
+                out.line(
+                    "depends",
+                    " ".join(utils.task_id_str(dep) for dep in sorted(task.depends)),
+                )
+            out.line("***")
+            out.write(task.content)
 
 
-def export_task_list(tasks: List[utils.Task], output: IO):
+class NoteRenderer:
     """
-    Exports information about tasks only without any front matter. Meant for
-    use with other exporters.
+    Converts task notes from Markdown into HTML. A single converter is kept for
+    all tasks and reset between them, instead of building a new one (and
+    loading all of its extensions again) for every task.
     """
-    for task in tasks:
-        print(
-            "<h1 id='{}'>".format(utils.task_id_str(task.task_id)),
-            utils.task_id_str(task.task_id),
-            html.escape(task.label),
-            "</h1>",
-            file=output,
-        )
-        print("<div><table>", file=output)
-        print("<tr>", file=output)
-        print("<th>ID</th>", file=output)
-        print("<th>Status</th>", file=output)
-        print("<th>Priority</th>", file=output)
-        print("<th>Deadline</th>", file=output)
-        print("<th>Dependencies</th>", file=output)
-        print("</tr>", file=output)
-        print("<td>", utils.task_id_str(task.task_id), "</td>", file=output)
-        print("<td>", task_status_color(task.status), "</td>", file=output)
-        print(
-            "<td>",
-            task.priority if utils.is_valued(task.priority) else "Unassigned",
-            "</td>",
-            file=output,
-        )
-        print(
-            "<td>",
-            task.deadline.isoformat()
-            if utils.is_valued(task.deadline)
-            else "Unassigned",
-            "</td>",
-            file=output,
-        )
-        print(
-            "<td>",
-            ", ".join(task_id_link(dep) for dep in sorted(task.depends)),
-            "</td>",
-            file=output,
+
+    def __init__(
+        self,
+        extensions: Iterable[str] = (),
+        fragments: Optional[cache.FragmentCache] = None,
+    ):
+        self.extensions = list(extensions)
+        self.fragments = fragments
+        with profiling.stage("markdown_setup"):
+            self.converter = markdown.Markdown(extensions=self.extensions)
+
+    def convert(self, content: str) -> str:
+        """
+        Converts Markdown into HTML without going through the fragment cache.
+        """
+        with profiling.stage("markdown"):
+            try:
+                return self.converter.convert(content)
+            finally:
+                self.converter.reset()
+
+    def render(self, content: str) -> str:
+        """
+        Converts Markdown into HTML, reusing the previously rendered HTML from
+        the fragment cache if there is one.
+        """
+        if self.fragments is None:
+            return self.convert(content)
+
+        return self.fragments.render(
+            cache.FragmentCache.key("notes", ",".join(self.extensions), content),
+            lambda: self.convert(content),
         )
-        print("</tr>", file=output)
-        print("</table></div>", file=output)
-        if task.content:
-            print("<h2>Notes</h2>", file=output)
-            print(markdown.markdown(task.content, file=output), file=output)
 
 
-def export_table_of_contents(
-    task_map: Mapping[Tuple[int], utils.Task], output: IO, fold: bool
+def export_task_list(
+    tasks: List[utils.Task],
+    output: IO,
+    renderer: Optional[NoteRenderer] = None,
+    graph: Optional[depgraph.DependencyGraph] = None,
 ):
     """
-    Exports a task list into HTML without doing any restructuring, similar to
-    the plain_exporter.
+    Exports information about tasks only without any front matter. Meant for
+    use with other exporters. If the dependency graph has already been built,
+    the dependencies are taken from it.
     """
-    tasks = utils.sort_tasks(task_map.values())
-    if fold:
-        foldable = utils.find_foldable_tasks(tasks)
-    else:
-        foldable = set()
+    if renderer is None:
+        renderer = NoteRenderer()
+
+    with writer.chunked(output) as out:
+        for task in tasks:
+            out.line(
+                "<h1 id='{}'>".format(utils.task_id_str(task.task_id)),
+                utils.task_id_str(task.task_id),
+                html.escape(task.label),
+                "</h1>",
+            )
+            out.line("<div><table>")
+            out.line("<tr>")
+            out.line("<th>ID</th>")
+            out.line("<th>Status</th>")
+            out.line("<th>Priority</th>")
+            out.line("<th>Deadline</th>")
+            out.line("<th>Dependencies</th>")
+            out.line("</tr>")
+            out.line("<td>", utils.task_id_str(task.task_id), "</td>")
+            out.line("<td>", task_status_color(task.status), "</td>")
+            out.line(
+                "<td>",
+                task.priority if utils.is_valued(task.priority) else "Unassigned",
+                "</td>",
+            )
+            out.line(
+                "<td>",
+                task.deadline.isoformat()
+                if utils.is_valued(task.deadline)
+                else "Unassigned",
+                "</td>",
+            )
+            if graph is not None:
+                depends = graph.forward[task.task_id]
+            else:
+                depends = sorted(task.depends)
 
-    print("<h1> Table of Contents </h1>", file=output)
-    depth = 0
-    fold_depth = -1
-    for task in tasks:
-        if fold_depth != -1 and len(task.task_id) > fold_depth:
-            continue
+            out.line("<td>", ", ".join(task_id_link(dep) for dep in depends), "</td>")
+            out.line("</tr>")
+            out.line("</table></div>")
+            # Notes may be read from the task file each time they're used, so
+            # they're only read once
+            content = task.content
+            if content:
+                out.line("<h2>Notes</h2>")
+                out.line(renderer.render(content))
 
+
+def export_table_of_contents(
+    task_map: Mapping[Tuple[int], utils.Task],
+    output: IO,
+    fold: bool,
+    foldable: Optional[Set[Tuple[int]]] = None,
+    graph: Optional[depgraph.DependencyGraph] = None,
+):
+    """
+    Exports a task list into HTML without doing any restructuring, similar to
+    the plain_exporter. If the foldable tasks or the dependency graph have
+    already been found, they can be given instead of being found again.
+    """
+    with writer.chunked(output) as out:
+        tasks = utils.sort_tasks(task_map.values())
+        if not fold:
+            foldable = set()
+        elif foldable is None:
+            foldable = utils.find_foldable_tasks(tasks)
+
+        if graph is None:
+            graph = depgraph.DependencyGraph(task_map)
+
+        out.line("<h1> Table of Contents </h1>")
+        depth = 0
         fold_depth = -1
-        while depth < len(task.task_id):
-            print("<ol class='toc'>", file=output)
-            depth += 1
+        for task in tasks:
+            if fold_depth != -1 and len(task.task_id) > fold_depth:
+                continue
+
+            fold_depth = -1
+            while depth < len(task.task_id):
+                out.line("<ol class='toc'>")
+                depth += 1
+
+            while depth > len(task.task_id):
+                out.line("</ol>")
+                depth -= 1
+
+            if task.status == utils.TaskStatus.BLOCKED:
+                blockers = graph.blockers.get(task.task_id)
+                if blockers:
+                    short_line = "{} on {}".format(
+                        task_status_color(task.status),
+                        ", ".join(task_id_link(dep) for dep in blockers),
+                    )
+                else:
+                    short_line = task_status_color(task.status)
+            elif task.status == utils.TaskStatus.TODO:
+                if not utils.is_valued(task.deadline):
+                    short_line = task_status_color(task.status)
+                else:
+                    short_line = "{} by {}".format(
+                        task_status_color(task.status), task.deadline.isoformat()
+                    )
+            elif task.status == utils.TaskStatus.DONE:
+                short_line = task_status_color(task.status)
+            elif task.status == utils.TaskStatus.IN_PROGRESS:
+                if not utils.is_valued(task.deadline):
+                    short_line = task_status_color(task.status)
+                else:
+                    short_line = "{} due by {}".format(
+                        task_status_color(task.status), task.deadline.isoformat()
+                    )
+            else:
+                short_line = "Unknown status {}".format(task.status)
+
+            out.line(
+                "<li><strong style='font-size: 1.5em'>",
+                task_id_link(task.task_id),
+                html.escape(task.label),
+                "</strong>",
+                short_line,
+                "</li>",
+            )
+
+            if task.task_id in foldable:
+                fold_depth = depth
 
-        while depth > len(task.task_id):
-            print("</ol>", file=output)
+        while depth > 0:
+            out.line("</ol>")
             depth -= 1
 
-        if task.status == utils.TaskStatus.BLOCKED:
-            blockers = [
-                task_map[dep]
-                for dep in sorted(task.depends)
-                if task_map[dep].status != utils.TaskStatus.DONE
-            ]
-            if blockers:
-                short_line = "{} on {}".format(
-                    task_status_color(task.status),
-                    ", ".join(task_id_link(dep.task_id) for dep in blockers),
-                )
-            else:
-                short_line = task_status_color(task.status)
-        elif task.status == utils.TaskStatus.TODO:
-            if not utils.is_valued(task.deadline):
-                short_line = task_status_color(task.status)
-            else:
-                short_line = "{} by {}".format(
-                    task_status_color(task.status), task.deadline.isoformat()
-                )
-        elif task.status == utils.TaskStatus.DONE:
-            short_line = task_status_color(task.status)
-        elif task.status == utils.TaskStatus.IN_PROGRESS:
-            if not utils.is_valued(task.deadline):
-                short_line = task_status_color(task.status)
-            else:
-                short_line = "{} due by {}".format(
-                    task_status_color(task.status), task.deadline.isoformat()
-                )
-        else:
-            short_line = "Unknown status {}".format(task.status)
-
-        print(
-            "<li><strong style='font-size: 1.5em'>",
-            task_id_link(task.task_id),
-            html.escape(task.label),
-            "</strong>",
-            short_line,
-            "</li>",
-            file=output,
-        )
 
-        if task.task_id in foldable:
-            fold_depth = depth
+def export_calendar_month(
+    month: datetime.date,
+    tasks_by_date: Mapping[datetime.date, List[utils.Task]],
+    out: writer.ChunkWriter,
+):
+    """
+    Exports a single month of the calendar, listing the tasks due on each day.
+    """
+    out.line("<h1> {} {} </h1>".format(calendar.month_name[month.month], month.year))
+    out.line("<table>")
+    out.line("<tr>")
+    for day_name in DAY_NAMES:
+        out.line("<th> {} </th>".format(day_name))
+    out.line("</tr>")
+
+    for week in calendar.monthcalendar(month.year, month.month):
+        out.line("<tr>")
+        for day in week:
+            if day == 0:
+                out.line("<td></td>")
+                continue
+
+            tasks = tasks_by_date.get(month.replace(day=day))
+            if not tasks:
+                out.line("<td class='calendar'><b>", day, "</b></td>")
+                continue
+
+            out.line("<td class='calendar'><b>", day, "</b>")
+            for task in tasks:
+                out.line("<div>")
+                out.line(
+                    "{} {}".format(task_id_link(task.task_id), html.escape(task.label))
+                )
+                out.line("</div>")
+            out.line("</td>")
+        out.line("</tr>")
 
-    while depth > 0:
-        print("</ol>", file=output)
-        depth -= 1
+    out.line("</table>")
 
 
-def export_calendar(task_map: Mapping[Tuple[int], utils.Task], output: IO):
+def export_calendar(
+    task_map: Mapping[Tuple[int], utils.Task], output: IO, collapse: bool = False
+):
     """
-    Exports a task list into a basic calendar view.
+    Exports a task list into a basic calendar view, covering every month from
+    the earliest deadline to the latest. If collapse is set, then each run of
+    months without any deadlines is replaced by a single heading.
     """
-    tasks = utils.sort_tasks(task_map.values())
-    tasks_with_deadline = (
-        task
-        for task in tasks
-        if utils.is_valued(task.deadline) and task.status != utils.TaskStatus.DONE
-    )
-    tasks_by_deadline = sorted(tasks_with_deadline, key=lambda task: task.deadline)
+    with writer.chunked(output) as out:
+        tasks_by_date = defaultdict(list)
+        for task in utils.sort_tasks(task_map.values()):
+            if utils.is_valued(task.deadline) and task.status != utils.TaskStatus.DONE:
+                tasks_by_date[task.deadline].append(task)
+
+        if not tasks_by_date:
+            out.line("<h1> No Active Tasks Have A Deadline</h1>")
+            return
+
+        active_months = {utils.first_day_of_month(date) for date in tasks_by_date}
+        if collapse:
+            months = sorted(active_months)
+        else:
+            months = []
+            month = min(active_months)
+            last_month = max(active_months)
+            while month <= last_month:
+                months.append(month)
+                month = utils.first_day_of_next_month(month)
+
+        previous = None
+        for month in months:
+            if previous is not None:
+                next_month = utils.first_day_of_next_month(previous)
+                if next_month != month:
+                    skipped_to = utils.first_day_of_month(
+                        month - datetime.timedelta(days=1)
+                    )
+                    if next_month == skipped_to:
+                        out.line(
+                            "<h1> No Deadlines In {} {} </h1>".format(
+                                calendar.month_name[next_month.month], next_month.year
+                            )
+                        )
+                    else:
+                        out.line(
+                            "<h1> No Deadlines From {} {} To {} {} </h1>".format(
+                                calendar.month_name[next_month.month],
+                                next_month.year,
+                                calendar.month_name[skipped_to.month],
+                                skipped_to.year,
+                            )
+                        )
+
+            export_calendar_month(month, tasks_by_date, out)
+            previous = month
+
+
+def export_critical_path(
+    task_map: Mapping[Tuple[int], utils.Task],
+    output: IO,
+    graph: depgraph.DependencyGraph,
+    today: datetime.date,
+    task_days: int = 1,
+    shown: Optional[Container[Tuple[int]]] = None,
+):
+    """
+    Exports the critical path analysis of the open tasks: the longest chain of
+    work leading up to each deadline, and how much each open task can slip
+    before a deadline is missed. Tasks which can't be finished in time are
+    highlighted. If only some of the tasks are shown, the schedule still
+    depends on all of them.
+    """
+    schedule = critical.Schedule(task_map, graph, today, task_days)
 
-    if not tasks_by_deadline:
-        print("<h1> No Active Tasks Have A Deadline</h1>", file=output)
-    else:
-        current_date = utils.first_day_of_month(tasks_by_deadline[0].deadline)
-        current_weekday = calendar.weekday(
-            current_date.year, current_date.month, current_date.day
+    def slack_key(task_id: Tuple[int]) -> Tuple[bool, int, Tuple[int]]:
+        slack = schedule.slack.get(task_id)
+        return (slack is None, slack or 0, task_id)
+
+    def row_start(task_id: Tuple[int]) -> str:
+        if schedule.slack.get(task_id, 0) < 0:
+            return "<tr style='background-color: salmon'>"
+
+        return "<tr>"
+
+    def task_cell(task: utils.Task) -> str:
+        return "<td>{} {}</td>".format(
+            task_id_link(task.task_id), html.escape(task.label)
         )
-        first_day = True
-        new_month = True
-        new_week = True
-
-        while tasks_by_deadline:
-            next_task = tasks_by_deadline.pop(0)
-
-            while current_date <= next_task.deadline:
-                if not first_day:
-                    print("</td>", file=output)
-
-                if new_month:
-                    if not first_day:
-                        filler_weekday = current_weekday
-                        while filler_weekday < 7:
-                            print("<td></td>", file=output)
-                            filler_weekday += 1
-
-                        print("</tr>", file=output)
-                        print("</table>", file=output)
-
-                    first_day = False
-                    print(
-                        "<h1> {} {} </h1>".format(
-                            calendar.month_name[current_date.month], current_date.year
-                        ),
-                        file=output,
-                    )
-                    print("<table>", file=output)
-                    print("<tr>", file=output)
-                    print("<th> Monday </th>", file=output)
-                    print("<th> Tuesday </th>", file=output)
-                    print("<th> Wednesday </th>", file=output)
-                    print("<th> Thursday </th>", file=output)
-                    print("<th> Friday </th>", file=output)
-                    print("<th> Saturday </th>", file=output)
-                    print("<th> Sunday </th>", file=output)
-                    print("</tr>", file=output)
-
-                    new_week = False
-                    new_month = False
-                    print("<tr>", file=output)
-                    for _ in range(current_weekday):
-                        print("<td></td>", file=output)
-
-                if new_week:
-                    print("</tr>", file=output)
-                    print("<tr>", file=output)
-                    new_week = False
-
-                print("<td class='calendar'><b>", current_date.day, "</b>", file=output)
-
-                current_weekday += 1
-                if current_weekday == 7:
-                    current_weekday = 0
-                    new_week = True
-
-                current_date += datetime.timedelta(days=1)
-                if current_date.day == 1:
-                    new_month = True
-
-            print("<div>", file=output)
-            print(
-                "{} {}".format(
-                    task_id_link(next_task.task_id), html.escape(next_task.label)
-                ),
-                file=output,
+
+    with writer.chunked(output) as out:
+        # Only the tasks which set their own deadline are listed, since the
+        # rest share their chain with the task they inherit it from
+        targets = [
+            task_id
+            for (task_id, deadline) in schedule.deadlines.items()
+            if task_id in schedule.open
+            and task_id in schedule.earliest_finish
+            and schedule.deadlines.get(utils.task_id_parent(task_id)) != deadline
+            and (shown is None or task_id in shown)
+        ]
+
+        out.line("<h1> Deadlines </h1>")
+        if not targets:
+            out.line("<p> No open tasks have a deadline. </p>")
+        else:
+            out.line("<table>")
+            out.line(
+                "<tr><th>Task</th><th>Deadline</th><th>Earliest Finish</th>",
+                "<th>Slack (Days)</th><th>Chain Length</th><th>Longest Chain</th></tr>",
+            )
+            for task_id in sorted(targets, key=slack_key):
+                chain = list(schedule.chain_to(task_id))
+                chain.reverse()
+                out.line(row_start(task_id))
+                out.line(task_cell(task_map[task_id]))
+                out.line("<td>", schedule.deadlines[task_id].isoformat(), "</td>")
+                out.line("<td>", schedule.earliest_finish[task_id].isoformat(), "</td>")
+                out.line("<td>", schedule.slack[task_id], "</td>")
+                out.line("<td>", schedule.chain_length[task_id], "</td>")
+                out.line(
+                    "<td>", " &rarr; ".join(task_id_link(dep) for dep in chain), "</td>"
+                )
+                out.line("</tr>")
+            out.line("</table>")
+
+        scheduled = [
+            task_id
+            for task_id in schedule.earliest_finish
+            if task_id in schedule.open and (shown is None or task_id in shown)
+        ]
+        out.line("<h1> Open Tasks </h1>")
+        out.line("<table>")
+        out.line(
+            "<tr><th>Task</th><th>Status</th><th>Deadline</th>",
+            "<th>Earliest Start</th><th>Latest Start</th><th>Slack (Days)</th></tr>",
+        )
+        for task_id in sorted(scheduled, key=slack_key):
+            task = task_map[task_id]
+            deadline = schedule.deadlines.get(task_id)
+            latest = schedule.latest_start.get(task_id)
+            slack = schedule.slack.get(task_id)
+            out.line(row_start(task_id))
+            out.line(task_cell(task))
+            out.line("<td>", task_status_color(task.status), "</td>")
+            out.line(
+                "<td>",
+                deadline.isoformat() if deadline is not None else "Unassigned",
+                "</td>",
+            )
+            out.line("<td>", schedule.earliest_start[task_id].isoformat(), "</td>")
+            out.line(
+                "<td>",
+                latest.isoformat() if latest is not None else "Unconstrained",
+                "</td>",
             )
-            print("</div>", file=output)
-
-        print("</td>", file=output)
-
-        # If the last task doesn't end on a month boundary, then fill out the rest
-        # of the month
-        if not new_month:
-            end_of_month = utils.first_day_of_next_month(
-                current_date
-            ) - datetime.timedelta(days=1)
-            while current_date <= end_of_month:
-                if new_week:
-                    print("</tr>", file=output)
-                    print("<tr>", file=output)
-                    new_week = False
-
-                print(
-                    "<td class='calendar'><b>",
-                    current_date.day,
-                    "</b></td>",
-                    file=output,
+            out.line("<td>", slack if slack is not None else "Unconstrained", "</td>")
+            out.line("</tr>")
+        out.line("</table>")
+
+        if graph.cycles:
+            out.line("<h1> Unscheduled Tasks </h1>")
+            out.line("<p> These tasks depend on each other in a cycle: </p>")
+            out.line("<ul>")
+            for cycle in graph.cycles:
+                out.line(
+                    "<li>",
+                    ", ".join(task_id_link(task_id) for task_id in cycle),
+                    "</li>",
                 )
+            out.line("</ul>")
 
-                current_weekday += 1
-                if current_weekday == 7:
-                    current_weekday = 0
-                    new_week = True
 
-                current_date += datetime.timedelta(days=1)
+def export_section(
+    out: writer.ChunkWriter,
+    name: str,
+    export: Callable[[IO], None],
+    sections: Optional[Dict[str, writer.ChunkList]] = None,
+):
+    """
+    Exports one component of an HTML view, profiled as a stage with the same
+    name. If a dictionary of sections is given, the component is only rendered
+    the first time and its HTML is kept in the dictionary, so that other views
+    of the same tasks can reuse it.
+    """
+    if sections is None:
+        with profiling.stage(name):
+            export(out)
+        return
 
-            # Fill in empty cells to contain he last week
-            while current_weekday < 7:
-                print("<td></td>", file=output)
-                current_weekday += 1
+    section = sections.get(name)
+    if section is None:
+        section = sections[name] = writer.ChunkList()
+        with profiling.stage(name):
+            with writer.chunked(section) as section_out:
+                export(section_out)
 
-        print("</tr></table>", file=output)
+    for chunk in section:
+        out.write(chunk)
 
 
 def export_html_report(
-    task_map: Mapping[Tuple[int], utils.Task], output: IO, config: ExportConfig
+    task_map: Mapping[Tuple[int], utils.Task],
+    output: IO,
+    config: ExportConfig,
+    renderer: Optional[NoteRenderer] = None,
+    foldable: Optional[Set[Tuple[int]]] = None,
+    graph: Optional[depgraph.DependencyGraph] = None,
+    sections: Optional[Dict[str, writer.ChunkList]] = None,
+    index: Optional[query.TaskIndex] = None,
 ):
     """
-    Exports a task list into an HTML view, with different components.
+    Exports a task list into an HTML view, with different components. The
+    dependency graph is built once and shared between the components, unless
+    it has already been built. Components are shared between views through
+    the sections dictionary, if one is given (see export_section).
+
+    If the configuration has a filter, only the tasks which match it are
+    shown. The filter is evaluated against the index, which is built if it
+    isn't given.
     """
-    if config.include_refresh:
-        print(
-            HTML_HEADER.replace("%REFRESH%", '<meta http-equiv="refresh" content="5">'),
-            file=output,
-        )
-    else:
-        print(HTML_HEADER.replace("%REFRESH%", ""), file=output)
-
-    if config.include_toc:
-        export_table_of_contents(task_map, output, config.fold_toc)
-        print("<hr>", file=output)
-
-    if config.include_calendar:
-        export_calendar(task_map, output)
-        print("<hr>", file=output)
-
-    if config.include_summary:
-        export_task_list(utils.sort_tasks(task_map.values()), output)
+    if renderer is None:
+        renderer = NoteRenderer(config.markdown_extensions)
+
+    if graph is None:
+        with profiling.stage("dependencies"):
+            graph = depgraph.DependencyGraph(task_map)
+
+    today = config.today or datetime.date.today()
+    shown = task_map
+    if config.task_filter is not None:
+        with profiling.stage("filter"):
+            if index is None:
+                index = query.TaskIndex(task_map)
+            shown = config.task_filter.select(index, today)
+
+    with writer.chunked(output) as out:
+        if config.include_refresh:
+            refresh = REFRESH_SNIPPETS[config.refresh_mode].replace(
+                "%TOKEN%", json.dumps(config.refresh_token)
+            )
+            out.line(HTML_HEADER.replace("%REFRESH%", refresh))
+        else:
+            out.line(HTML_HEADER.replace("%REFRESH%", ""))
+
+        if config.include_toc:
+            export_section(
+                out,
+                "toc",
+                lambda section_out: export_table_of_contents(
+                    shown, section_out, config.fold_toc, foldable, graph
+                ),
+                sections,
+            )
+            out.line("<hr>")
+
+        if config.include_calendar:
+            export_section(
+                out,
+                "calendar",
+                lambda section_out: export_calendar(
+                    shown, section_out, config.collapse_calendar
+                ),
+                sections,
+            )
+            out.line("<hr>")
+
+        if config.include_critical:
+            export_section(
+                out,
+                "critical",
+                lambda section_out: export_critical_path(
+                    task_map,
+                    section_out,
+                    graph,
+                    today,
+                    config.task_days,
+                    None if config.task_filter is None else shown,
+                ),
+                sections,
+            )
+            out.line("<hr>")
+
+        if config.include_summary:
+            export_section(
+                out,
+                "summary",
+                lambda section_out: export_task_list(
+                    utils.sort_tasks(shown.values()), section_out, renderer, graph
+                ),
+                sections,
+            )
 
-    print(HTML_FOOTER.replace("%TAIL%", config.body_suffix or ""), file=output)
+        out.line(HTML_FOOTER.replace("%TAIL%", config.body_suffix or ""))
@@ -2,92 +2,168 @@
 Processes Markdown files containing Task Burrito annotations into a series of
 Tasks.
 """
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 import datetime
+import hashlib
+import io
+import mmap
 import os.path
-from typing import Any, IO, List, Optional, Union
+from typing import Any, IO, Iterator, List, Mapping, Optional, Set, Tuple, Union
 
-from task_burrito import utils
+from task_burrito import profiling, utils
 
+# Encodings where newlines and asterisks are always single bytes with their
+# ASCII values, so that task files can be scanned without decoding them
+SCANNABLE_ENCODINGS = {"utf-8", "ascii", "iso8859-1", "cp1252"}
 
-def parse_task_property(
-    prop: str, value: str, logger: utils.Logger, position: utils.FilePosition
+
+def parse_task_id_value(
+    value: str, logger: utils.Logger, position: utils.FilePosition
+) -> Optional[Tuple[int]]:
+    """
+    Parses the value of a task property.
+    """
+    try:
+        return utils.parse_task_id(value)
+    except ValueError as err:
+        logger.warn(position, "{}", err.args[0])
+        return None
+
+
+def parse_label_value(
+    value: str, logger: utils.Logger, position: utils.FilePosition
+) -> Optional[str]:
+    """
+    Parses the value of a label property.
+    """
+    if not value:
+        logger.warn(position, "Task label cannot be empty")
+        return None
+
+    return value
+
+
+def parse_status_value(
+    value: str, logger: utils.Logger, position: utils.FilePosition
+) -> Optional[utils.TaskStatus]:
+    """
+    Parses the value of a status property.
+    """
+    value = value.upper()
+    status = STATUS_VALUES.get(value)
+    if status is None:
+        logger.warn(position, "Invalid status value '{}'", value)
+
+    return status
+
+
+def parse_priority_value(
+    value: str, logger: utils.Logger, position: utils.FilePosition
 ) -> Optional[Any]:
     """
-    Parses and validates a value for the given task property, and returns its
-    parsed form if it is valid.
+    Parses the value of a priority property.
     """
-    if prop == "task":
-        try:
-            return utils.parse_task_id(value)
-        except ValueError as err:
-            logger.warn(position, "{}", err.args[0])
-            return None
+    priority = PRIORITY_VALUES.get(value)
+    if priority is not None:
+        return priority
+
+    try:
+        if value.lower() == "none":
+            return utils.NOT_PROVIDED
 
-    elif prop == "label":
-        if not value:
-            logger.warn(position, "Task label cannot be empty")
+        priority = int(value)
+        if priority not in range(1, 6):
+            logger.warn(position, "Priority value '{}' not in range 1..5", priority)
             return None
 
-        return value
+        return priority
+    except ValueError:
+        logger.warn(position, "Priority value '{}' must be an integer", value)
+        return None
 
-    elif prop == "status":
-        value = value.upper()
-        if value not in ("DONE", "IN-PROGRESS", "BLOCKED", "TODO"):
-            logger.warn(position, "Invalid status value '{}'", value)
-            return None
 
-        return utils.TaskStatus[value.replace("-", "_")]
+def parse_deadline_value(
+    value: str, logger: utils.Logger, position: utils.FilePosition
+) -> Optional[Any]:
+    """
+    Parses the value of a deadline property.
+    """
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        if value.lower() == "none":
+            return utils.NOT_PROVIDED
 
-    elif prop == "priority":
-        try:
-            if value.lower() == "none":
-                return utils.NOT_PROVIDED
+        logger.warn(position, "Deadline value '{}' not in format YYYY-MM-DD", value)
+        return None
 
-            priority = int(value)
-            if priority not in range(1, 6):
-                logger.warn(
-                    position, "Priority value '{}' not in range 1..5", priority
-                )
-                return None
 
-            return priority
-        except ValueError:
-            logger.warn(position, "Priority value '{}' must be an integer", value)
-            return None
+def parse_depends_value(
+    value: str, logger: utils.Logger, position: utils.FilePosition
+) -> Optional[Set[Tuple[int]]]:
+    """
+    Parses the value of a depends property.
+    """
+    tasks = value.split()
+    if not tasks:
+        logger.warn(
+            position,
+            "Depends list should be left out if there are no dependent tasks",
+        )
+        return None
 
-    elif prop == "deadline":
-        try:
-            if value.lower() == "none":
-                return utils.NOT_PROVIDED
+    try:
+        return set(map(utils.parse_task_id, tasks))
+    except ValueError:
+        pass
 
-            return datetime.date.fromisoformat(value)
-        except ValueError:
-            logger.warn(position, "Deadline value '{}' not in format YYYY-MM-DD", value)
+    # Only the first invalid ID is reported
+    for task in tasks:
+        try:
+            utils.parse_task_id(task)
+        except ValueError as err:
+            logger.warn(position, "Issue with task ID {}: {}", task, err.args[0])
             return None
 
-    elif prop == "depends":
-        tasks = value.split()
-        if not tasks:
-            logger.warn(
-                position,
-                "Depends list should be left out if there are no dependent tasks",
-            )
-            return None
 
-        task_ids = []
-        for task in tasks:
-            try:
-                task_ids.append(utils.parse_task_id(task))
-            except ValueError as err:
-                logger.warn(position, "Issue with task ID {}: {}", task, err.args[0])
-                return None
+# The task properties, and the function which parses and validates the value
+# of each one. Each function warns about an invalid value and returns None.
+PROPERTY_PARSERS = {
+    "task": parse_task_id_value,
+    "label": parse_label_value,
+    "status": parse_status_value,
+    "priority": parse_priority_value,
+    "deadline": parse_deadline_value,
+    "depends": parse_depends_value,
+}
+
+STATUS_VALUES = {
+    "DONE": utils.TaskStatus.DONE,
+    "IN-PROGRESS": utils.TaskStatus.IN_PROGRESS,
+    "BLOCKED": utils.TaskStatus.BLOCKED,
+    "TODO": utils.TaskStatus.TODO,
+}
+
+# The priorities as they're usually written, which don't need to be converted
+PRIORITY_VALUES = {str(priority): priority for priority in range(1, 6)}
 
-        return set(task_ids)
 
-    else:
+def parse_task_property(
+    prop: str, value: str, logger: utils.Logger, position: utils.FilePosition
+) -> Optional[Any]:
+    """
+    Parses and validates a value for the given task property, and returns its
+    parsed form if it is valid.
+    """
+    parse = PROPERTY_PARSERS.get(prop)
+    if parse is None:
         logger.warn(position, "Invalid task property {}", prop)
         return None
 
+    return parse(value, logger, position)
+
 
 def parse_task(
     fobj: IO, logger: utils.Logger, position: utils.FilePosition
@@ -99,63 +175,55 @@ def parse_task(
     processed and will return with the stream having read the last line of
     hyphens.
     """
-    property_words = {"task", "label", "status", "priority", "deadline", "depends"}
     properties = {}
     includes = []
 
-    is_include_block = None
+    is_include_block = False
     found_end = False
     for line in fobj:
-        line = line.strip()
         position.next_line()
 
-        if not line:
-            logger.warn(position, "Blank lines are not recommended within task blocks")
-            continue
-
-        if line == "***":
-            found_end = True
-            break
+        # The property runs up to the first space, and the rest of the line
+        # is its value. The line is already stripped, so only the start of
+        # the value needs to be.
+        line = line.strip()
+        (prop, space, raw_value) = line.partition(" ")
+        if not space:
+            if not line:
+                logger.warn(
+                    position, "Blank lines are not recommended within task blocks"
+                )
+            elif line == "***":
+                found_end = True
+                break
+            else:
+                logger.warn(position, "Ignoring non-property line within task block")
 
-        try:
-            prop_end = line.index(" ")
-            prop = line[:prop_end]
-            raw_value = line[prop_end + 1 :].strip()
+            continue
 
+        raw_value = raw_value.lstrip()
+        parse = PROPERTY_PARSERS.get(prop)
+        if parse is None:
             if prop.lower() == "include":
-                if is_include_block is None:
-                    is_include_block = True
-                elif not is_include_block:
-                    logger.warn(position, "Ignoring include in a non-include block")
-                    continue
-
+                is_include_block = True
                 includes.append(raw_value)
-
-            elif prop not in property_words:
+            else:
                 logger.warn(
                     position, "Unexpected property type '{}' in task block", prop
                 )
-                continue
 
-            elif prop in properties:
-                logger.warn(
-                    position, "Duplicate property '{}' not allowed in task block", prop
-                )
-                continue
-
-            elif is_include_block:
-                logger.warn(
-                    position, "Ignoring non-include property in an include block"
-                )
-                continue
+        elif prop in properties:
+            logger.warn(
+                position, "Duplicate property '{}' not allowed in task block", prop
+            )
 
-            else:
-                value = parse_task_property(prop, raw_value, logger, position)
-                if value is not None:
-                    properties[prop] = value
+        elif is_include_block:
+            logger.warn(position, "Ignoring non-include property in an include block")
 
-        except ValueError:
-            logger.warn(position, "Ignoring non-property line within task block")
+        else:
+            value = parse(raw_value, logger, position)
+            if value is not None:
+                properties[prop] = value
 
     if not found_end:
         logger.warn(position, "Unexpected task block at end of file")
@@ -185,42 +253,64 @@ def parse_task(
     )
 
 
-def parse_file(fobj: IO, base_dir: str, logger: utils.Logger) -> List[utils.Task]:
+@dataclass
+class ParsedFile:
     """
-    Parses the contents of a task file and returns each task along with the
-    notes associated with it.
+    The result of parsing a single task file, without following its includes.
+
+    Warnings and includes are recorded along with the line they were found on,
+    so that they can be replayed later (possibly from the parse cache) in the
+    same order that a fresh parse would report them.
+    """
+
+    tasks: List[utils.Task]
+    includes: List[Tuple[int, str]] = field(default_factory=list)
+    warnings: List[Tuple[int, str]] = field(default_factory=list)
+    error: Optional[Exception] = None
+
+
+class RecordingLogger(utils.Logger):
+    """
+    A logger which holds onto warnings instead of writing them, so that they
+    can be stored in a ParsedFile. Errors are passed through immediately.
+    """
+
+    def __init__(self, logger: utils.Logger):
+        super().__init__(None, logger.error_output)
+        self.warnings = []
+
+    def warn(self, position: utils.FilePosition, fmt: str, *args: Any, **kwargs: Any):
+        """
+        Records a warning about a specific location in the input file.
+        """
+        self.warnings.append((position.line, fmt.format(*args, **kwargs)))
+
+
+def iter_file_blocks(
+    fobj: IO, logger: utils.Logger
+) -> Iterator[Union[utils.Task, Tuple[int, str]]]:
+    """
+    Parses the blocks within a single task file one at a time, yielding each
+    task once its notes have been read, and the line and path of each include
+    (which is not followed).
     """
     position = utils.FilePosition(fobj.name)
     current_task = None
     current_content = []
-    tasks = []
-    includes = []
 
     for line in fobj:
         position.next_line()
         if line.strip() == "***":
             if current_task is not None:
                 current_task.content = "".join(current_content)
-                tasks.append(current_task)
                 current_content.clear()
+                yield current_task
 
-            result = parse_task(fobj, logger, position)
+            with profiling.stage("parse_task"):
+                result = parse_task(fobj, logger, position)
             if isinstance(result, list):
                 for include in result:
-                    abs_include = (
-                        include
-                        if os.path.isabs(include)
-                        else os.path.join(base_dir, include)
-                    )
-                    if not os.path.isfile(abs_include):
-                        logger.warn(
-                            position,
-                            "Referenced include '{}' does not exist".format(
-                                abs_include
-                            ),
-                        )
-                    else:
-                        includes.append(abs_include)
+                    yield (position.line, include)
                 current_task = None
             else:
                 current_task = result
@@ -231,11 +321,412 @@ def parse_file(fobj: IO, base_dir: str, logger: utils.Logger) -> List[utils.Task
 
     if current_task is not None:
         current_task.content = "".join(current_content)
-        tasks.append(current_task)
         current_content.clear()
+        yield current_task
+
 
-    for include in includes:
-        with open(include) as include_fobj:
-            tasks += parse_file(include_fobj, base_dir, logger)
+def map_contents(
+    fobj: IO,
+) -> Optional[Tuple[Any, Optional[str], Tuple[int, int]]]:
+    """
+    Gets the undecoded contents of a task file, as a memory map of the file
+    (or its bytes, if it has already been read into memory), so that it can
+    be scanned for blocks without decoding every line. The path of the file
+    (or None if it can't be opened again by its name) and its modification
+    time and size are returned along with it, so that notes can be read from
+    the file later. Returns None if the file can only be read as text.
+    """
+    if not isinstance(fobj, io.TextIOWrapper):
+        return None
 
+    try:
+        if codecs.lookup(fobj.encoding).name not in SCANNABLE_ENCODINGS:
+            return None
+
+        buffer = fobj.buffer
+        if isinstance(buffer, io.BytesIO):
+            # This is the contents of the file that was read by the parse
+            # cache, which is still on disk
+            if buffer.tell() != 0:
+                return None
+
+            data = buffer.getvalue()
+            stat = os.stat(buffer.name)
+            if stat.st_size != len(data):
+                return None
+        else:
+            if not fobj.seekable() or fobj.tell() != 0:
+                return None
+
+            stat = os.fstat(buffer.fileno())
+            if stat.st_size == 0:
+                data = b""
+            else:
+                data = mmap.mmap(buffer.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, LookupError, AttributeError, TypeError):
+        return None
+
+    # Reading the file as text turns \r and \r\n into \n, which the scan
+    # doesn't do
+    if data.find(b"\r") != -1:
+        return None
+
+    # Notes can only be read again later if the stream is a file that can be
+    # found by its name, which isn't true of stdin (even when it's redirected
+    # from a file)
+    path = None
+    if isinstance(fobj.name, str):
+        try:
+            path_stat = os.stat(fobj.name)
+            if (path_stat.st_dev, path_stat.st_ino) == (stat.st_dev, stat.st_ino):
+                path = os.path.abspath(fobj.name)
+        except OSError:
+            pass
+
+    return (data, path, (stat.st_mtime_ns, stat.st_size))
+
+
+def find_delimiter(data: Any, offset: int, encoding: str) -> Optional[Tuple[int, int]]:
+    """
+    Finds the first line at or after the offset (which must be the start of a
+    line) that delimits a block, returning the offsets of its start and end.
+    The end does not include the newline.
+    """
+    while True:
+        found = data.find(b"***", offset)
+        if found == -1:
+            return None
+
+        newline = data.rfind(b"\n", offset, found)
+        start = offset if newline == -1 else newline + 1
+        end = data.find(b"\n", found)
+        if end == -1:
+            end = len(data)
+
+        if data[start:end].decode(encoding).strip() == "***":
+            return (start, end)
+
+        offset = end + 1
+
+
+def decode_lines(data: Any, start: int, end: int, encoding: str) -> List[str]:
+    """
+    Decodes a run of whole lines from the file, without their newlines.
+    """
+    lines = data[start:end].decode(encoding).split("\n")
+    if lines[-1] == "":
+        lines.pop()
+
+    return lines
+
+
+def iter_mapped_blocks(
+    data: Any,
+    name: str,
+    encoding: str,
+    logger: utils.Logger,
+    path: Optional[str],
+    stamp: Tuple[int, int],
+) -> Iterator[Union[utils.Task, Tuple[int, str]]]:
+    """
+    The same as iter_file_blocks, but scans the undecoded contents of the file
+    for block delimiters instead of reading it line by line. Only the lines
+    within each block are decoded. Notes are kept as LazyText references into
+    the file at the given path, which are only read when they are used, or
+    as text if there is no path.
+    """
+    position = utils.FilePosition(name)
+    current_task = None
+    offset = 0
+    while offset < len(data):
+        delimiter = find_delimiter(data, offset, encoding)
+        region_end = len(data) if delimiter is None else delimiter[0]
+        if current_task is not None:
+            region = data[offset:region_end]
+            if path is None:
+                current_task.content = region.decode(encoding)
+            else:
+                current_task.content = utils.LazyText(
+                    path,
+                    offset,
+                    region_end,
+                    encoding,
+                    stamp,
+                    hashlib.blake2b(region, digest_size=16).digest(),
+                    current_task.task_id,
+                )
+            position.next_line(region.count(b"\n"))
+            if region and not region.endswith(b"\n"):
+                position.next_line()
+        else:
+            for _ in decode_lines(data, offset, region_end, encoding):
+                position.next_line()
+                logger.warn(position, "Ignoring content that does not belong to a task")
+
+        if delimiter is None:
+            break
+
+        position.next_line()
+        if current_task is not None:
+            yield current_task
+            current_task = None
+
+        # The block runs up to and including the next delimiter, which closes
+        # it (unless the file ends first)
+        block_start = delimiter[1] + 1
+        closing = find_delimiter(data, block_start, encoding)
+        block_end = len(data) if closing is None else closing[1]
+        with profiling.stage("parse_task"):
+            result = parse_task(
+                iter(decode_lines(data, block_start, block_end, encoding)),
+                logger,
+                position,
+            )
+
+        if isinstance(result, list):
+            for include in result:
+                yield (position.line, include)
+        else:
+            current_task = result
+
+        offset = block_end + 1
+
+    if current_task is not None:
+        yield current_task
+
+
+def locate_notes(data: bytes, encoding: str) -> Mapping[Tuple[int], Tuple[int, int]]:
+    """
+    Finds the start and end of each task's notes within the contents of a task
+    file, ignoring any problems with the file.
+    """
+    logger = utils.Logger(io.StringIO(), io.StringIO())
+    notes = {}
+    try:
+        for block in iter_mapped_blocks(data, "", encoding, logger, "", (0, 0)):
+            if isinstance(block, utils.Task) and isinstance(
+                block.raw_content, utils.LazyText
+            ):
+                notes[block.task_id] = (block.raw_content.start, block.raw_content.end)
+    except (SyntaxError, ValueError):
+        pass
+
+    return notes
+
+
+def read_blocks(
+    fobj: IO, logger: utils.Logger
+) -> Iterator[Union[utils.Task, Tuple[int, str]]]:
+    """
+    Parses the blocks within a single task file one at a time, scanning the
+    file's contents directly if possible and reading it line by line if not.
+    """
+    mapped = map_contents(fobj)
+    if mapped is None:
+        return iter_file_blocks(fobj, logger)
+
+    (data, path, stamp) = mapped
+    return iter_mapped_blocks(data, fobj.name, fobj.encoding, logger, path, stamp)
+
+
+def parse_file_contents(fobj: IO, logger: utils.Logger) -> ParsedFile:
+    """
+    Parses the tasks within a single task file, recording (but not following)
+    any include blocks.
+    """
+    parsed = ParsedFile([])
+    for block in read_blocks(fobj, logger):
+        if isinstance(block, utils.Task):
+            parsed.tasks.append(block)
+        else:
+            parsed.includes.append(block)
+
+    return parsed
+
+
+def include_path(include: str, base_dir: str) -> str:
+    """
+    Gets the path of an included file, which is relative to the base directory
+    unless it is absolute.
+    """
+    return include if os.path.isabs(include) else os.path.join(base_dir, include)
+
+
+def replay_file(
+    name: str, parsed: ParsedFile, base_dir: str, logger: utils.Logger
+) -> List[Tuple[int, str]]:
+    """
+    Writes out the warnings recorded for a file, resolving its includes along
+    the way. Returns the line and path of each include which exists.
+    """
+    position = utils.FilePosition(name)
+    includes = []
+
+    # Include blocks are checked after any warnings in the block itself, which
+    # is why includes sort after warnings on the same line
+    events = sorted(
+        [(line, 0, message) for (line, message) in parsed.warnings]
+        + [(line, 1, include) for (line, include) in parsed.includes],
+        key=lambda event: event[:2],
+    )
+    for (line, is_include, value) in events:
+        position.line = line
+        if not is_include:
+            logger.warn(position, "{}", value)
+            continue
+
+        abs_include = include_path(value, base_dir)
+        if not os.path.isfile(abs_include):
+            logger.warn(
+                position, "Referenced include '{}' does not exist".format(abs_include)
+            )
+        else:
+            includes.append((line, abs_include))
+
+    return includes
+
+
+def parse_file(
+    fobj: IO,
+    base_dir: str,
+    logger: utils.Logger,
+    cache: Optional[Any] = None,
+    jobs: int = 1,
+) -> List[utils.Task]:
+    """
+    Parses the contents of a task file and returns each task along with the
+    notes associated with it.
+
+    Included files are found by walking the include graph, so that each file
+    is parsed only once no matter how many times it is included. Include
+    cycles are reported as warnings. If jobs is more than 1, then the included
+    files on each level of the graph are read and parsed concurrently. Either
+    way, the tasks and warnings are reported in the same order as if each
+    include was parsed where it appears.
+
+    If a cache is given (see task_burrito.cache.ParseCache), then files which
+    have not changed since they were last parsed are loaded from it instead of
+    being parsed again.
+    """
+
+    def parse_contents(contents: IO) -> ParsedFile:
+        recorder = RecordingLogger(logger)
+        try:
+            parsed = parse_file_contents(contents, recorder)
+        except SyntaxError as err:
+            err.warnings = recorder.warnings
+            raise
+
+        parsed.warnings = recorder.warnings
+        return parsed
+
+    def load(path: str, contents: Optional[IO] = None) -> ParsedFile:
+        # Failures are held until the file is reached while walking the
+        # include graph, so that they're reported in the usual order
+        try:
+            with profiling.stage("load_file"):
+                if cache is not None and os.path.isfile(path):
+                    return cache.parse(path, parse_contents)
+                elif contents is not None:
+                    return parse_contents(contents)
+                else:
+                    with open(path) as contents:
+                        return parse_contents(contents)
+        except (OSError, SyntaxError) as err:
+            return ParsedFile([], [], getattr(err, "warnings", []), err)
+
+    root = os.path.realpath(fobj.name)
+    parsed_files = {root: load(fobj.name, fobj)}
+
+    pending = [root]
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        while pending:
+            discovered = {}
+            for path in pending:
+                for (_, include) in parsed_files[path].includes:
+                    abs_include = include_path(include, base_dir)
+                    if not os.path.isfile(abs_include):
+                        continue
+
+                    canonical = os.path.realpath(abs_include)
+                    if canonical not in parsed_files and canonical not in discovered:
+                        discovered[canonical] = abs_include
+
+            pending = list(discovered)
+            if jobs > 1:
+                loaded = executor.map(load, discovered.values())
+            else:
+                loaded = map(load, discovered.values())
+
+            parsed_files.update(zip(pending, loaded))
+
+    tasks = []
+    visited = set()
+
+    def visit(name: str, canonical: str, including: List[str]):
+        visited.add(canonical)
+        parsed = parsed_files[canonical]
+        includes = replay_file(name, parsed, base_dir, logger)
+        if parsed.error is not None:
+            raise parsed.error
+
+        tasks.extend(parsed.tasks)
+        for (line, include) in includes:
+            include_canonical = os.path.realpath(include)
+            if include_canonical in including:
+                position = utils.FilePosition(name)
+                position.line = line
+                logger.warn(
+                    position, "Ignoring include '{}' which forms a cycle", include
+                )
+            elif include_canonical not in visited:
+                visit(include, include_canonical, including + [include_canonical])
+
+    visit(fobj.name, root, [root])
     return tasks
+
+
+def iter_tasks(fobj: IO, base_dir: str, logger: utils.Logger) -> Iterator[utils.Task]:
+    """
+    Parses the contents of a task file one task at a time, without holding
+    more than one task in memory. The tasks and warnings are the same, and in
+    the same order, as parse_file's. Included files are read after the file
+    that includes them, and any error is raised once the tasks before it have
+    been yielded.
+    """
+
+    def visit(name: str, contents: IO, including: List[str]) -> Iterator[utils.Task]:
+        position = utils.FilePosition(name)
+        includes = []
+        for block in read_blocks(contents, logger):
+            if isinstance(block, utils.Task):
+                yield block
+                continue
+
+            (position.line, include) = block
+            abs_include = include_path(include, base_dir)
+            if not os.path.isfile(abs_include):
+                logger.warn(
+                    position,
+                    "Referenced include '{}' does not exist".format(abs_include),
+                )
+            else:
+                includes.append((position.line, abs_include))
+
+        for (line, include) in includes:
+            include_canonical = os.path.realpath(include)
+            if include_canonical in including:
+                position.line = line
+                logger.warn(
+                    position, "Ignoring include '{}' which forms a cycle", include
+                )
+            elif include_canonical not in visited:
+                visited.add(include_canonical)
+                with open(include) as include_fobj:
+                    yield from visit(
+                        include, include_fobj, including + [include_canonical]
+                    )
+
+    root = os.path.realpath(fobj.name)
+    visited = {root}
+    yield from visit(fobj.name, fobj, [root])
@@ -0,0 +1,189 @@
+"""
+Measures how long each stage of building a report takes, so that slow reports
+can be traced back to the stage (such as reading includes, parsing tasks or
+converting notes) that is responsible.
+"""
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from typing import Any, ContextManager, Iterator, Mapping, Optional
+
+# The profiler which stages are recorded into, or None if profiling is off
+ACTIVE = None
+
+# Returned by stage when profiling is off, so that stages cost next to nothing
+_NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name: str) -> ContextManager:
+    """
+    Records the time spent within the block as part of the named stage, if a
+    profiler is active. Stages can be nested, and the time of a stage includes
+    any stages within it.
+    """
+    if ACTIVE is None:
+        return _NO_STAGE
+
+    return ACTIVE.stage(name)
+
+
+class Profiler:
+    """
+    Collects the wall time, call count and allocations of each stage. Stages
+    entered from several threads at once are all counted, so their times can
+    add up to more than the total.
+
+    If function_count is given, the run is also profiled with cProfile and the
+    functions with the most cumulative time are included in the report. Only
+    the thread which starts the profiler is seen by cProfile.
+    """
+
+    def __init__(self, function_count: int = 0):
+        self.function_count = function_count
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.started = None
+        self.total = 0.0
+        self.cprofile = cProfile.Profile() if function_count > 0 else None
+
+    def start(self):
+        """
+        Makes this the active profiler and starts the clock.
+        """
+        global ACTIVE
+        ACTIVE = self
+        self.started = time.perf_counter()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self):
+        """
+        Stops the clock and deactivates the profiler.
+        """
+        global ACTIVE
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+        self.total += time.perf_counter() - self.started
+        ACTIVE = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Records the time spent within the block as part of the named stage.
+        """
+        with self.lock:
+            stats = self.stages.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "allocated_blocks": 0}
+            )
+
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = sys.getallocatedblocks() - blocks
+            with self.lock:
+                stats["calls"] += 1
+                stats["seconds"] += elapsed
+                stats["allocated_blocks"] += allocated
+
+    def report(self) -> Mapping[str, Any]:
+        """
+        Builds a report of the stages (in the order they were first entered)
+        and of the slowest functions, if cProfile was used.
+        """
+        report = {
+            "total_seconds": self.total,
+            "stages": [
+                dict(name=name, **stats) for (name, stats) in self.stages.items()
+            ],
+        }
+
+        if self.cprofile is not None:
+            stats = pstats.Stats(self.cprofile)
+            functions = sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True
+            )
+            report["functions"] = [
+                {
+                    "function": "{}:{}({})".format(*function),
+                    "calls": calls,
+                    "seconds": own_time,
+                    "cumulative_seconds": cumulative_time,
+                }
+                for (
+                    function,
+                    (_, calls, own_time, cumulative_time, _),
+                ) in functions[: self.function_count]
+            ]
+
+        return report
+
+    def format_report(self) -> str:
+        """
+        Formats the report as a table for people to read.
+        """
+        report = self.report()
+        output = io.StringIO()
+        print("Profile: {:.3f}s total".format(report["total_seconds"]), file=output)
+        print(
+            "{:<16} {:>8} {:>10} {:>12}".format("stage", "calls", "seconds", "blocks"),
+            file=output,
+        )
+        for stats in report["stages"]:
+            print(
+                "{:<16} {:>8} {:>10.4f} {:>12}".format(
+                    stats["name"],
+                    stats["calls"],
+                    stats["seconds"],
+                    stats["allocated_blocks"],
+                ),
+                file=output,
+            )
+
+        if "functions" in report:
+            print(file=output)
+            print(
+                "{:>8} {:>10} {:>10}  {}".format(
+                    "calls", "seconds", "cumulative", "function"
+                ),
+                file=output,
+            )
+            for stats in report["functions"]:
+                print(
+                    "{:>8} {:>10.4f} {:>10.4f}  {}".format(
+                        stats["calls"],
+                        stats["seconds"],
+                        stats["cumulative_seconds"],
+                        stats["function"],
+                    ),
+                    file=output,
+                )
+
+        return output.getvalue()
+
+    def write_json(self, path: str):
+        """
+        Writes the report to a JSON file.
+        """
+        with open(path, "w") as fobj:
+            json.dump(self.report(), fobj, indent=2)
+
+
+def start_profiler(configs: Any) -> Optional[Profiler]:
+    """
+    Starts a profiler if profiling is enabled in the export configuration.
+    """
+    if not configs.profile:
+        return None
+
+    profiler = Profiler(configs.profile_functions)
+    profiler.start()
+    return profiler
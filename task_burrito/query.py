@@ -0,0 +1,393 @@
+"""
+Filter expressions, which narrow the tasks shown by the HTML exporters. For
+example:
+
+    status!=DONE and priority<=2 and deadline<=+14d under 3.2
+
+Filters are evaluated against secondary indexes of the tasks, so that the
+cost of a filter depends on how many tasks it matches rather than on how many
+tasks there are.
+"""
+import bisect
+import datetime
+import heapq
+import itertools
+import operator
+import re
+from typing import Any, Callable, List, Mapping, Sequence, Tuple
+
+from task_burrito import store, utils
+
+# A single condition, an "under" clause or the "and" between them
+TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<and>and)(?=\s|$)
+        | under\s+(?P<under>\S+)
+        | (?P<field>[a-z]+)\s*(?P<op>!=|<=|>=|=|<|>)\s*(?P<value>\S+)
+    )""",
+    re.VERBOSE,
+)
+
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# A deadline relative to the current date, such as +14d
+RELATIVE_DATE = re.compile(r"([+-]\d+)d")
+
+
+class TaskIndex:
+    """
+    Secondary indexes of a task tree (by status, by priority and by deadline),
+    each of which is built the first time that a filter uses it. Tasks are
+    referred to by their position in task order, which for a TaskStore is the
+    same as the store's own indexes. Subtrees don't need an index of their
+    own, since the tasks in a subtree are next to each other in task order.
+    """
+
+    def __init__(self, task_map: Mapping[Tuple[int], utils.Task]):
+        self.task_map = task_map
+        if isinstance(task_map, store.TaskStore):
+            self.count = task_map.count
+            self.ids = task_map.ids
+            self.statuses = task_map.statuses
+            self.priorities = task_map.priorities
+            self.deadlines = task_map.deadlines
+        else:
+            tasks = utils.sort_tasks(task_map.values())
+            self.count = len(tasks)
+            self.ids = [task.task_id for task in tasks]
+            self.statuses = [task.status for task in tasks]
+            self.priorities = [task.priority for task in tasks]
+            self.deadlines = [task.deadline for task in tasks]
+
+        self._by_status = None
+        self._by_priority = None
+        self._deadlines = None
+
+    @staticmethod
+    def group(values: Sequence[Any], count: int) -> Mapping[Any, List[int]]:
+        """
+        Groups the positions of the tasks by one of their fields, leaving out
+        the tasks where it has no value.
+        """
+        groups = {}
+        for (position, value) in enumerate(itertools.islice(values, count)):
+            if utils.is_valued(value):
+                groups.setdefault(value, []).append(position)
+
+        return groups
+
+    def by_status(self) -> Mapping[utils.TaskStatus, List[int]]:
+        """
+        Maps each status to the positions of the tasks with it.
+        """
+        if self._by_status is None:
+            self._by_status = self.group(self.statuses, self.count)
+
+        return self._by_status
+
+    def by_priority(self) -> Mapping[int, List[int]]:
+        """
+        Maps each priority to the positions of the tasks with it, leaving out
+        the tasks without a priority.
+        """
+        if self._by_priority is None:
+            self._by_priority = self.group(self.priorities, self.count)
+
+        return self._by_priority
+
+    def sorted_deadlines(self) -> Tuple[List[datetime.date], List[int]]:
+        """
+        Gets the deadline of every task which has one, sorted, along with the
+        positions of those tasks in the same order.
+        """
+        if self._deadlines is None:
+            dates = []
+            positions = []
+            deadlines = itertools.islice(self.deadlines, self.count)
+            for (position, deadline) in enumerate(deadlines):
+                if utils.is_valued(deadline):
+                    dates.append(deadline)
+                    positions.append(position)
+
+            # Sorting is stable, so tasks with the same deadline stay in order
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            self._deadlines = (
+                [dates[entry] for entry in order],
+                [positions[entry] for entry in order],
+            )
+
+        return self._deadlines
+
+    def subtree(self, task_id: Tuple[int]) -> range:
+        """
+        Gets the positions of a task and all of its descendants, which are
+        next to each other in task order. The range is empty if there is no
+        such task.
+        """
+        start = bisect.bisect_left(self.ids, task_id, 0, self.count)
+        if start == self.count or self.ids[start] != task_id:
+            return range(0)
+
+        sibling = task_id[:-1] + (task_id[-1] + 1,)
+        return range(start, bisect.bisect_left(self.ids, sibling, start, self.count))
+
+    def select(self, positions: Sequence[int]) -> Mapping[Tuple[int], utils.Task]:
+        """
+        Gets the tasks at the given positions, which must be in order.
+        """
+        if isinstance(self.task_map, store.TaskStore):
+            return store.TaskSubset(self.task_map, positions)
+
+        return {
+            self.ids[position]: self.task_map[self.ids[position]]
+            for position in positions
+        }
+
+
+class Condition:
+    """
+    A comparison between a field of each task and a value. Tasks where the
+    field has no value never match.
+    """
+
+    def __init__(self, field: str, op: str, value: Any):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def target(self, today: datetime.date) -> Any:
+        """
+        Gets the value to compare against, resolving relative deadlines.
+        """
+        if isinstance(self.value, datetime.timedelta):
+            return today + self.value
+
+        return self.value
+
+    def column(self, index: TaskIndex) -> Sequence[Any]:
+        """
+        Gets the values of the field for every task.
+        """
+        if self.field == "status":
+            return index.statuses
+        elif self.field == "priority":
+            return index.priorities
+        else:
+            return index.deadlines
+
+    def estimate(self, index: TaskIndex, today: datetime.date) -> int:
+        """
+        Gets the number of tasks which candidates would return, without
+        finding them.
+        """
+        target = self.target(today)
+        if self.field == "deadline":
+            (start, end) = self.deadline_span(index, target)
+            if self.op == "!=":
+                return len(index.sorted_deadlines()[0]) - (end - start)
+
+            return end - start
+
+        if self.field == "status":
+            groups = index.by_status()
+        else:
+            groups = index.by_priority()
+
+        compare = OPERATORS[self.op]
+        return sum(
+            len(positions)
+            for (value, positions) in groups.items()
+            if compare(value, target)
+        )
+
+    def deadline_span(self, index: TaskIndex, target: datetime.date) -> Tuple[int, int]:
+        """
+        Finds where the matching deadlines are in the sorted deadlines. For !=,
+        this is where the deadlines which don't match are.
+        """
+        (dates, _) = index.sorted_deadlines()
+        if self.op == "<":
+            return (0, bisect.bisect_left(dates, target))
+        elif self.op == "<=":
+            return (0, bisect.bisect_right(dates, target))
+        elif self.op == ">":
+            return (bisect.bisect_right(dates, target), len(dates))
+        elif self.op == ">=":
+            return (bisect.bisect_left(dates, target), len(dates))
+        else:
+            return (
+                bisect.bisect_left(dates, target),
+                bisect.bisect_right(dates, target),
+            )
+
+    def candidates(self, index: TaskIndex, today: datetime.date) -> List[int]:
+        """
+        Finds the positions of the matching tasks from the indexes, in order.
+        """
+        target = self.target(today)
+        if self.field == "deadline":
+            (start, end) = self.deadline_span(index, target)
+            (_, positions) = index.sorted_deadlines()
+            if self.op == "!=":
+                return sorted(positions[:start] + positions[end:])
+
+            return sorted(positions[start:end])
+
+        if self.field == "status":
+            groups = index.by_status()
+        else:
+            groups = index.by_priority()
+
+        compare = OPERATORS[self.op]
+        return list(
+            heapq.merge(
+                *(
+                    positions
+                    for (value, positions) in groups.items()
+                    if compare(value, target)
+                )
+            )
+        )
+
+    def matcher(self, index: TaskIndex, today: datetime.date) -> Callable[[int], bool]:
+        """
+        Builds a check for whether the task at a position matches.
+        """
+        column = self.column(index)
+        compare = OPERATORS[self.op]
+        target = self.target(today)
+
+        def matches(position: int) -> bool:
+            value = column[position]
+            return utils.is_valued(value) and compare(value, target)
+
+        return matches
+
+
+class Filter:
+    """
+    A parsed filter expression: a list of conditions, and a list of task IDs
+    that the tasks have to be under. A task matches if it meets all of them.
+    """
+
+    def __init__(self, conditions: List[Condition], subtrees: List[Tuple[int]]):
+        self.conditions = conditions
+        self.subtrees = subtrees
+
+    @classmethod
+    def parse(cls, text: str) -> "Filter":
+        """
+        Parses a filter expression, raising a ValueError if it isn't valid.
+        """
+        conditions = []
+        subtrees = []
+        position = 0
+        expect_clause = True
+        text = text.rstrip()
+        while position < len(text):
+            match = TOKEN.match(text, position)
+            if match is None:
+                raise ValueError(
+                    "Unexpected '{}' in filter".format(text[position:].strip())
+                )
+
+            position = match.end()
+            if match.group("and") is not None:
+                if expect_clause:
+                    raise ValueError("Expected a condition before 'and' in filter")
+
+                expect_clause = True
+                continue
+
+            if match.group("under") is not None:
+                subtrees.append(utils.parse_task_id(match.group("under")))
+            else:
+                conditions.append(
+                    parse_condition(
+                        match.group("field"), match.group("op"), match.group("value")
+                    )
+                )
+
+            expect_clause = False
+
+        if expect_clause:
+            raise ValueError("Expected a condition at the end of the filter")
+
+        return cls(conditions, subtrees)
+
+    def select(
+        self, index: TaskIndex, today: datetime.date
+    ) -> Mapping[Tuple[int], utils.Task]:
+        """
+        Finds the tasks which match the filter. The tasks are found from the
+        condition which matches the fewest tasks (or the narrowest subtree),
+        and only those tasks are checked against the other conditions.
+        """
+        span = range(index.count)
+        for task_id in self.subtrees:
+            subtree = index.subtree(task_id)
+            span = range(max(span.start, subtree.start), min(span.stop, subtree.stop))
+
+        conditions = sorted(
+            self.conditions, key=lambda condition: condition.estimate(index, today)
+        )
+        if conditions and conditions[0].estimate(index, today) < len(span):
+            found = conditions.pop(0).candidates(index, today)
+            start = bisect.bisect_left(found, span.start)
+            end = bisect.bisect_left(found, span.stop)
+            positions = found[start:end]
+        else:
+            positions = span
+
+        checks = [condition.matcher(index, today) for condition in conditions]
+        if checks:
+            positions = [
+                position
+                for position in positions
+                if all(check(position) for check in checks)
+            ]
+
+        return index.select(positions)
+
+
+def parse_condition(field: str, op: str, value: str) -> Condition:
+    """
+    Parses the value that a field is compared against, raising a ValueError
+    if the comparison isn't valid.
+    """
+    if field == "status":
+        if op not in ("=", "!="):
+            raise ValueError("Statuses can only be compared with = or !=")
+
+        status = value.upper()
+        if status not in ("DONE", "IN-PROGRESS", "BLOCKED", "TODO"):
+            raise ValueError("Invalid status value '{}' in filter".format(value))
+
+        return Condition(field, op, utils.TaskStatus[status.replace("-", "_")])
+
+    elif field == "priority":
+        try:
+            return Condition(field, op, int(value))
+        except ValueError:
+            raise ValueError("Priority value '{}' must be an integer".format(value))
+
+    elif field == "deadline":
+        relative = RELATIVE_DATE.fullmatch(value)
+        if relative is not None:
+            return Condition(field, op, datetime.timedelta(days=int(relative.group(1))))
+
+        try:
+            return Condition(field, op, datetime.date.fromisoformat(value))
+        except ValueError:
+            raise ValueError(
+                "Deadline value '{}' not in format YYYY-MM-DD or +Nd".format(value)
+            )
+
+    raise ValueError("Unknown field '{}' in filter".format(field))
@@ -0,0 +1,456 @@
+"""
+Usage: burrito serve INPUT-FILE EXPORTER [OPTION]... [PROPERTY=VALUE]...
+
+Runs a local HTTP server which keeps the parsed task file in memory, watches it
+(and all the files it includes) for changes and rebuilds the task tree when
+they change. Only the files which changed are parsed again, and only notes
+which changed are converted from Markdown again.
+
+Arguments:
+
+- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations, or
+  a snapshot compiled from one with "burrito compile".
+
+- EXPORTER: The name of the exporter served at / (one of: "plain", "simple",
+  "calendar", "full", "critical"). Every exporter is also available under its
+  own path, such as /calendar.
+
+- PROPERTY=VALUE: Exporter-specific configuration options, which are the same
+  as for burrito-cgi. These can also be overridden for a single request through
+  the query string, such as /full?summary=0.
+
+Options:
+
+- --port=PORT: The port to listen on. 8000 by default.
+
+- --bind=ADDRESS: The address to listen on. 127.0.0.1 by default.
+
+- --interval=SECONDS: How often to check the input files for changes. 1 by
+  default.
+"""
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import html
+from io import StringIO
+import os
+import sys
+import threading
+import time
+from typing import List, Mapping, Optional, Set, Tuple
+import urllib.parse
+
+from task_burrito import (
+    app,
+    cache,
+    cgi,
+    depgraph,
+    exporter,
+    parser,
+    query,
+    snapshot,
+    taskgraph,
+    utils,
+)
+
+EXPORTERS = {"plain", "simple", "calendar", "full", "critical"}
+
+# How many seconds to wait between messages on an idle event stream
+EVENT_KEEPALIVE = 15
+
+# How many bytes of rendered pages are kept for each task tree
+PAGE_CACHE_SIZE = 16 * 1024 * 1024
+
+
+class TaskTree:
+    """
+    The result of building a task file: either its tasks or the error which
+    prevented them from being loaded, along with any warnings.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        task_map: Optional[Mapping[Tuple[int], utils.Task]],
+        foldable: Optional[Set[Tuple[int]]],
+        graph: Optional[depgraph.DependencyGraph],
+        warnings: str,
+        error: Optional[str],
+    ):
+        self.version = version
+        self.task_map = task_map
+        self.foldable = foldable
+        self.graph = graph
+        self.warnings = warnings
+        self.error = error
+        self.index = None
+        self.pages = cache.FragmentCache(PAGE_CACHE_SIZE, measure=page_size)
+
+
+def page_size(page: Tuple[int, str, str, bytes]) -> int:
+    """
+    Gets the size of a rendered page, for the page cache.
+    """
+    return len(page[3])
+
+
+class TaskServer:
+    """
+    Holds the current task tree and rebuilds it whenever its files change.
+    """
+
+    def __init__(self, input_file: str, exporter_name: str, configs: List[str]):
+        self.input_file = input_file
+        self.exporter_name = exporter_name
+        self.configs = configs
+        self.parse_jobs = app.build_config_map(configs, is_cgi=True).parse_jobs
+        self.parse_cache = cache.MemoryParseCache()
+        self.graph = taskgraph.TaskGraph()
+        self.fragments = cache.FragmentCache()
+        self.renderers = {}
+        self.file_stats = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.render_lock = threading.Lock()
+        self.tree = None
+
+    def stat_files(self, paths: List[str]) -> Mapping[str, Optional[Tuple[int, int]]]:
+        """
+        Gets the modification time and size of each file, or None for files
+        which no longer exist.
+        """
+        stats = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stats[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stats[path] = None
+
+        return stats
+
+    def has_changed(self) -> bool:
+        """
+        Checks whether any of the files used by the last build have changed.
+        """
+        return self.stat_files(list(self.file_stats)) != self.file_stats
+
+    def rebuild(self):
+        """
+        Parses the task file again and replaces the current task tree.
+        """
+        warning_buffer = StringIO()
+        error_buffer = StringIO()
+        logger = utils.Logger(warning_buffer, error_buffer)
+
+        tasks = None
+        digests = self.parse_cache.digests
+        watched = set()
+        try:
+            (input_file, compiled) = snapshot.open_input(self.input_file)
+            if compiled is not None:
+                # The task files the snapshot came from are watched as well, so
+                # that they're parsed as soon as the snapshot is out of date
+                print(compiled.warnings, end="", file=warning_buffer)
+                tasks = compiled.task_store().values()
+                digests = compiled.digests()
+                watched = set(compiled.files)
+            else:
+                base_path = os.path.dirname(os.path.abspath(input_file))
+                with open(input_file) as in_fobj:
+                    tasks = parser.parse_file(
+                        in_fobj, base_path, logger, self.parse_cache, self.parse_jobs
+                    )
+
+            if not tasks:
+                print("Task file cannot be empty", file=error_buffer)
+        except (OSError, SyntaxError, ValueError) as err:
+            print(str(err), file=error_buffer)
+
+        paths = list(set(digests) | watched | {os.path.abspath(self.input_file)})
+        self.parse_cache.forget_unused()
+
+        # Only the tasks which changed are resolved again. The graph is updated
+        # in place, and the current tree shares its task map and foldable set,
+        # so nothing can be rendered until the new tree has replaced it.
+        with self.render_lock:
+            task_map = None
+            foldable = None
+            dependencies = None
+            if tasks:
+                try:
+                    self.graph.update(tasks)
+                    task_map = self.graph.task_map
+                    foldable = self.graph.foldable
+                    dependencies = app.build_dependency_graph(task_map, logger)
+                except ValueError as err:
+                    print(str(err), file=error_buffer)
+
+            tree = TaskTree(
+                cache.input_digest(digests, error_buffer.getvalue()),
+                task_map,
+                foldable,
+                dependencies,
+                warning_buffer.getvalue(),
+                error_buffer.getvalue() or None,
+            )
+            with self.lock:
+                self.file_stats = self.stat_files(paths)
+                if self.tree is None or self.tree.version != tree.version:
+                    self.tree = tree
+                    self.changed.notify_all()
+
+    def wait_for_change(self, version: str, timeout: float) -> str:
+        """
+        Waits until the task tree no longer has the given version, or the
+        timeout expires. Returns the version of the current task tree.
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.tree.version != version, timeout)
+            return self.tree.version
+
+    def watch(self, interval: float):
+        """
+        Polls the task files forever, rebuilding the task tree when they change.
+        """
+        while True:
+            time.sleep(interval)
+            if self.has_changed():
+                self.rebuild()
+
+    def render(self, path: str, query_string: str) -> Tuple[int, str, str, bytes]:
+        """
+        Renders the page at the given path, returning its status code, content
+        type, ETag and body. Pages are kept until the task tree changes.
+        """
+        with self.lock:
+            tree = self.tree
+
+        # Pages are kept under the exporter and the options which affect them,
+        # so that unknown or reordered parameters don't fill up the cache. The
+        # critical path and filters with relative deadlines depend on the
+        # current date as well, so pages are only kept for the day they were
+        # rendered on.
+        exporter_name = path.strip("/") or self.exporter_name
+        options = {
+            key: value
+            for (key, value) in urllib.parse.parse_qsl(
+                query_string, keep_blank_values=True
+            )
+            if key in app.CONFIG_KEYS
+        }
+        canonical_query = urllib.parse.urlencode(sorted(options.items()))
+        today = datetime.date.today().isoformat()
+        page_key = cache.FragmentCache.key(exporter_name, canonical_query, today)
+        with self.lock:
+            page = tree.pages.get(page_key)
+
+        if page is not None:
+            return page
+
+        # The note renderers aren't safe to share between threads, and the task
+        # map may have been updated for a newer tree while waiting for the lock,
+        # so the current tree is looked up again once the lock is held
+        with self.render_lock:
+            with self.lock:
+                tree = self.tree
+                page = tree.pages.get(page_key)
+
+            if page is None:
+                etag = '"{}"'.format(cache.input_digest({}, tree.version, page_key))
+                (status, content_type, body) = self.render_page(
+                    tree, exporter_name, canonical_query
+                )
+                page = (status, content_type, etag, body.encode("utf-8"))
+                with self.lock:
+                    tree.pages.put(page_key, page)
+
+        return page
+
+    def render_page(
+        self, tree: TaskTree, path: str, query_string: str
+    ) -> Tuple[int, str, str]:
+        """
+        Renders a page from the given task tree.
+        """
+        exporter_name = path.strip("/") or self.exporter_name
+        if exporter_name not in EXPORTERS:
+            return (404, "text/plain", "Unknown exporter: {}\n".format(exporter_name))
+
+        if tree.error is not None:
+            return (500, "text/plain", tree.error)
+
+        query_configs = [
+            "{}={}".format(key, value)
+            for (key, value) in urllib.parse.parse_qsl(
+                query_string, keep_blank_values=True
+            )
+        ]
+        try:
+            configs = app.build_config_map(
+                self.configs + query_configs, is_cgi=True, refresh_mode="push"
+            )
+        except ValueError as err:
+            return (400, "text/plain", str(err) + "\n")
+
+        output = StringIO()
+        if exporter_name == "plain":
+            exporter.plain_exporter(tree.task_map.values(), output)
+            return (200, "text/plain; charset=utf-8", output.getvalue())
+
+        configs.refresh_token = tree.version
+        configs.include_toc = exporter_name in {"simple", "full"}
+        configs.include_calendar = exporter_name in {"calendar", "full"}
+        configs.include_critical = exporter_name == "critical"
+        if tree.warnings:
+            configs.body_suffix = "<hr><h1>Warnings</h1><pre>{}</pre>".format(
+                html.escape(tree.warnings)
+            )
+
+        extensions = tuple(configs.markdown_extensions)
+        renderer = self.renderers.get(extensions)
+        if renderer is None:
+            renderer = exporter.NoteRenderer(extensions, self.fragments)
+            self.renderers[extensions] = renderer
+
+        # The filter indexes are only built once a page uses a filter, and
+        # are then kept for the other pages of the same tree
+        if configs.task_filter is not None and tree.index is None:
+            tree.index = query.TaskIndex(tree.task_map)
+
+        exporter.export_html_report(
+            tree.task_map,
+            output,
+            configs,
+            renderer,
+            tree.foldable,
+            tree.graph,
+            index=tree.index,
+        )
+        return (200, "text/html; charset=utf-8", output.getvalue())
+
+
+class TaskRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers requests using the pages rendered by the server's TaskServer.
+    """
+
+    def do_GET(self):
+        """
+        Sends the page for the requested exporter, or the event stream that
+        tells pages when to reload.
+        """
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/events":
+            self.send_events(url.query)
+            return
+
+        (status, content_type, etag, body) = self.server.task_server.render(
+            url.path, url.query
+        )
+
+        if etag in cgi.parse_if_none_match(self.headers.get("If-None-Match", "")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, query_string: str):
+        """
+        Sends a server-sent event stream which emits a change event as soon as
+        the task tree no longer matches the version the page was rendered from.
+        """
+        version = urllib.parse.parse_qs(query_string).get("version", [""])[0]
+        task_server = self.server.task_server
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            while True:
+                current = task_server.wait_for_change(version, EVENT_KEEPALIVE)
+                if current != version:
+                    self.wfile.write(
+                        "event: change\ndata: {}\n\n".format(current).encode()
+                    )
+                    self.wfile.flush()
+                    return
+
+                # Comments keep proxies from timing out the connection, and let
+                # us notice when the client has gone away
+                self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def main(args: List[str]):
+    """
+    Parses the serve arguments and runs the server until it is interrupted.
+    """
+    if "-h" in args or "--help" in args:
+        print(__doc__)
+        sys.exit(1)
+
+    port = 8000
+    bind = "127.0.0.1"
+    interval = 1.0
+    positional = []
+    try:
+        for arg in args:
+            if arg.startswith("--port="):
+                port = int(arg[len("--port=") :])
+            elif arg.startswith("--bind="):
+                bind = arg[len("--bind=") :]
+            elif arg.startswith("--interval="):
+                interval = float(arg[len("--interval=") :])
+            else:
+                positional.append(arg)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    if len(positional) < 2:
+        print(
+            "Usage: burrito serve INPUT-FILE EXPORTER [OPTION]... [property=value]...",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    (input_file, exporter_name, *configs) = positional
+    if exporter_name not in EXPORTERS:
+        print("Unknown exporter:", exporter_name, file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        app.build_config_map(configs, is_cgi=True)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    task_server = TaskServer(input_file, exporter_name, configs)
+    task_server.rebuild()
+
+    watcher = threading.Thread(target=task_server.watch, args=(interval,))
+    watcher.daemon = True
+    watcher.start()
+
+    http_server = ThreadingHTTPServer((bind, port), TaskRequestHandler)
+    http_server.task_server = task_server
+    print("Serving {} on http://{}:{}/".format(input_file, bind, port), file=sys.stderr)
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,347 @@
+"""
+Usage: burrito shard INPUT-FILE EXPORTER OUTPUT-DIR [OPTION]... [PROPERTY=VALUE]...
+
+Writes a separate report for each top-level task (1.html, 2.html and so on)
+into OUTPUT-DIR, along with an index.html which links to all of them. The
+reports are rendered in parallel by a pool of worker processes, since
+rendering the notes of a large task file takes most of the time.
+
+Arguments:
+
+- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations, or
+  a snapshot compiled from one with "burrito compile".
+
+- EXPORTER: The name of the exporter used for each report (one of: "simple",
+  "calendar", "full")
+
+- OUTPUT-DIR: The directory to write the reports into, which is created if it
+  doesn't exist.
+
+- PROPERTY=VALUE: Exporter-specific configuration options, which are the same
+  as for burrito.
+
+Options:
+
+- --processes=NUMBER: How many reports to render at the same time. The number
+  of CPUs by default.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import html
+import multiprocessing
+import os
+import re
+import sys
+from typing import IO, List, Optional, Tuple
+
+from task_burrito import (
+    app,
+    cache,
+    depgraph,
+    exporter,
+    profiling,
+    store,
+    utils,
+    writer,
+)
+
+EXPORTERS = {"simple", "calendar", "full"}
+
+# Links to tasks, both in the exporters' output and in the notes
+TASK_LINK = re.compile(r"""href=(['"])#(\d+)((?:\.\d+)*)\1""")
+
+# The tasks and settings used by the worker processes, which they get from the
+# main process when they are forked
+WORKER_STATE = {}
+
+
+def shard_path(top_id: int) -> str:
+    """
+    Gets the name of the report for a top-level task.
+    """
+    return "{}.html".format(top_id)
+
+
+def link_shards(page: str, top_id: int) -> str:
+    """
+    Points the links to tasks in other reports at the report which holds
+    them, since each report only has anchors for its own tasks.
+    """
+
+    def replace(match: re.Match) -> str:
+        (quote, link_top, rest) = match.groups()
+        if int(link_top) == top_id:
+            return match.group(0)
+
+        return "href={}{}#{}{}{}".format(
+            quote, shard_path(int(link_top)), link_top, rest, quote
+        )
+
+    return TASK_LINK.sub(replace, page)
+
+
+class ShardLinkWriter:
+    """
+    An output stream which rewrites the links in a report with link_shards as
+    it is written. Links never span more than one line, so each chunk is
+    rewritten up to its last newline and the rest is kept for the next one.
+    """
+
+    def __init__(self, output: IO, top_id: int):
+        self.output = output
+        self.top_id = top_id
+        self.pending = ""
+
+    def write(self, chunk: str):
+        """
+        Writes out the complete lines of a chunk.
+        """
+        text = self.pending + chunk
+        end = text.rfind("\n") + 1
+        self.output.write(link_shards(text[:end], self.top_id))
+        self.pending = text[end:]
+
+    def flush(self):
+        """
+        Writes out whatever is left after the last line.
+        """
+        self.output.write(link_shards(self.pending, self.top_id))
+        self.pending = ""
+
+
+def export_shard(
+    task_map: store.TaskStore,
+    top_id: int,
+    output_dir: str,
+    configs: exporter.ExportConfig,
+    renderer: exporter.NoteRenderer,
+    graph: depgraph.DependencyGraph,
+):
+    """
+    Writes the report for the subtree of a single top-level task. The
+    dependency graph is the graph of every task, so that dependencies on tasks
+    in other reports are shown correctly.
+    """
+    with app.replace_output(
+        os.path.join(output_dir, shard_path(top_id)), configs.compress
+    ) as fobj:
+        page = ShardLinkWriter(fobj, top_id)
+        exporter.export_html_report(
+            task_map.subtree((top_id,)), page, configs, renderer, graph=graph
+        )
+        page.flush()
+
+
+def start_worker(
+    task_map: store.TaskStore,
+    output_dir: str,
+    configs: exporter.ExportConfig,
+    graph: depgraph.DependencyGraph,
+    fragments: Optional[cache.FragmentCache],
+):
+    """
+    Sets up a worker process with the tasks to render, along with its own
+    note renderer. The renderer starts with the fragment cache of the main
+    process.
+    """
+    WORKER_STATE["task_map"] = task_map
+    WORKER_STATE["output_dir"] = output_dir
+    WORKER_STATE["configs"] = configs
+    WORKER_STATE["graph"] = graph
+    WORKER_STATE["renderer"] = exporter.NoteRenderer(
+        configs.markdown_extensions, fragments
+    )
+
+
+def run_worker(top_id: int) -> List[Tuple[str, str]]:
+    """
+    Writes the report for a top-level task in a worker process. Returns the
+    notes which were rendered for the first time, so that the main process
+    can add them to the fragment cache.
+    """
+    renderer = WORKER_STATE["renderer"]
+    known = set() if renderer.fragments is None else set(renderer.fragments.fragments)
+
+    export_shard(
+        WORKER_STATE["task_map"],
+        top_id,
+        WORKER_STATE["output_dir"],
+        WORKER_STATE["configs"],
+        renderer,
+        WORKER_STATE["graph"],
+    )
+
+    if renderer.fragments is None:
+        return []
+
+    return [
+        (key, fragment)
+        for (key, fragment) in renderer.fragments.fragments.items()
+        if key not in known
+    ]
+
+
+def top_level_ids(task_map: store.TaskStore) -> List[int]:
+    """
+    Gets the IDs of the top-level tasks, each of which has its own report.
+    """
+    return [
+        task_map.ids[position][0]
+        for position in range(task_map.count)
+        if task_map.parents[position] < 0
+    ]
+
+
+def export_index(
+    task_map: store.TaskStore, top_ids: List[int], output: IO, exporter_name: str
+):
+    """
+    Exports the index page, which links to the report for each top-level task
+    along with how many of its tasks are done.
+    """
+    with writer.chunked(output) as out:
+        out.line(exporter.HTML_HEADER.replace("%REFRESH%", ""))
+        out.line("<h1> Reports ({}) </h1>".format(html.escape(exporter_name)))
+        out.line("<table>")
+        out.line("<tr><th>Task</th><th>Status</th><th>Tasks</th><th>Done</th></tr>")
+        for top_id in top_ids:
+            subtree = task_map.subtree_range((top_id,))
+            done = sum(
+                1
+                for position in subtree
+                if task_map.statuses[position] == utils.TaskStatus.DONE
+            )
+            out.line("<tr>")
+            out.line(
+                "<td><a href='{}'> {} </a> {}</td>".format(
+                    shard_path(top_id),
+                    top_id,
+                    html.escape(task_map.labels[subtree[0]]),
+                )
+            )
+            out.line(
+                "<td>",
+                exporter.task_status_color(task_map.statuses[subtree[0]]),
+                "</td>",
+            )
+            out.line("<td>", len(subtree), "</td>")
+            out.line("<td>", done, "</td>")
+            out.line("</tr>")
+        out.line("</table>")
+        out.line(exporter.HTML_FOOTER.replace("%TAIL%", ""))
+
+
+def export_shards(
+    task_map: store.TaskStore,
+    exporter_name: str,
+    top_ids: List[int],
+    output_dir: str,
+    configs: exporter.ExportConfig,
+    graph: depgraph.DependencyGraph,
+    processes: int,
+):
+    """
+    Writes the reports for the given top-level tasks. Each report replaces the
+    old one only once it is complete.
+
+    The workers are forked from this process so that they share its tasks and
+    dependency graph, instead of having to load them again. Where forking
+    isn't supported, or only one process is used, the reports are written
+    by this process one at a time.
+    """
+    configs.include_toc = exporter_name in {"simple", "full"}
+    configs.include_calendar = exporter_name in {"calendar", "full"}
+    os.makedirs(output_dir, exist_ok=True)
+
+    # The largest reports are started first, so that the workers aren't left
+    # waiting on one large report at the end
+    by_size = sorted(
+        top_ids, key=lambda top_id: -len(task_map.subtree_range((top_id,)))
+    )
+
+    renderer = app.build_note_renderer(configs)
+    with profiling.stage("shards"):
+        if processes == 1 or "fork" not in multiprocessing.get_all_start_methods():
+            for top_id in by_size:
+                export_shard(task_map, top_id, output_dir, configs, renderer, graph)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=start_worker,
+                initargs=(task_map, output_dir, configs, graph, renderer.fragments),
+            ) as pool:
+                for fragments in pool.map(run_worker, by_size):
+                    if renderer.fragments is not None:
+                        for (key, fragment) in fragments:
+                            renderer.fragments.put(key, fragment)
+
+    if renderer.fragments is not None:
+        renderer.fragments.save()
+
+
+def main(args: List[str]):
+    """
+    Parses the shard arguments and writes the reports.
+    """
+    if "-h" in args or "--help" in args:
+        print(__doc__)
+        sys.exit(1)
+
+    args = app.parse_profile_flag(args)
+    processes = os.cpu_count() or 1
+    positional = []
+    try:
+        for arg in args:
+            if arg.startswith("--processes="):
+                processes = int(arg[len("--processes=") :])
+                if processes < 1:
+                    raise ValueError(
+                        "Invalid value {} for --processes".format(
+                            arg[len("--processes=") :]
+                        )
+                    )
+            else:
+                positional.append(arg)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    if len(positional) < 3:
+        print(
+            "Usage: burrito shard INPUT-FILE EXPORTER OUTPUT-DIR [OPTION]... "
+            "[property=value]...",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    (input_file, exporter_name, output_dir, *properties) = positional
+    if exporter_name not in EXPORTERS:
+        print("Unknown exporter:", exporter_name, file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        configs = app.build_config_map(properties, is_cgi=False)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    logger = utils.Logger(sys.stderr, sys.stderr)
+    profiler = profiling.start_profiler(configs)
+    try:
+        (in_fobj, base_path, compiled) = app.open_task_input(input_file)
+        task_map = app.load_task_map(in_fobj, base_path, compiled, configs, logger)
+        graph = app.build_dependency_graph(task_map, logger)
+        top_ids = top_level_ids(task_map)
+        export_shards(
+            task_map, exporter_name, top_ids, output_dir, configs, graph, processes
+        )
+        with profiling.stage("index"):
+            with app.replace_output(
+                os.path.join(output_dir, "index.html"), configs.compress
+            ) as fobj:
+                export_index(task_map, top_ids, fobj, exporter_name)
+    except (OSError, ValueError) as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    app.report_profile(profiler, configs)
@@ -0,0 +1,282 @@
+"""
+Usage: burrito export-site INPUT-FILE OUTPUT-DIR [OPTION]... [PROPERTY=VALUE]...
+
+Writes a static site into OUTPUT-DIR, with a page for each top-level task (the
+same as "burrito shard") and an index.html which links to all of them. The
+inputs of each page are hashed and recorded in OUTPUT-DIR, so that running it
+again only writes the pages whose tasks changed and leaves the rest alone.
+
+A page's inputs are the fields and notes of the tasks in its subtree, and the
+status of each of their dependencies, since that decides whether a task is
+shown as blocked. Changed pages are written to a temporary file first and then
+renamed over the old page, so the site never has half-written pages. Pages of
+top-level tasks which no longer exist are removed.
+
+Arguments:
+
+- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations, or
+  a snapshot compiled from one with "burrito compile".
+
+- OUTPUT-DIR: The directory to write the site into, which is created if it
+  doesn't exist.
+
+- PROPERTY=VALUE: Exporter-specific configuration options, which are the same
+  as for burrito. Changing the ones which affect the pages (anything other
+  than cache, jobs and the profiling options) writes every page again.
+
+Options:
+
+- --exporter=NAME: The exporter used for each page (one of: "simple",
+  "calendar", "full"). "full" by default.
+
+- --processes=NUMBER: How many pages to render at the same time. The number
+  of CPUs by default.
+"""
+import datetime
+import json
+import os
+import sys
+from typing import Any, List, Mapping, Tuple
+
+from task_burrito import (
+    app,
+    cache,
+    depgraph,
+    exporter,
+    profiling,
+    shard,
+    store,
+    utils,
+    writer,
+)
+
+# The file in the output directory which holds the hash of each page's inputs
+MANIFEST_NAME = ".burrito-site.json"
+
+# Properties which don't change the pages, so changing them doesn't write
+# every page again
+UNRENDERED_PROPERTIES = {
+    "cache",
+    "jobs",
+    "profile",
+    "profile_functions",
+    "profile_output",
+}
+
+# Bumped whenever the pages are rendered differently, so that sites written by
+# older versions are written again
+SITE_VERSION = 1
+
+
+def content_key(content: Any) -> str:
+    """
+    Gets a stand-in for the notes of a task to hash. Notes which are still in
+    the task file are represented by their digest, so they aren't read.
+    """
+    if isinstance(content, utils.LazyText):
+        return "{}:{}:{}".format(
+            content.encoding, content.end - content.start, content.digest.hex()
+        )
+
+    return content
+
+
+def field_key(value: Any) -> str:
+    """
+    Gets a stand-in for a priority or deadline to hash. Missing values and
+    values disabled with "none" are both shown as unassigned.
+    """
+    return str(value) if utils.is_valued(value) else ""
+
+
+def page_key(task_map: store.TaskStore, top_id: int, extra: List[str]) -> str:
+    """
+    Hashes the inputs of the page for a top-level task, along with any other
+    values that affect every page.
+    """
+    parts = list(extra)
+    for position in task_map.subtree_range((top_id,)):
+        parts.append(utils.task_id_str(task_map.ids[position]))
+        parts.append(task_map.labels[position])
+        parts.append(str(task_map.statuses[position]))
+        parts.append(field_key(task_map.priorities[position]))
+        parts.append(field_key(task_map.deadlines[position]))
+        parts.append(content_key(task_map.contents[position]))
+
+        start = task_map.dependency_offsets[position]
+        end = task_map.dependency_offsets[position + 1]
+        for offset in range(start, end):
+            dep = task_map.dependencies[offset]
+            parts.append(utils.task_id_str(task_map.ids[dep]))
+            if dep < task_map.count:
+                parts.append(str(task_map.statuses[dep]))
+            else:
+                parts.append("missing")
+
+    return cache.FragmentCache.key(*parts)
+
+
+def load_manifest(output_dir: str) -> Mapping[str, str]:
+    """
+    Loads the hash of each page's inputs from the last run. If it can't be
+    read, every page is written again.
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as fobj:
+            manifest = json.load(fobj)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(manifest, dict):
+        return {}
+
+    return manifest
+
+
+def is_current(
+    output_dir: str, name: str, key: str, manifest: Mapping[str, str], compress: bool
+) -> bool:
+    """
+    Checks whether a page was written from the same inputs by the last run,
+    and is still there.
+    """
+    path = os.path.join(output_dir, name)
+    return (
+        manifest.get(name) == key
+        and os.path.exists(path)
+        and (not compress or os.path.exists(path + ".gz"))
+    )
+
+
+def export_site(
+    task_map: store.TaskStore,
+    exporter_name: str,
+    output_dir: str,
+    configs: exporter.ExportConfig,
+    graph: depgraph.DependencyGraph,
+    processes: int,
+    properties: List[str],
+) -> Tuple[int, int]:
+    """
+    Writes the pages whose inputs changed since the last run, along with the
+    index if it changed, and removes the pages of top-level tasks which are
+    gone. Returns how many pages were written, and how many there are.
+    """
+    extra = [str(SITE_VERSION), exporter_name]
+    for prop in properties:
+        if prop.split("=", 1)[0] not in UNRENDERED_PROPERTIES:
+            extra.append(prop)
+
+    # Filters with relative deadlines depend on the current date as well
+    if configs.task_filter is not None:
+        extra.append(datetime.date.today().isoformat())
+
+    manifest = load_manifest(output_dir)
+    top_ids = shard.top_level_ids(task_map)
+    keys = {}
+    changed = []
+    with profiling.stage("hash"):
+        for top_id in top_ids:
+            name = shard.shard_path(top_id)
+            keys[name] = page_key(task_map, top_id, extra)
+            if not is_current(output_dir, name, keys[name], manifest, configs.compress):
+                changed.append(top_id)
+
+    if changed:
+        shard.export_shards(
+            task_map, exporter_name, changed, output_dir, configs, graph, processes
+        )
+    written = len(changed)
+
+    # The index is small, so it is rendered every time and only written out
+    # if it is different
+    with profiling.stage("index"):
+        index_page = writer.ChunkList()
+        shard.export_index(task_map, top_ids, index_page, exporter_name)
+        keys["index.html"] = cache.FragmentCache.key(*extra, *index_page)
+        if not is_current(
+            output_dir, "index.html", keys["index.html"], manifest, configs.compress
+        ):
+            with app.replace_output(
+                os.path.join(output_dir, "index.html"), configs.compress
+            ) as fobj:
+                for chunk in index_page:
+                    fobj.write(chunk)
+            written += 1
+
+    for name in manifest:
+        if name not in keys:
+            path = os.path.join(output_dir, os.path.basename(name))
+            for stale in (path, path + ".gz"):
+                if os.path.exists(stale):
+                    os.unlink(stale)
+
+    with app.replace_output(os.path.join(output_dir, MANIFEST_NAME)) as fobj:
+        json.dump(keys, fobj, indent=0, sort_keys=True)
+
+    return (written, len(keys))
+
+
+def main(args: List[str]):
+    """
+    Parses the export-site arguments and writes the site.
+    """
+    if "-h" in args or "--help" in args:
+        print(__doc__)
+        sys.exit(1)
+
+    args = app.parse_profile_flag(args)
+    processes = os.cpu_count() or 1
+    exporter_name = "full"
+    positional = []
+    try:
+        for arg in args:
+            if arg.startswith("--processes="):
+                processes = int(arg[len("--processes=") :])
+                if processes < 1:
+                    raise ValueError(
+                        "Invalid value {} for --processes".format(
+                            arg[len("--processes=") :]
+                        )
+                    )
+            elif arg.startswith("--exporter="):
+                exporter_name = arg[len("--exporter=") :]
+                if exporter_name not in shard.EXPORTERS:
+                    raise ValueError("Unknown exporter: {}".format(exporter_name))
+            else:
+                positional.append(arg)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    if len(positional) < 2:
+        print(
+            "Usage: burrito export-site INPUT-FILE OUTPUT-DIR [OPTION]... "
+            "[property=value]...",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    (input_file, output_dir, *properties) = positional
+    try:
+        configs = app.build_config_map(properties, is_cgi=False)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    logger = utils.Logger(sys.stderr, sys.stderr)
+    profiler = profiling.start_profiler(configs)
+    try:
+        (in_fobj, base_path, compiled) = app.open_task_input(input_file)
+        task_map = app.load_task_map(in_fobj, base_path, compiled, configs, logger)
+        graph = app.build_dependency_graph(task_map, logger)
+        os.makedirs(output_dir, exist_ok=True)
+        (written, total) = export_site(
+            task_map, exporter_name, output_dir, configs, graph, processes, properties
+        )
+    except (OSError, ValueError) as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    print("Wrote {} of {} pages".format(written, total), file=sys.stderr)
+    app.report_profile(profiler, configs)
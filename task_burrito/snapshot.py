@@ -0,0 +1,539 @@
+"""
+Usage: burrito compile INPUT-FILE OUTPUT-FILE [OPTION]...
+
+Parses a task file (along with everything it includes) and writes its
+resolved tasks into a compiled snapshot. A snapshot can be given in place of
+the task file to burrito, burrito-cgi and burrito serve, which load it instead
+of parsing the task files again. If any of the task files have changed since
+the snapshot was compiled, they are parsed again instead.
+
+Arguments:
+
+- INPUT-FILE: The path to a Markdown file with Task Burrito anntoations.
+
+- OUTPUT-FILE: The path to write the snapshot to.
+
+Options:
+
+- --jobs=NUMBER: How many included files to read and parse at the same time.
+  4 by default.
+"""
+from array import array
+from collections.abc import Sequence
+import datetime
+import hashlib
+from io import StringIO
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from typing import Any, Callable, Iterator, List, Mapping, Optional, Tuple
+
+from task_burrito import cache, parser, store, utils
+
+MAGIC = b"BURRITO\0"
+
+# Bumped whenever the layout of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+# The sections of a snapshot, in the order they're stored. The header gives
+# the offset and length of each one.
+SECTIONS = [
+    "source",
+    "warnings",
+    "file_paths",
+    "file_stamps",
+    "id_offsets",
+    "id_parts",
+    "labels",
+    "statuses",
+    "priorities",
+    "deadlines",
+    "parents",
+    "child_offsets",
+    "children",
+    "dependency_offsets",
+    "dependencies",
+    "note_files",
+    "note_starts",
+    "note_ends",
+    "note_digests",
+    "note_texts",
+    "note_paths",
+    "note_encodings",
+    "note_stamps",
+]
+
+# The magic number, version, byte order, number of tasks and number of IDs,
+# followed by the offset and length of each section
+HEADER = struct.Struct("<8sIBxxxQQ")
+SECTION = struct.Struct("<QQ")
+
+# Priorities and deadlines are stored as integers, with these values standing
+# in for the ones which aren't
+MISSING = 0
+NOT_PROVIDED = -1
+
+# The status stored as each value, where 0 is a missing status
+STATUSES = [None] + sorted(utils.TaskStatus, key=lambda status: status.value)
+
+# The length of the digest stored for each note read from a task file
+DIGEST_SIZE = 16
+
+# The stamp of a file which did not exist when the snapshot was compiled
+NO_STAMP = (-1, -1)
+
+
+def file_stamp(path: str) -> Tuple[int, int]:
+    """
+    Gets the modification time and size of a file, or NO_STAMP if it doesn't
+    exist.
+    """
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return NO_STAMP
+
+
+def pack_strings(strings: List[str]) -> bytes:
+    """
+    Packs a list of strings into the count, the offset of each string and the
+    UTF-8 text of all the strings.
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = array("q", [len(encoded)])
+    offset = 0
+    offsets.append(offset)
+    for data in encoded:
+        offset += len(data)
+        offsets.append(offset)
+
+    return offsets.tobytes() + b"".join(encoded)
+
+
+def encode_optional(value: Any, encode: Callable[[Any], int]) -> int:
+    """
+    Encodes a priority or deadline, which may also be missing or explicitly
+    not provided.
+    """
+    if value is None:
+        return MISSING
+    elif value is utils.NOT_PROVIDED:
+        return NOT_PROVIDED
+
+    return encode(value)
+
+
+def decode_optional(value: int, decode: Callable[[int], Any]) -> Any:
+    """
+    Decodes a priority or deadline encoded by encode_optional.
+    """
+    if value == MISSING:
+        return None
+    elif value == NOT_PROVIDED:
+        return utils.NOT_PROVIDED
+
+    return decode(value)
+
+
+class StringTable(Sequence):
+    """
+    A read-only view of a list of strings packed by pack_strings, which are
+    only decoded when they're used.
+    """
+
+    def __init__(self, view: memoryview):
+        (count,) = struct.unpack_from("q", view)
+        self.offsets = view[8 : 8 * (count + 2)].cast("q")
+        self.text = view[8 * (count + 2) :]
+
+    def __getitem__(self, index: int) -> str:
+        index = range(len(self))[index]
+        return str(self.text[self.offsets[index] : self.offsets[index + 1]], "utf-8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class Column(Sequence):
+    """
+    A read-only view of one field of every task in a snapshot, which builds
+    the field's value for a task when it's used.
+    """
+
+    def __init__(self, count: int, read: Callable[[int], Any]):
+        self.count = count
+        self.read = read
+
+    def __getitem__(self, position: int) -> Any:
+        return self.read(range(self.count)[position])
+
+    def __iter__(self) -> Iterator[Any]:
+        return map(self.read, range(self.count))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def write_snapshot(
+    path: str,
+    source: str,
+    task_store: store.TaskStore,
+    files: Mapping[str, Tuple[int, int]],
+    warnings: str,
+):
+    """
+    Writes the tasks from a store into a snapshot file, along with the task
+    files they came from (and their stamps) and the warnings from parsing
+    them. The file is replaced atomically.
+    """
+    count = task_store.count
+    ids = task_store.ids
+    id_offsets = array("q", [0])
+    id_parts = array("q")
+    for task_id in ids:
+        id_parts.extend(task_id)
+        id_offsets.append(len(id_parts))
+
+    note_files = array("i")
+    note_starts = array("q")
+    note_ends = array("q")
+    note_digests = []
+    note_texts = []
+    note_sources = {}
+    for content in task_store.contents:
+        if isinstance(content, utils.LazyText):
+            source_key = (content.path, content.encoding, content.stamp)
+            note_files.append(note_sources.setdefault(source_key, len(note_sources)))
+            note_starts.append(content.start)
+            note_ends.append(content.end)
+            note_digests.append(content.digest.ljust(DIGEST_SIZE, b"\0"))
+            note_texts.append("")
+        else:
+            note_files.append(-1)
+            note_starts.append(0)
+            note_ends.append(0)
+            note_digests.append(bytes(DIGEST_SIZE))
+            note_texts.append(content)
+
+    sections = {
+        "source": source.encode("utf-8"),
+        "warnings": warnings.encode("utf-8"),
+        "file_paths": pack_strings(list(files)),
+        "file_stamps": array(
+            "q", [part for stamp in files.values() for part in stamp]
+        ).tobytes(),
+        "id_offsets": id_offsets.tobytes(),
+        "id_parts": id_parts.tobytes(),
+        "labels": pack_strings(task_store.labels),
+        "statuses": array(
+            "b",
+            [0 if status is None else status.value for status in task_store.statuses],
+        ).tobytes(),
+        "priorities": array(
+            "b",
+            [
+                encode_optional(priority, int)
+                for priority in task_store.priorities[:count]
+            ],
+        ).tobytes(),
+        "deadlines": array(
+            "i",
+            [
+                encode_optional(deadline, datetime.date.toordinal)
+                for deadline in task_store.deadlines[:count]
+            ],
+        ).tobytes(),
+        "parents": array("q", task_store.parents).tobytes(),
+        "child_offsets": array("q", task_store.child_offsets).tobytes(),
+        "children": array("q", task_store.child_indexes).tobytes(),
+        "dependency_offsets": array("q", task_store.dependency_offsets).tobytes(),
+        "dependencies": array("q", task_store.dependencies).tobytes(),
+        "note_files": note_files.tobytes(),
+        "note_starts": note_starts.tobytes(),
+        "note_ends": note_ends.tobytes(),
+        "note_digests": b"".join(note_digests),
+        "note_texts": pack_strings(note_texts),
+        "note_paths": pack_strings([key[0] for key in note_sources]),
+        "note_encodings": pack_strings([key[1] for key in note_sources]),
+        "note_stamps": array(
+            "q", [part for key in note_sources for part in key[2]]
+        ).tobytes(),
+    }
+
+    # Sections are aligned so that they can be viewed as arrays in place
+    header_size = HEADER.size + SECTION.size * len(SECTIONS)
+    offset = header_size + (-header_size % 8)
+    table = []
+    for name in SECTIONS:
+        table.append((offset, len(sections[name])))
+        offset += len(sections[name])
+        offset += -offset % 8
+
+    directory = os.path.dirname(os.path.abspath(path))
+    (handle, temp_path) = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(handle, "wb") as fobj:
+            fobj.write(
+                HEADER.pack(
+                    MAGIC,
+                    SNAPSHOT_VERSION,
+                    sys.byteorder == "little",
+                    count,
+                    len(ids),
+                )
+            )
+            for entry in table:
+                fobj.write(SECTION.pack(*entry))
+
+            for (name, (offset, _)) in zip(SECTIONS, table):
+                fobj.write(bytes(offset - fobj.tell()))
+                fobj.write(sections[name])
+
+        # Snapshots get the usual permissions for new files, instead of the
+        # private ones given to temporary files
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def is_snapshot(path: str) -> bool:
+    """
+    Checks whether a file is a snapshot, rather than a task file.
+    """
+    try:
+        with open(path, "rb") as fobj:
+            return fobj.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class Snapshot:
+    """
+    A snapshot file, which is mapped into memory. The tasks are available as a
+    TaskStore whose fields are read from the snapshot as they're used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fobj:
+            self.data = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self.data)
+        try:
+            (magic, version, little_endian, count, id_count) = HEADER.unpack_from(view)
+            self.sections = {}
+            for (index, name) in enumerate(SECTIONS):
+                (offset, length) = SECTION.unpack_from(
+                    view, HEADER.size + SECTION.size * index
+                )
+                self.sections[name] = view[offset : offset + length]
+        except struct.error:
+            raise ValueError("'{}' is not a valid snapshot".format(path))
+
+        if magic != MAGIC:
+            raise ValueError("'{}' is not a valid snapshot".format(path))
+
+        if version != SNAPSHOT_VERSION or little_endian != (sys.byteorder == "little"):
+            raise ValueError(
+                "'{}' was compiled by a different version of Task Burrito, and "
+                "must be compiled again".format(path)
+            )
+
+        self.count = count
+        self.id_count = id_count
+        self.source = str(self.sections["source"], "utf-8")
+        self.warnings = str(self.sections["warnings"], "utf-8")
+
+        paths = StringTable(self.sections["file_paths"])
+        stamps = self.array("file_stamps", "q")
+        self.files = {
+            paths[index]: (stamps[2 * index], stamps[2 * index + 1])
+            for index in range(len(paths))
+        }
+
+    def array(self, name: str, typecode: str) -> memoryview:
+        """
+        Views a section as an array of the given type.
+        """
+        return self.sections[name].cast(typecode)
+
+    def is_current(self) -> bool:
+        """
+        Checks whether the task files are still the same as when the snapshot
+        was compiled.
+        """
+        return all(file_stamp(path) == stamp for (path, stamp) in self.files.items())
+
+    def digests(self) -> Mapping[str, str]:
+        """
+        Gets the content hash of the snapshot, in the same form as the digests
+        of a ParseCache.
+        """
+        return {os.path.abspath(self.path): hashlib.sha256(self.data).hexdigest()}
+
+    def task_store(self) -> store.TaskStore:
+        """
+        Builds a TaskStore for the tasks in the snapshot. Only the IDs are read
+        up front, and the other fields are read when they're used.
+        """
+        id_offsets = self.array("id_offsets", "q").tolist()
+        id_parts = self.array("id_parts", "q").tolist()
+        ids = [
+            tuple(id_parts[id_offsets[index] : id_offsets[index + 1]])
+            for index in range(self.id_count)
+        ]
+
+        statuses = self.array("statuses", "b")
+        priorities = self.array("priorities", "b")
+        deadlines = self.array("deadlines", "i")
+
+        def read_status(position: int) -> Optional[utils.TaskStatus]:
+            return STATUSES[statuses[position]]
+
+        def read_priority(position: int) -> Any:
+            return decode_optional(priorities[position], int)
+
+        def read_deadline(position: int) -> Any:
+            return decode_optional(deadlines[position], datetime.date.fromordinal)
+
+        note_files = self.array("note_files", "i")
+        note_starts = self.array("note_starts", "q")
+        note_ends = self.array("note_ends", "q")
+        note_digests = self.sections["note_digests"]
+        note_texts = StringTable(self.sections["note_texts"])
+        note_paths = StringTable(self.sections["note_paths"])
+        note_encodings = StringTable(self.sections["note_encodings"])
+        note_stamps = self.array("note_stamps", "q")
+
+        def read_content(position: int) -> Any:
+            source = note_files[position]
+            if source < 0:
+                return note_texts[position]
+
+            return utils.LazyText(
+                note_paths[source],
+                note_starts[position],
+                note_ends[position],
+                note_encodings[source],
+                (note_stamps[2 * source], note_stamps[2 * source + 1]),
+                bytes(
+                    note_digests[DIGEST_SIZE * position : DIGEST_SIZE * (position + 1)]
+                ),
+                ids[position],
+            )
+
+        return store.TaskStore.from_columns(
+            ids=ids,
+            count=self.count,
+            labels=StringTable(self.sections["labels"]),
+            statuses=Column(self.count, read_status),
+            priorities=Column(self.count, read_priority),
+            deadlines=Column(self.count, read_deadline),
+            contents=Column(self.count, read_content),
+            parents=self.array("parents", "q"),
+            child_offsets=self.array("child_offsets", "q"),
+            child_indexes=self.array("children", "q"),
+            dependency_offsets=self.array("dependency_offsets", "q"),
+            dependencies=self.array("dependencies", "q"),
+        )
+
+
+def open_input(input_file: str) -> Tuple[str, Optional[Snapshot]]:
+    """
+    Checks whether an input file is a snapshot that can be used in place of
+    parsing. Returns the task file to parse along with None if it isn't, which
+    is the snapshot's task file if any of the files it was compiled from have
+    changed. Otherwise, returns the input file along with the snapshot.
+    """
+    if input_file == "-" or not is_snapshot(input_file):
+        return (input_file, None)
+
+    snapshot = Snapshot(input_file)
+    if not snapshot.is_current():
+        return (snapshot.source, None)
+
+    return (input_file, snapshot)
+
+
+def compile_snapshot(input_file: str, output_file: str, jobs: int = 4) -> str:
+    """
+    Parses a task file and writes its resolved tasks into a snapshot. Returns
+    the warnings from parsing the task file.
+    """
+    warning_buffer = StringIO()
+    logger = utils.Logger(warning_buffer, sys.stderr)
+    source = os.path.abspath(input_file)
+    base_path = os.path.dirname(source)
+
+    # The parse cache records every task file which was read, along with the
+    # includes in each one
+    parse_cache = cache.MemoryParseCache()
+    with open(source) as in_fobj:
+        tasks = parser.parse_file(in_fobj, base_path, logger, parse_cache, jobs)
+
+    if not tasks:
+        raise ValueError("Task file cannot be empty")
+
+    task_store = store.TaskStore(tasks)
+    del tasks
+
+    files = {}
+    for path in parse_cache.digests:
+        files[path] = file_stamp(path)
+        (_, parsed) = parse_cache.load_entry(path)
+
+        # Includes which don't exist yet are recorded too, since creating one
+        # changes the tasks
+        for (_, include) in parsed.includes:
+            abs_include = os.path.abspath(parser.include_path(include, base_path))
+            files.setdefault(abs_include, file_stamp(abs_include))
+
+    write_snapshot(output_file, source, task_store, files, warning_buffer.getvalue())
+    return warning_buffer.getvalue()
+
+
+def main(args: List[str]):
+    """
+    Parses the compile arguments and writes the snapshot.
+    """
+    if "-h" in args or "--help" in args:
+        print(__doc__)
+        sys.exit(1)
+
+    jobs = 4
+    positional = []
+    try:
+        for arg in args:
+            if arg.startswith("--jobs="):
+                jobs = int(arg[len("--jobs=") :])
+                if jobs < 1:
+                    raise ValueError(
+                        "Invalid value {} for --jobs".format(arg[len("--jobs=") :])
+                    )
+            else:
+                positional.append(arg)
+    except ValueError as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    if len(positional) != 2:
+        print(
+            "Usage: burrito compile INPUT-FILE OUTPUT-FILE [OPTION]...", file=sys.stderr
+        )
+        sys.exit(1)
+
+    (input_file, output_file) = positional
+    try:
+        warnings = compile_snapshot(input_file, output_file, jobs)
+    except (OSError, SyntaxError, ValueError) as err:
+        print(str(err), file=sys.stderr)
+        sys.exit(1)
+
+    print(warnings, end="", file=sys.stderr)
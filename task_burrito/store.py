@@ -0,0 +1,357 @@
+"""
+A compact, read-only store for resolved task trees, for task files which are
+too large to comfortably keep as a dictionary of tasks.
+"""
+from array import array
+import bisect
+from collections.abc import Mapping, Sequence, Set
+from typing import AbstractSet, Any, Iterable, Iterator, List, Optional, Tuple
+
+from task_burrito import utils
+
+
+class TaskStore(Mapping):
+    """
+    Holds a verified task tree with the defaults of each task already resolved
+    from its parents, in the same way as verify_task_tree followed by
+    resolve_task_defaults.
+
+    Each task ID is interned once and given a dense integer index, in task
+    order. The fields of each task are kept in per-field lists, and the links
+    between tasks (parents, children and dependencies) are kept in arrays of
+    indexes. Dependencies on tasks which don't exist are given indexes after
+    the last task, so that they can be stored the same way.
+
+    The store can be used as a Mapping from task IDs to tasks. Tasks are built
+    from the store as they are looked up, so changes to them are not kept.
+    """
+
+    def __init__(self, tasks: Iterable[utils.Task]):
+        tasks = list(tasks)
+        self.index = {}
+        self.ids = []
+        self.labels = []
+        self.statuses = []
+        self.priorities = []
+        self.deadlines = []
+        self.contents = []
+
+        # Like a dictionary built from the task list, the last task with any
+        # given ID is the one that is kept
+        ordered = {task.task_id: task for task in tasks}
+        for task_id in sorted(ordered):
+            task = ordered[task_id]
+            self.index[task_id] = len(self.ids)
+            self.ids.append(task_id)
+            self.labels.append(task.label)
+            self.statuses.append(task.status)
+            self.priorities.append(task.priority)
+            self.deadlines.append(task.deadline)
+            self.contents.append(task.raw_content)
+
+        self.count = len(self.ids)
+        self.verify(tasks)
+
+        self.parents = array("l", [-1] * self.count)
+        child_lists = [[] for _ in range(self.count)]
+        for (position, task_id) in enumerate(self.ids):
+            parent_id = utils.task_id_parent(task_id)
+            if parent_id is not None:
+                parent = self.index[parent_id]
+                self.parents[position] = parent
+                child_lists[parent].append(position)
+
+                # Parents always come before their children, so they have
+                # already been resolved
+                if self.deadlines[position] is None:
+                    self.deadlines[position] = self.deadlines[parent]
+
+                if self.priorities[position] is None:
+                    self.priorities[position] = self.priorities[parent]
+
+        (self.child_offsets, self.child_indexes) = self.pack(child_lists)
+
+        dependency_lists = []
+        for (position, task_id) in enumerate(self.ids[: self.count]):
+            depends = {self.intern(dep) for dep in ordered[task_id].depends}
+            depends.update(child_lists[position])
+            dependency_lists.append(sorted(depends))
+
+        (self.dependency_offsets, self.dependencies) = self.pack(dependency_lists)
+
+    @classmethod
+    def from_columns(
+        cls,
+        ids: List[Tuple[int]],
+        count: int,
+        labels: Sequence[str],
+        statuses: Sequence[Optional[utils.TaskStatus]],
+        priorities: Sequence[Any],
+        deadlines: Sequence[Any],
+        contents: Sequence[Any],
+        parents: Sequence[int],
+        child_offsets: Sequence[int],
+        child_indexes: Sequence[int],
+        dependency_offsets: Sequence[int],
+        dependencies: Sequence[int],
+    ) -> "TaskStore":
+        """
+        Builds a store directly from its fields, which must already be
+        verified and resolved (such as the fields of another store). The
+        fields can be any sequences, and are never modified.
+        """
+        task_store = cls.__new__(cls)
+        task_store.index = {task_id: position for (position, task_id) in enumerate(ids)}
+        task_store.ids = ids
+        task_store.count = count
+        task_store.labels = labels
+        task_store.statuses = statuses
+        task_store.priorities = priorities
+        task_store.deadlines = deadlines
+        task_store.contents = contents
+        task_store.parents = parents
+        task_store.child_offsets = child_offsets
+        task_store.child_indexes = child_indexes
+        task_store.dependency_offsets = dependency_offsets
+        task_store.dependencies = dependencies
+        return task_store
+
+    def verify(self, tasks: List[utils.Task]):
+        """
+        Checks that all parts of the task hierarchy exist, reporting the same
+        error that verify_task_tree would.
+        """
+        # Every ancestor exists as long as every parent does, which is much
+        # cheaper to check. The full check is only needed to find the first
+        # missing ancestor in the order that verify_task_tree reports it.
+        if all(len(task_id) == 1 or task_id[:-1] in self.index for task_id in self.ids):
+            return
+
+        for task in tasks:
+            for ancestor in utils.task_id_ancestors(task.task_id):
+                if ancestor not in self.index:
+                    raise ValueError(
+                        "There is no task {}, which should be an ancestor of "
+                        "task {}".format(
+                            utils.task_id_str(ancestor),
+                            utils.task_id_str(task.task_id),
+                        )
+                    )
+
+    def intern(self, task_id: Tuple[int]) -> int:
+        """
+        Gets the index of a task ID, assigning it a new one if it isn't the ID
+        of any task.
+        """
+        position = self.index.get(task_id)
+        if position is None:
+            position = len(self.ids)
+            self.index[task_id] = position
+            self.ids.append(task_id)
+
+        return position
+
+    @staticmethod
+    def pack(lists: List[List[int]]) -> Tuple[array, array]:
+        """
+        Flattens a list of index lists into an array of offsets and an array
+        of values, where the values of list i are between offsets i and i + 1.
+        """
+        offsets = array("l", [0])
+        values = array("l")
+        for entries in lists:
+            values.extend(entries)
+            offsets.append(len(values))
+
+        return (offsets, values)
+
+    def task(self, position: int) -> utils.Task:
+        """
+        Builds the task with the given index.
+        """
+        task = utils.Task(
+            self.ids[position],
+            self.labels[position],
+            self.statuses[position],
+            self.priorities[position],
+            self.deadlines[position],
+            DependencySet(self, position),
+        )
+        task.raw_content = self.contents[position]
+        return task
+
+    def parent(self, task_id: Tuple[int]) -> Optional[Tuple[int]]:
+        """
+        Gets the ID of a task's parent, or None for top-level tasks.
+        """
+        parent = self.parents[self.position(task_id)]
+        return self.ids[parent] if parent >= 0 else None
+
+    def children(self, task_id: Tuple[int]) -> List[Tuple[int]]:
+        """
+        Gets the IDs of a task's immediate children, in order.
+        """
+        position = self.position(task_id)
+        return [
+            self.ids[child]
+            for child in self.child_indexes[
+                self.child_offsets[position] : self.child_offsets[position + 1]
+            ]
+        ]
+
+    def subtree_range(self, task_id: Tuple[int]) -> range:
+        """
+        Gets the indexes of a task and all of its descendants. Since tasks are
+        kept in order, the descendants come right after the task, and before
+        its next sibling.
+        """
+        start = self.position(task_id)
+        sibling = task_id[:-1] + (task_id[-1] + 1,)
+        return range(start, bisect.bisect_left(self.ids, sibling, start, self.count))
+
+    def subtree(self, task_id: Tuple[int]) -> "TaskSubset":
+        """
+        Gets a view of a task and all of its descendants.
+        """
+        return TaskSubset(self, self.subtree_range(task_id))
+
+    def foldable(self) -> AbstractSet[Tuple[int]]:
+        """
+        Finds the tasks whose children are all marked as DONE, the same as
+        find_foldable_tasks.
+        """
+        foldable = set()
+        for position in range(self.count):
+            start = self.child_offsets[position]
+            end = self.child_offsets[position + 1]
+            if start < end and all(
+                self.statuses[child] == utils.TaskStatus.DONE
+                for child in self.child_indexes[start:end]
+            ):
+                foldable.add(self.ids[position])
+
+        return foldable
+
+    def position(self, task_id: Tuple[int]) -> int:
+        """
+        Gets the index of the task with the given ID, raising a KeyError if
+        there is no such task.
+        """
+        position = self.index.get(task_id, self.count)
+        if position >= self.count:
+            raise KeyError(task_id)
+
+        return position
+
+    def __getitem__(self, task_id: Tuple[int]) -> utils.Task:
+        return self.task(self.position(task_id))
+
+    def __contains__(self, task_id: object) -> bool:
+        return self.index.get(task_id, self.count) < self.count
+
+    def __iter__(self) -> Iterator[Tuple[int]]:
+        return iter(self.ids[: self.count])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def values(self) -> List[utils.Task]:
+        """
+        Builds all of the tasks, in order.
+        """
+        return [self.task(position) for position in range(self.count)]
+
+    def items(self) -> List[Tuple[Tuple[int], utils.Task]]:
+        """
+        Builds all of the tasks along with their IDs, in order.
+        """
+        return [
+            (self.ids[position], self.task(position)) for position in range(self.count)
+        ]
+
+
+class TaskSubset(Mapping):
+    """
+    A read-only view of some of the tasks in a TaskStore, given by their
+    indexes in order. The indexes are usually a range (such as a subtree),
+    which can be checked for a task without keeping a set of them.
+    """
+
+    def __init__(self, store: TaskStore, positions: Sequence[int]):
+        self.store = store
+        self.positions = positions
+        if isinstance(positions, range):
+            self.members = positions
+        else:
+            self.members = set(positions)
+
+    def __getitem__(self, task_id: Tuple[int]) -> utils.Task:
+        if task_id not in self:
+            raise KeyError(task_id)
+
+        return self.store[task_id]
+
+    def __contains__(self, task_id: object) -> bool:
+        return self.store.index.get(task_id, -1) in self.members
+
+    def __iter__(self) -> Iterator[Tuple[int]]:
+        ids = self.store.ids
+        return (ids[position] for position in self.positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def values(self) -> List[utils.Task]:
+        """
+        Builds all of the tasks in the subset, in order.
+        """
+        return [self.store.task(position) for position in self.positions]
+
+    def items(self) -> List[Tuple[Tuple[int], utils.Task]]:
+        """
+        Builds all of the tasks in the subset along with their IDs, in order.
+        """
+        return [
+            (self.store.ids[position], self.store.task(position))
+            for position in self.positions
+        ]
+
+
+class DependencySet(Set):
+    """
+    A read-only view of the dependencies of one task in a TaskStore.
+    """
+
+    __slots__ = ("store", "position")
+
+    def __init__(self, store: TaskStore, position: int):
+        self.store = store
+        self.position = position
+
+    def indexes(self) -> array:
+        """
+        Gets the indexes of the dependencies within the store.
+        """
+        offsets = self.store.dependency_offsets
+        return self.store.dependencies[
+            offsets[self.position] : offsets[self.position + 1]
+        ]
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+    def __contains__(self, task_id: object) -> bool:
+        position = self.store.index.get(task_id)
+        return position is not None and position in self.indexes()
+
+    def __iter__(self) -> Iterator[Tuple[int]]:
+        ids = self.store.ids
+        return (ids[dep] for dep in self.indexes())
+
+    def __len__(self) -> int:
+        offsets = self.store.dependency_offsets
+        return offsets[self.position + 1] - offsets[self.position]
+
+    def __repr__(self):
+        return repr(set(self))
@@ -0,0 +1,181 @@
+"""
+Sorting and resolving tasks as a stream, for task files which are too large to
+hold in memory all at once.
+"""
+import heapq
+import itertools
+import pickle
+import tempfile
+from typing import IO, Any, Iterable, Iterator, List, Optional, Tuple
+
+from task_burrito import utils
+
+# A rough guess at how much memory a task takes beyond its label and notes,
+# which is used to decide when a sorted run has to be written out
+TASK_OVERHEAD = 512
+
+# The default memory budget for sorting tasks, in bytes
+DEFAULT_SORT_BUDGET = 64 * 1024 * 1024
+
+# The kinds of records that are sorted. Links from a parent to each child sort
+# before the parent itself, so that the parent's children are known by the
+# time it's resolved.
+CHILD_RECORD = 0
+TASK_RECORD = 1
+
+
+def task_records(tasks: Iterable[utils.Task]) -> Iterator[Tuple[Any, ...]]:
+    """
+    Converts each task into the records which are sorted: one for the task,
+    and one that links it to its parent.
+    """
+    for task in tasks:
+        parent = utils.task_id_parent(task.task_id)
+        if parent is not None:
+            yield (parent, CHILD_RECORD, task.task_id)
+
+        yield (task.task_id, TASK_RECORD, task)
+
+
+def record_size(record: Tuple[Any, ...]) -> int:
+    """
+    Estimates how much memory a record takes.
+    """
+    if record[1] == TASK_RECORD:
+        task = record[2]
+        size = TASK_OVERHEAD + len(task.label)
+        if isinstance(task.raw_content, str):
+            # Notes which are still in the task file take up next to nothing
+            size += len(task.raw_content)
+
+        return size
+
+    return TASK_OVERHEAD // 4
+
+
+def record_key(record: Tuple[Any, ...]) -> Tuple[Tuple[int], int]:
+    """
+    Gets the value that records are ordered by.
+    """
+    return (record[0], record[1])
+
+
+def write_run(records: List[Tuple[Any, ...]], temp_dir: Optional[str]) -> IO:
+    """
+    Sorts a run of records and writes it to a temporary file, which is
+    returned rewound to the start.
+    """
+    records.sort(key=record_key)
+    run = tempfile.TemporaryFile(dir=temp_dir)
+    for record in records:
+        pickle.dump(record, run, pickle.HIGHEST_PROTOCOL)
+
+    run.seek(0)
+    return run
+
+
+def read_run(run: IO) -> Iterator[Tuple[Any, ...]]:
+    """
+    Reads back the records from a run written by write_run.
+    """
+    while True:
+        try:
+            yield pickle.load(run)
+        except EOFError:
+            return
+
+
+def sort_records(
+    records: Iterable[Tuple[Any, ...]],
+    budget: int = DEFAULT_SORT_BUDGET,
+    temp_dir: Optional[str] = None,
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    Sorts records with an external merge sort. Records are collected until
+    they exceed the memory budget, at which point they are sorted and written
+    out to a temporary file. The runs are then merged back together. Records
+    with the same key keep the order they were given in.
+    """
+    runs = []
+    current = []
+    size = 0
+    try:
+        for record in records:
+            current.append(record)
+            size += record_size(record)
+            if size >= budget:
+                runs.append(write_run(current, temp_dir))
+                current = []
+                size = 0
+
+        current.sort(key=record_key)
+        yield from heapq.merge(
+            *(read_run(run) for run in runs), current, key=record_key
+        )
+    finally:
+        for run in runs:
+            run.close()
+
+
+def resolve_sorted_records(records: Iterable[Tuple[Any, ...]]) -> Iterator[utils.Task]:
+    """
+    Resolves the defaults of each task from sorted records, in the same way as
+    verify_task_tree and resolve_task_defaults. Only the ancestors of the
+    current task are kept, since every task comes after its parent.
+
+    Like a task map, only the last of the tasks with the same ID is kept.
+    Missing ancestors are reported when the first task without its parent is
+    reached, so the tasks before it will already have been yielded.
+    """
+    ancestors = []
+    for (task_id, group) in itertools.groupby(records, key=lambda record: record[0]):
+        children = set()
+        task = None
+        for (_, kind, value) in group:
+            if kind == CHILD_RECORD:
+                children.add(value)
+            else:
+                task = value
+
+        if task is None:
+            # The children of a missing task are reported when they're reached
+            continue
+
+        while (
+            ancestors and ancestors[-1].task_id != task_id[: len(ancestors[-1].task_id)]
+        ):
+            ancestors.pop()
+
+        parent_id = utils.task_id_parent(task_id)
+        if parent_id is not None:
+            if not ancestors or ancestors[-1].task_id != parent_id:
+                raise ValueError(
+                    "There is no task {}, which should be an ancestor of "
+                    "task {}".format(
+                        utils.task_id_str(parent_id), utils.task_id_str(task_id)
+                    )
+                )
+
+            parent = ancestors[-1]
+            if task.deadline is None:
+                task.deadline = parent.deadline
+
+            if task.priority is None:
+                task.priority = parent.priority
+
+        task.depends |= children
+        ancestors.append(task)
+        yield task
+
+
+def sort_tasks(
+    tasks: Iterable[utils.Task],
+    budget: int = DEFAULT_SORT_BUDGET,
+    temp_dir: Optional[str] = None,
+) -> Iterator[utils.Task]:
+    """
+    Orders tasks by their IDs and resolves their defaults, using no more than
+    roughly the given number of bytes of memory for tasks (apart from the
+    notes of the largest task).
+    """
+    return resolve_sorted_records(sort_records(task_records(tasks), budget, temp_dir))
@@ -0,0 +1,192 @@
+"""
+An incrementally updated task tree, for long-running processes which see the
+same tasks over and over with only a few changes between them.
+"""
+from collections import Counter, defaultdict
+import copy
+from typing import Iterable, List, Set, Tuple
+
+from task_burrito import utils
+
+
+class TaskGraph:
+    """
+    Holds the resolved form of a task tree, along with the child map and the
+    set of foldable tasks, which are kept up to date as tasks change.
+
+    Each update is compared against the tasks from the last update. Only the
+    tasks which changed (along with their descendants, which inherit from
+    them, and their parents, whose dependencies include them) are resolved
+    again, and only the changed parts of the tree are validated. The results
+    are the same as running verify_task_tree, resolve_task_defaults and
+    find_foldable_tasks over the whole tree.
+    """
+
+    def __init__(self):
+        # The tasks as they were parsed. These are needed to tell which tasks
+        # have changed, so only the references to their notes are replaced.
+        self.raw = {}
+        self.task_map = {}
+        self.child_map = defaultdict(set)
+        self.foldable = set()
+        self.all_children = Counter()
+        self.completed_children = Counter()
+
+    def update(self, tasks: Iterable[utils.Task]) -> Set[Tuple[int]]:
+        """
+        Replaces the tasks in the graph with the given tasks, which are not
+        modified. Returns the IDs of the tasks whose resolved form changed.
+
+        Raises a ValueError if the new tasks do not form a complete tree, in
+        which case the graph is emptied so that the next update starts over.
+        """
+        try:
+            return self.apply(tasks)
+        except ValueError:
+            self.__init__()
+            raise
+
+    def apply(self, tasks: Iterable[utils.Task]) -> Set[Tuple[int]]:
+        """
+        Performs an update, without cleaning up if it fails.
+        """
+        new_raw = {task.task_id: task for task in tasks}
+        removed = [task_id for task_id in self.raw if task_id not in new_raw]
+        added = [task_id for task_id in new_raw if task_id not in self.raw]
+        changed = [
+            task_id
+            for (task_id, task) in new_raw.items()
+            if task_id in self.raw and self.raw[task_id] != task
+        ]
+
+        for task_id in added:
+            for ancestor in utils.task_id_ancestors(task_id):
+                if ancestor not in new_raw:
+                    raise ValueError(
+                        "There is no task {}, which should be an ancestor of "
+                        "task {}".format(
+                            utils.task_id_str(ancestor), utils.task_id_str(task_id)
+                        )
+                    )
+
+        for task_id in removed:
+            orphans = [
+                child for child in self.child_map.get(task_id, ()) if child in new_raw
+            ]
+            if orphans:
+                raise ValueError(
+                    "There is no task {}, which should be an ancestor of "
+                    "task {}".format(
+                        utils.task_id_str(task_id), utils.task_id_str(orphans[0])
+                    )
+                )
+
+        # Parents need to be resolved again when their children come or go,
+        # since children are added to their dependencies. Children are removed
+        # before their parents, so that nothing is left behind for a parent
+        # once it's gone.
+        dirty_parents = set()
+        for task_id in sorted(removed, reverse=True):
+            old_task = self.raw.pop(task_id)
+            del self.task_map[task_id]
+            self.child_map.pop(task_id, None)
+            self.foldable.discard(task_id)
+            self.all_children.pop(task_id, None)
+            self.completed_children.pop(task_id, None)
+
+            parent = utils.task_id_parent(task_id)
+            if parent is not None:
+                self.child_map[parent].discard(task_id)
+                self.count_child(parent, old_task, -1)
+                dirty_parents.add(parent)
+
+        for task_id in changed:
+            parent = utils.task_id_parent(task_id)
+            if parent is not None:
+                self.count_child(parent, self.raw[task_id], -1)
+                self.count_child(parent, new_raw[task_id], 1)
+                dirty_parents.add(parent)
+
+            self.raw[task_id] = new_raw[task_id]
+
+        # Unchanged notes may still have moved within their task file, so the
+        # tasks which are kept take the new references to their notes
+        for (task_id, task) in new_raw.items():
+            kept = self.raw.get(task_id)
+            if kept is not None and kept is not task:
+                kept.raw_content = task.raw_content
+                self.task_map[task_id].raw_content = task.raw_content
+
+        for task_id in added:
+            self.raw[task_id] = new_raw[task_id]
+            parent = utils.task_id_parent(task_id)
+            if parent is not None:
+                self.child_map[parent].add(task_id)
+                self.count_child(parent, new_raw[task_id], 1)
+                dirty_parents.add(parent)
+
+        # Changes to a task's deadline or priority are inherited by all of its
+        # descendants, so the whole subtree has to be resolved again
+        dirty = set()
+        pending = added + changed
+        while pending:
+            task_id = pending.pop()
+            if task_id not in dirty:
+                dirty.add(task_id)
+                pending.extend(self.child_map.get(task_id, ()))
+
+        dirty |= {parent for parent in dirty_parents if parent in self.raw}
+        for task_id in sorted(dirty):
+            self.resolve(task_id)
+
+        for parent in dirty_parents:
+            self.update_foldable(parent)
+
+        return dirty | set(removed)
+
+    def count_child(self, parent: Tuple[int], child: utils.Task, delta: int):
+        """
+        Adds (or removes, if delta is negative) a child from the counts that
+        determine whether its parent is foldable.
+        """
+        self.all_children[parent] += delta
+        if child.status == utils.TaskStatus.DONE:
+            self.completed_children[parent] += delta
+
+    def update_foldable(self, task_id: Tuple[int]):
+        """
+        Checks whether a task is foldable after its children have changed.
+        """
+        total = self.all_children[task_id]
+        if (
+            task_id in self.raw
+            and total > 0
+            and total == self.completed_children[task_id]
+        ):
+            self.foldable.add(task_id)
+        else:
+            self.foldable.discard(task_id)
+
+    def resolve(self, task_id: Tuple[int]):
+        """
+        Builds the resolved form of a task, from its parsed form and its
+        parent's resolved form. The parent must already be resolved.
+        """
+        task = copy.copy(self.raw[task_id])
+        parent_id = utils.task_id_parent(task_id)
+        if parent_id is not None:
+            parent = self.task_map[parent_id]
+            if task.deadline is None:
+                task.deadline = parent.deadline
+
+            if task.priority is None:
+                task.priority = parent.priority
+
+        task.depends = task.depends | self.child_map.get(task_id, set())
+        self.task_map[task_id] = task
+
+    def tasks(self) -> List[utils.Task]:
+        """
+        Gets all the resolved tasks, ordered by their IDs.
+        """
+        return utils.sort_tasks(self.task_map.values())
@@ -1,11 +1,14 @@
 """
 Various utilities used by the rest of the package.
 """
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
 import datetime
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, List, Mapping, Optional, Set, Tuple
+import functools
+import os
+import threading
+from typing import AbstractSet, Any, List, Mapping, Optional, Set, Tuple, Union
 
 
 class FilePosition:
@@ -68,15 +71,172 @@ class TaskStatus(Enum):
         return self.name
 
 
+class _NotProvided:
+    """
+    The type of NOT_PROVIDED, which keeps it a singleton even when tasks are
+    pickled and loaded again.
+    """
+
+    def __reduce__(self):
+        return "NOT_PROVIDED"
+
+    def __repr__(self):
+        return "NOT_PROVIDED"
+
+
 # Used to indicate that a property explicitly should not be inherited from the
 # parent
-NOT_PROVIDED = object()
+NOT_PROVIDED = _NotProvided()
+
+
+class NoteFiles:
+    """
+    Keeps the most recently used task files open, so that notes can be read
+    from them on demand. The operating system's page cache decides which parts
+    of the files actually stay in memory.
+
+    Notes are read with pread rather than through a memory map, since reading
+    a mapped file that has been truncated kills the process with SIGBUS. If a
+    task file has changed since its notes were parsed, the notes are found
+    again in the file's current contents, so that pages rendered while a task
+    file is being edited show each task's current notes.
+    """
+
+    def __init__(self, max_files: int = 16):
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        self.files = OrderedDict()
 
+    def read(self, text: "LazyText") -> bytes:
+        """
+        Reads the text that a LazyText refers to. Notes whose task is no longer
+        in its file (or whose file no longer exists) are empty.
+        """
+        with self.lock:
+            entry = self.open_file(text.path)
+            if entry is None:
+                return b""
+
+            (stamp, fobj, located) = entry
+            (start, end) = (text.start, text.end)
+            if stamp != text.stamp:
+                if located is None:
+                    located = self.locate_notes(fobj, stamp[1], text.encoding)
+                    self.files[text.path] = (stamp, fobj, located)
 
-@dataclass
+                (start, end) = located.get(text.task_id, (0, 0))
+
+            return os.pread(fobj.fileno(), end - start, start)
+
+    def open_file(self, path: str) -> Optional[Tuple[Tuple[int, int], Any, Any]]:
+        """
+        Gets the open file for a path, along with its modification time and
+        size and the notes found within it (if it had to be searched). The file
+        is opened again if the path no longer refers to the same file.
+        """
+        entry = self.files.get(path)
+        try:
+            stat = os.stat(path)
+            if entry is None or entry[0] != (stat.st_mtime_ns, stat.st_size):
+                self.close_file(path)
+                fobj = open(path, "rb")
+                stat = os.fstat(fobj.fileno())
+                entry = ((stat.st_mtime_ns, stat.st_size), fobj, None)
+                self.files[path] = entry
+                while len(self.files) > self.max_files:
+                    self.close_file(next(iter(self.files)))
+        except OSError:
+            self.close_file(path)
+            return None
+
+        self.files.move_to_end(path)
+        return entry
+
+    def close_file(self, path: str):
+        """
+        Closes a file, if it is open.
+        """
+        entry = self.files.pop(path, None)
+        if entry is not None:
+            entry[1].close()
+
+    @staticmethod
+    def locate_notes(
+        fobj: Any, size: int, encoding: str
+    ) -> Mapping[Tuple[int], Tuple[int, int]]:
+        """
+        Finds where the notes of each task are within a task file.
+        """
+        # The parser depends on this module, so it can't be imported up front
+        from task_burrito import parser
+
+        return parser.locate_notes(os.pread(fobj.fileno(), size, 0), encoding)
+
+
+# The task files which notes are read from
+NOTE_FILES = NoteFiles()
+
+
+class LazyText:
+    """
+    A reference to text within a task file, which is read from the file each
+    time it's needed instead of being kept in memory. The reference includes
+    the file's modification time and size when it was parsed and the ID of the
+    task the text belongs to, so that the text can be found again if the file
+    has changed since, and a digest of the text, so that references can be
+    compared without reading them.
+    """
+
+    __slots__ = ("path", "start", "end", "encoding", "stamp", "digest", "task_id")
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        end: int,
+        encoding: str,
+        stamp: Tuple[int, int],
+        digest: bytes,
+        task_id: Tuple[int],
+    ):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.encoding = encoding
+        self.stamp = stamp
+        self.digest = digest
+        self.task_id = task_id
+
+    def __str__(self):
+        return NOTE_FILES.read(self).decode(self.encoding)
+
+    def __eq__(self, other: Any):
+        if isinstance(other, LazyText):
+            return (self.end - self.start, self.encoding, self.digest) == (
+                other.end - other.start,
+                other.encoding,
+                other.digest,
+            )
+
+        if isinstance(other, str):
+            return str(self) == other
+
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "LazyText({!r}, {}, {})".format(self.path, self.start, self.end)
+
+
+@dataclass(slots=True)
 class Task:
     """
     The metadata and notes stored about a task.
+
+    Task files can hold a very large number of tasks, so tasks use slots
+    instead of a per-instance __dict__. The notes are kept in raw_content,
+    which may be a LazyText that is only read when the content is used.
     """
 
     task_id: Tuple[int]
@@ -84,8 +244,20 @@ class Task:
     status: TaskStatus
     priority: Optional[int]
     deadline: Optional[datetime.date]
-    depends: Set[Tuple[int]]
-    content: str = field(default="", init=False)
+    depends: AbstractSet[Tuple[int]]
+    raw_content: Union[str, LazyText] = field(default="", init=False)
+
+    @property
+    def content(self) -> str:
+        """
+        Gets the notes of the task, reading them from the task file if they
+        are not kept in memory.
+        """
+        return str(self.raw_content)
+
+    @content.setter
+    def content(self, content: Union[str, LazyText]):
+        self.raw_content = content
 
 
 def task_id_parent(task_id: Tuple[int]) -> Tuple[int]:
@@ -111,9 +283,12 @@ def task_id_ancestors(task_id: Tuple[int]) -> List[Tuple[int]]:
     return parents
 
 
+@functools.lru_cache(maxsize=1 << 17)
 def task_id_str(task_id: Tuple[int]) -> str:
     """
-    Converts a task identifier into a key for the task map.
+    Converts a task identifier into a key for the task map. The exporters
+    print the same IDs many times (in links, dependencies and anchors), so
+    the string form of each ID is only built once.
     """
     return ".".join(str(part) for part in task_id)
 
@@ -128,9 +303,8 @@ def verify_task_tree(tasks: List[Task]) -> Mapping[Tuple[int], Task]:
         for ancestor in task_id_ancestors(task.task_id):
             if ancestor not in task_map:
                 raise ValueError(
-                    "There is no task {}, which should be an ancestor of task {}".format(
-                        ancestor, task_id_str(ancestor)
-                    )
+                    "There is no task {}, which should be an ancestor of "
+                    "task {}".format(task_id_str(ancestor), task_id_str(task.task_id))
                 )
 
     return task_map
@@ -198,10 +372,13 @@ def sort_tasks(tasks: List[Task], reverse: bool = False) -> List[Task]:
     return sorted(tasks, key=lambda entry: entry.task_id, reverse=reverse)
 
 
+@functools.lru_cache(maxsize=1 << 17)
 def parse_task_id(task_id: str) -> Tuple[int]:
     """
     Checks that a task ID is valid and returns its parsed form, throwing a
-    ValueError if it is invalid.
+    ValueError if it is invalid. Task files refer to the same IDs many times
+    (in task properties and in every depends list), so each ID is only parsed
+    once.
     """
     task_id_parts = task_id.split(".")
     if not task_id_parts:
@@ -0,0 +1,163 @@
+"""
+Buffered output for the exporters, which produce their output in many small
+fragments.
+"""
+from contextlib import contextmanager
+from typing import Any, IO, Iterator, List, Optional
+import zlib
+
+# How many characters are collected before they are written to the output
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# The zlib window bits which produce each of the HTTP content encodings
+COMPRESSION_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+class ChunkWriter:
+    """
+    Collects fragments of output and writes them to the underlying stream in
+    large chunks, instead of writing each fragment as soon as it is produced.
+
+    The output can be a text stream, or a binary stream (such as a socket) if
+    an encoding is given.
+    """
+
+    def __init__(
+        self,
+        output: IO,
+        chunk_size: Optional[int] = None,
+        encoding: Optional[str] = None,
+    ):
+        self.output = output
+        self.chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        self.encoding = encoding
+        self.fragments = []
+        self.size = 0
+
+    def write(self, text: str):
+        """
+        Adds a fragment of text to the output.
+        """
+        self.fragments.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def line(self, *values: Any):
+        """
+        Adds a line containing each of the values separated by spaces, the same
+        as print would.
+        """
+        self.write(" ".join(map(str, values)) + "\n")
+
+    def flush(self):
+        """
+        Writes all of the collected fragments out to the underlying stream.
+        """
+        if not self.fragments:
+            return
+
+        chunk = "".join(self.fragments)
+        self.fragments.clear()
+        self.size = 0
+
+        if self.encoding is not None:
+            self.output.write(chunk.encode(self.encoding))
+        else:
+            self.output.write(chunk)
+
+
+class ChunkList(list):
+    """
+    An output stream which keeps each chunk written to it, so that the output
+    can be written out again later (possibly more than once).
+    """
+
+    def write(self, chunk: str):
+        """
+        Adds a chunk to the end of the list.
+        """
+        self.append(chunk)
+
+
+class CompressedStream:
+    """
+    A text output stream which compresses its output with gzip or deflate,
+    writing the compressed data to a binary stream as it goes instead of
+    compressing all of the output at the end.
+
+    zlib holds on to compressed data until it has collected a large block of
+    it. If sync is set, every write is flushed through to the binary stream
+    instead, at a small cost in compression, so that a reader (such as a
+    browser) can decompress everything written so far. Writes normally come
+    from a ChunkWriter, so this happens once per chunk.
+    """
+
+    def __init__(
+        self,
+        output: IO,
+        method: str = "gzip",
+        encoding: str = "utf-8",
+        sync: bool = False,
+    ):
+        self.output = output
+        self.encoding = encoding
+        self.sync = sync
+        self.compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, COMPRESSION_WBITS[method]
+        )
+
+    def write(self, text: str):
+        """
+        Compresses some text, writing out whatever compressed data is ready.
+        """
+        data = self.compressor.compress(text.encode(self.encoding))
+        if self.sync:
+            data += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        if data:
+            self.output.write(data)
+
+        if self.sync:
+            self.output.flush()
+
+    def close(self):
+        """
+        Writes out the rest of the compressed data. The binary stream is left
+        open.
+        """
+        self.output.write(self.compressor.flush())
+
+
+class TeeStream:
+    """
+    An output stream which writes everything to several other streams.
+    """
+
+    def __init__(self, outputs: List[Any]):
+        self.outputs = outputs
+
+    def write(self, text: str):
+        """
+        Writes some text to each of the streams.
+        """
+        for output in self.outputs:
+            output.write(text)
+
+
+@contextmanager
+def chunked(output: IO) -> Iterator[ChunkWriter]:
+    """
+    Wraps an output stream in a ChunkWriter for the duration of the block,
+    flushing it at the end. Exporters which are called by other exporters
+    share the ChunkWriter they were given instead of creating another one.
+    """
+    if isinstance(output, ChunkWriter):
+        yield output
+        return
+
+    writer = ChunkWriter(output)
+    try:
+        yield writer
+    finally:
+        writer.flush()
@@ -0,0 +1,82 @@
+"""
+Checks that notes read lazily from task files survive the files changing.
+"""
+import os
+
+from task_burrito import parser, utils
+
+TASK_FILE = """***
+task 1
+label First
+status TODO
+***
+Notes for the first task
+***
+task 2
+label Second
+status TODO
+***
+Notes for the second task
+"""
+
+
+def parse(path):
+    """
+    Parses a task file, keeping its notes as references into the file.
+    """
+    logger = utils.Logger(None, None)
+    with open(path) as fobj:
+        tasks = parser.parse_file(fobj, os.path.dirname(path), logger)
+
+    assert all(isinstance(task.raw_content, utils.LazyText) for task in tasks)
+    return {task.task_id: task for task in tasks}
+
+
+def test_notes_are_found_after_the_file_changes(tmp_path):
+    path = str(tmp_path / "tasks.md")
+    with open(path, "w") as fobj:
+        fobj.write(TASK_FILE)
+
+    tasks = parse(path)
+    assert tasks[(1,)].content == "Notes for the first task\n"
+
+    # The first task moves after the second one, and gets longer notes
+    (first, second) = TASK_FILE.split("***\ntask 2")
+    with open(path, "w") as fobj:
+        fobj.write("***\ntask 2" + second + first.replace("first", "first, edited"))
+
+    assert tasks[(1,)].content == "Notes for the first, edited task\n"
+    assert tasks[(2,)].content == "Notes for the second task\n"
+
+
+def test_notes_are_empty_once_the_file_is_truncated_or_removed(tmp_path):
+    path = str(tmp_path / "tasks.md")
+    with open(path, "w") as fobj:
+        fobj.write(TASK_FILE)
+
+    tasks = parse(path)
+    with open(path, "w") as fobj:
+        fobj.write("")
+
+    assert tasks[(2,)].content == ""
+
+    os.unlink(path)
+    assert tasks[(1,)].content == ""
+
+
+def test_notes_from_a_stream_without_a_file_name_are_kept(tmp_path):
+    path = str(tmp_path / "tasks.md")
+    with open(path, "w") as fobj:
+        fobj.write(TASK_FILE)
+
+    # This is how stdin looks when it's redirected from a file: it can be
+    # mapped, but not opened again by its name
+    with open(os.open(path, os.O_RDONLY)) as fobj:
+        fobj.buffer.raw.name = "<stdin>"
+        tasks = parser.parse_file(fobj, str(tmp_path), utils.Logger(None, None))
+
+    os.unlink(path)
+    assert [task.raw_content for task in tasks] == [
+        "Notes for the first task\n",
+        "Notes for the second task\n",
+    ]
@@ -0,0 +1,47 @@
+"""
+Checks that the TaskStore reports problems with a task tree the same way as
+the other loaders.
+"""
+import pytest
+
+from task_burrito import store, taskgraph, utils
+
+
+def make_task(task_id, status=utils.TaskStatus.TODO):
+    """
+    Builds a task without any properties besides its status.
+    """
+    return utils.Task(task_id, "Task", status, None, None, set())
+
+
+def test_missing_ancestor_is_reported_the_same_way():
+    tasks = [make_task((1,)), make_task((1, 2, 3))]
+    message = "There is no task 1.2, which should be an ancestor of task 1.2.3"
+
+    with pytest.raises(ValueError, match=message):
+        utils.verify_task_tree(tasks)
+
+    with pytest.raises(ValueError, match=message):
+        store.TaskStore(tasks)
+
+    with pytest.raises(ValueError, match=message):
+        taskgraph.TaskGraph().update(tasks)
+
+
+def test_tree_navigation():
+    tasks = [
+        make_task((1,)),
+        make_task((1, 1), utils.TaskStatus.DONE),
+        make_task((1, 2), utils.TaskStatus.DONE),
+        make_task((1, 2, 1)),
+        make_task((2,)),
+    ]
+    task_store = store.TaskStore(tasks)
+
+    assert task_store.children((1,)) == [(1, 1), (1, 2)]
+    assert task_store.children((1, 1)) == []
+    assert task_store.parent((1, 2, 1)) == (1, 2)
+    assert task_store.parent((2,)) is None
+    assert list(task_store.subtree((1, 2))) == [(1, 2), (1, 2, 1)]
+    assert list(task_store.subtree((1,))) == [(1,), (1, 1), (1, 2), (1, 2, 1)]
+    assert task_store.foldable() == {(1,)}
@@ -0,0 +1,159 @@
+"""
+Checks that the incrementally updated task graph always matches the task tree
+built from scratch.
+"""
+import copy
+import dataclasses
+import datetime
+import random
+
+import pytest
+
+from task_burrito import taskgraph, utils
+
+STATUSES = list(utils.TaskStatus)
+
+
+def random_task(rng, task_id, tasks):
+    """
+    Builds a task with random properties, which may depend on the given tasks.
+    """
+    priority = rng.randint(1, 5) if rng.random() < 0.3 else None
+    deadline = None
+    if rng.random() < 0.3:
+        deadline = datetime.date(2020, 1, 1) + datetime.timedelta(
+            days=rng.randint(0, 365)
+        )
+
+    depends = set()
+    if tasks and rng.random() < 0.2:
+        depends = set(rng.sample(sorted(tasks), min(len(tasks), rng.randint(1, 3))))
+
+    task = utils.Task(
+        task_id,
+        "Task {}".format(utils.task_id_str(task_id)),
+        rng.choice(STATUSES),
+        priority,
+        deadline,
+        depends,
+    )
+    task.content = "Notes for {}".format(utils.task_id_str(task_id))
+    return task
+
+
+def random_tree(rng, count):
+    """
+    Builds a random task tree with the given number of tasks.
+    """
+    tasks = {}
+    while len(tasks) < count:
+        add_task(rng, tasks)
+
+    return tasks
+
+
+def add_task(rng, tasks):
+    """
+    Adds a new task, either at the top level or beneath an existing task.
+    """
+    if tasks and rng.random() < 0.9:
+        parent = rng.choice(sorted(tasks))
+    else:
+        parent = ()
+
+    index = 1
+    while parent + (index,) in tasks:
+        index += 1
+
+    task_id = parent + (index,)
+    tasks[task_id] = random_task(rng, task_id, tasks)
+
+
+def edit_tasks(rng, tasks):
+    """
+    Makes a random change to the task tree.
+    """
+    task_id = rng.choice(sorted(tasks))
+    old_task = tasks[task_id]
+    kind = rng.choice(["status", "deadline", "priority", "add", "remove"])
+    if kind == "add":
+        add_task(rng, tasks)
+    elif kind == "remove":
+        # Removes either a leaf or the whole subtree below a task, but never
+        # the last remaining task
+        subtree = [other for other in tasks if other[: len(task_id)] == task_id]
+        if len(subtree) < len(tasks):
+            for other in subtree:
+                del tasks[other]
+    else:
+        new_task = copy.copy(old_task)
+        if kind == "status":
+            new_task.status = rng.choice(STATUSES)
+        elif kind == "deadline":
+            new_task.deadline = rng.choice(
+                [
+                    None,
+                    datetime.date(2020, 1, 1)
+                    + datetime.timedelta(days=rng.randint(0, 365)),
+                ]
+            )
+        else:
+            new_task.priority = rng.choice([None, rng.randint(1, 5)])
+
+        tasks[task_id] = new_task
+
+
+def fresh_copies(tasks):
+    """
+    Copies the tasks, as the parser would return them. Resolving tasks adds
+    to their dependencies in place, so the copies can't share them.
+    """
+    copies = []
+    for task in tasks.values():
+        task_copy = dataclasses.replace(task, depends=set(task.depends))
+        task_copy.raw_content = task.raw_content
+        copies.append(task_copy)
+
+    return copies
+
+
+def full_recompute(tasks):
+    """
+    Builds the resolved task map and foldable set from scratch.
+    """
+    task_map = utils.verify_task_tree(fresh_copies(tasks))
+    utils.resolve_task_defaults(task_map)
+    foldable = utils.find_foldable_tasks(list(task_map.values()))
+    return (task_map, foldable)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_matches_full_recompute(seed):
+    rng = random.Random(seed)
+    tasks = random_tree(rng, 200)
+    graph = taskgraph.TaskGraph()
+    graph.update(fresh_copies(tasks))
+
+    for _ in range(200):
+        edit_tasks(rng, tasks)
+        graph.update(fresh_copies(tasks))
+
+        (task_map, foldable) = full_recompute(tasks)
+        assert graph.task_map == task_map
+        assert graph.foldable == foldable
+
+
+def test_update_rejects_missing_ancestor():
+    rng = random.Random(0)
+    tasks = random_tree(rng, 20)
+    graph = taskgraph.TaskGraph()
+    graph.update(fresh_copies(tasks))
+
+    tasks[(1, 99, 1)] = random_task(rng, (1, 99, 1), {})
+    with pytest.raises(ValueError, match="no task 1.99,"):
+        graph.update(fresh_copies(tasks))
+
+    # The graph starts over after a failed update
+    del tasks[(1, 99, 1)]
+    graph.update(fresh_copies(tasks))
+    assert graph.task_map == full_recompute(tasks)[0]